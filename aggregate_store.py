@@ -0,0 +1,419 @@
+"""プロセス間で共有する集計ファイル（メモリマップ）
+
+指標ごとのヒストグラム（4×21）、Future/Pastマトリクスの格子（21×21）、職位別件数、
+日別ヒストグラムのリングバッファ、職位別の平均・偏差積和、4指標の同時分布（21^4）、
+版数カウンタを固定レイアウトのファイルに置く。更新は1つのリフレッシュプロセスだけが行い、
+アプリの各プロセスは mmap した領域を直接読む（シーケンスロックで一貫性を確認）。
+
+    python aggregate_store.py --file /var/tmp/tpt_aggregates.bin --interval 60
+    python aggregate_store.py --file /var/tmp/tpt_aggregates.bin --once
+
+アプリ側は st.secrets["app"]["aggregate_file"]（または APP_AGGREGATE_FILE）で同じパスを指定する。
+テナント（tenants.py）ごとの集計は --tenant <id> で、そのテナントの保存先と aggregate_file を使う。
+"""
+import argparse
+import math
+import mmap
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from online_stats import GradeMoments
+from rolling_window import RING_DAYS, DailyHistogramRing, day_numbers
+from survey import MATRICES, METRICS, N_GRADES, SCORE_BINS, SCORE_MIN, grade_index
+
+MAGIC = 0x3130474741545054  # b"TPTAGG01"
+LAYOUT_VERSION = 4
+
+# ヘッダ（uint64×8）: magic, layout, seq, total, updated_at(ns), reserved...
+_H_MAGIC, _H_LAYOUT, _H_SEQ, _H_TOTAL, _H_UPDATED = range(5)
+HEADER_WORDS = 8
+
+# 4指標のスコアの組み合わせ（21^4 通り）ごとの件数
+JOINT_SHAPE = (SCORE_BINS,) * len(METRICS)
+
+# 各セクションの要素はすべて8バイト（int64 / float64）
+_SECTIONS = [
+    ("hist", (len(METRICS), SCORE_BINS), np.int64),
+    ("future", (SCORE_BINS, SCORE_BINS), np.int64),
+    ("past", (SCORE_BINS, SCORE_BINS), np.int64),
+    ("grades", (N_GRADES,), np.int64),
+    ("daily", (RING_DAYS, len(METRICS), SCORE_BINS), np.int64),
+    ("daily_days", (RING_DAYS,), np.int64),
+    ("moments_n", (N_GRADES,), np.int64),
+    ("moments_mean", (N_GRADES, len(METRICS)), np.float64),
+    ("moments_comoment", (N_GRADES, len(METRICS), len(METRICS)), np.float64),
+    ("joint", JOINT_SHAPE, np.int64),
+]
+
+
+def _layout():
+    offset = HEADER_WORDS * 8
+    layout = {}
+    for name, shape, dtype in _SECTIONS:
+        layout[name] = (offset, shape, dtype)
+        offset += int(np.prod(shape)) * 8
+    return layout, offset
+
+
+LAYOUT, FILE_SIZE = _layout()
+
+
+def score_indices(values):
+    """スコア列を 0〜20 の添字に変換（範囲外・欠損・非整数は -1）"""
+    values = np.asarray(values, dtype=float)
+    idx = np.full(values.shape, -1, dtype=np.int64)
+    valid = np.isfinite(values) & (values == np.round(values))
+    idx[valid] = values[valid].astype(np.int64) - SCORE_MIN
+    idx[(idx < 0) | (idx >= SCORE_BINS)] = -1
+    return idx
+
+
+class Aggregates:
+    """回答データの集計値（ヒストグラム・マトリクス格子・職位別件数・日別ヒストグラム・職位別統計量・同時分布）"""
+
+    def __init__(self, hist=None, future=None, past=None, grades=None, total=0, version=0, updated_at=0.0,
+                 daily=None, moments=None, joint=None):
+        self.hist = np.zeros((len(METRICS), SCORE_BINS), dtype=np.int64) if hist is None else hist
+        self.future = np.zeros((SCORE_BINS, SCORE_BINS), dtype=np.int64) if future is None else future
+        self.past = np.zeros((SCORE_BINS, SCORE_BINS), dtype=np.int64) if past is None else past
+        self.grades = np.zeros(N_GRADES, dtype=np.int64) if grades is None else grades
+        self.total = int(total)
+        self.version = int(version)
+        self.updated_at = float(updated_at)
+        self.daily = DailyHistogramRing() if daily is None else daily
+        self.moments = GradeMoments() if moments is None else moments
+        self.joint = np.zeros(JOINT_SHAPE, dtype=np.int64) if joint is None else joint
+
+    @classmethod
+    def from_frame(cls, frame):
+        """回答データ（DataFrame）から集計値を作成"""
+        aggregates = cls()
+        aggregates.add_frame(frame)
+        return aggregates
+
+    def add_columns(self, columns, n_rows):
+        """列ごとの配列（{列名: 値の配列}）を集計に加算する"""
+        if n_rows == 0:
+            return self
+        indices = {}
+        for i, metric in enumerate(METRICS):
+            if metric not in columns:
+                continue
+            idx = score_indices(columns[metric])
+            indices[metric] = idx
+            self.hist[i] += np.bincount(idx[idx >= 0], minlength=SCORE_BINS)
+        for name, (x_metric, y_metric) in MATRICES.items():
+            if x_metric in indices and y_metric in indices:
+                ix, iy = indices[x_metric], indices[y_metric]
+                ok = (ix >= 0) & (iy >= 0)
+                grid = np.bincount(ix[ok] * SCORE_BINS + iy[ok], minlength=SCORE_BINS * SCORE_BINS)
+                getattr(self, name)[:] += grid.reshape(SCORE_BINS, SCORE_BINS)
+        if "timestamp" in columns:
+            self.daily.add_indices(day_numbers(columns["timestamp"]), indices)
+        if "grade" in columns:
+            gi = np.fromiter((grade_index(g) for g in columns["grade"]), dtype=np.int64, count=n_rows)
+        else:
+            gi = np.zeros(n_rows, dtype=np.int64)
+        self.grades += np.bincount(gi, minlength=N_GRADES)
+        if len(indices) == len(METRICS):
+            scores = np.column_stack([indices[m] for m in METRICS])
+            complete = (scores >= 0).all(axis=1)
+            self.moments.add_rows(gi[complete], scores[complete] + SCORE_MIN)
+            np.add.at(self.joint.reshape(-1), np.ravel_multi_index(scores[complete].T, JOINT_SHAPE), 1)
+        self.total += n_rows
+        return self
+
+    def add_frame(self, frame):
+        """DataFrame の行を集計に加算する"""
+        if frame is None or frame.empty:
+            return self
+        import pandas as pd
+        columns = {m: pd.to_numeric(frame[m], errors="coerce").to_numpy() for m in METRICS if m in frame.columns}
+        if "grade" in frame.columns:
+            columns["grade"] = frame["grade"].astype(str).tolist()
+        if "timestamp" in frame.columns:
+            columns["timestamp"] = pd.to_datetime(frame["timestamp"], errors="coerce").to_numpy(dtype="datetime64[s]")
+        return self.add_columns(columns, len(frame))
+
+    def add_response(self, row):
+        """1件の回答（dict）を加算する"""
+        columns = {m: [row.get(m)] for m in METRICS if m in row}
+        columns["grade"] = [row.get("grade", "")]
+        try:
+            columns["timestamp"] = np.array([row.get("timestamp") or "NaT"], dtype="datetime64[s]")
+        except ValueError:
+            pass
+        return self.add_columns(columns, 1)
+
+    def copy(self):
+        return Aggregates(self.hist.copy(), self.future.copy(), self.past.copy(), self.grades.copy(),
+                          self.total, self.version, self.updated_at, self.daily.copy(), self.moments.copy(),
+                          self.joint.copy())
+
+    def metric_count(self, metric):
+        """指標ごとの有効回答数"""
+        return int(self.hist[METRICS.index(metric)].sum())
+
+    def percentile(self, metric, value):
+        """あなたより低いスコアの回答の割合（%）"""
+        hist = self.hist[METRICS.index(metric)]
+        n = hist.sum()
+        if n == 0:
+            return None
+        below = hist[:min(SCORE_BINS, max(0, math.ceil(value) - SCORE_MIN))].sum()
+        return below / n * 100
+
+    def matrix_points(self, name):
+        """マトリクスの全体分布を (x座標, y座標, 件数) の配列で返す（件数0の格子は除く）"""
+        return grid_cells(getattr(self, name))
+
+
+def grid_cells(grid):
+    """マトリクスの格子（21×21）を (x座標, y座標, 件数) の配列に変換（件数0の格子は除く）"""
+    ix, iy = np.nonzero(grid)
+    return ix + SCORE_MIN, iy + SCORE_MIN, grid[ix, iy]
+
+
+class AggregateStore:
+    """集計ファイルの読み書き（書き込みは単一プロセスのみ）"""
+
+    def __init__(self, path, writable=False):
+        self.path = path
+        self.writable = writable
+        self._file = None
+        self._mm = None
+        self._inode = None
+        self._header = None
+        self._arrays = None
+        self._lock = threading.Lock()
+
+    def _create(self):
+        """空の集計ファイルを作成（既存ファイルは置き換え。読み手は inode の変化で開き直す）"""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            header = np.zeros(HEADER_WORDS, dtype=np.uint64)
+            header[_H_MAGIC], header[_H_LAYOUT] = MAGIC, LAYOUT_VERSION
+            f.write(header.tobytes())
+            f.write(b"\0" * (FILE_SIZE - header.nbytes))
+        os.replace(tmp_path, self.path)
+
+    def _layout_matches(self):
+        try:
+            with open(self.path, "rb") as f:
+                header = np.frombuffer(f.read(HEADER_WORDS * 8), dtype=np.uint64)
+            return (os.path.getsize(self.path) == FILE_SIZE and len(header) == HEADER_WORDS
+                    and header[_H_MAGIC] == MAGIC and header[_H_LAYOUT] == LAYOUT_VERSION)
+        except FileNotFoundError:
+            return False
+
+    def _open(self):
+        """ファイルを mmap する。レイアウトが異なる場合、書き手は作り直し、読み手は False を返す"""
+        if not self._layout_matches():
+            if not self.writable:
+                return False
+            self._create()
+
+        stat = os.stat(self.path)
+        self.close()
+        self._file = open(self.path, "r+b" if self.writable else "rb")
+        access = mmap.ACCESS_WRITE if self.writable else mmap.ACCESS_READ
+        self._mm = mmap.mmap(self._file.fileno(), FILE_SIZE, access=access)
+        self._inode = stat.st_ino
+        self._header = np.frombuffer(self._mm, dtype=np.uint64, count=HEADER_WORDS)
+        self._arrays = {
+            name: np.frombuffer(self._mm, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+            for name, (offset, shape, dtype) in LAYOUT.items()
+        }
+        return True
+
+    def _ensure_open(self):
+        """ファイルが（再）作成されていれば開き直す。存在しない・読めない場合は False"""
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            if not self.writable:
+                return False
+            inode = None
+        if self._mm is None or inode != self._inode:
+            with self._lock:
+                if self._mm is None or inode != self._inode:
+                    return self._open()
+        return True
+
+    def close(self):
+        self._header = None
+        self._arrays = None
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                pass  # 外部に公開したビューが残っている場合はGCに任せる
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def version(self):
+        """書き込み完了回数（0は未書き込み）"""
+        if not self._ensure_open():
+            return 0
+        return int(self._header[_H_SEQ]) // 2
+
+    def write(self, aggregates, updated_at=None):
+        """集計値を書き込む（seq を奇数にしてから更新し、偶数に戻す）。updated_at の既定は現在時刻"""
+        if not self.writable:
+            raise PermissionError("aggregate store is opened read-only")
+        self._ensure_open()
+        # 前回の書き手が更新の途中で終了していると seq が奇数のまま残る。偶数に切り上げてから
+        # 更新しないと、以降の書き込みがすべて奇数で完了し、読み手が待ち続ける
+        seq = int(self._header[_H_SEQ])
+        seq += seq % 2
+        self._header[_H_SEQ] = seq + 1
+        for name in ("hist", "future", "past", "grades"):
+            self._arrays[name][...] = getattr(aggregates, name)
+        self._arrays["daily"][...] = aggregates.daily.counts
+        self._arrays["daily_days"][...] = aggregates.daily.day_stamps
+        self._arrays["moments_n"][...] = aggregates.moments.n
+        self._arrays["moments_mean"][...] = aggregates.moments.mean
+        self._arrays["moments_comoment"][...] = aggregates.moments.comoment
+        self._arrays["joint"][...] = aggregates.joint
+        self._header[_H_TOTAL] = aggregates.total
+        self._header[_H_UPDATED] = time.time_ns() if updated_at is None else int(updated_at * 1e9)
+        self._header[_H_SEQ] = seq + 2
+        self._mm.flush()
+        return (seq + 2) // 2
+
+    def read(self, fn, retries=1000):
+        """一貫した状態の集計領域（コピーなしのビュー）に fn を適用して結果を返す
+
+        fn は Aggregates（配列は読み取り専用ビュー）を受け取る。実行中に書き込みがあれば再実行する。
+        未書き込みまたはファイルが無い場合は None。
+        """
+        if not self._ensure_open():
+            return None
+        for _ in range(retries):
+            seq = int(self._header[_H_SEQ])
+            if seq == 0:
+                return None
+            if seq % 2:
+                time.sleep(0)
+                continue
+            daily = DailyHistogramRing(RING_DAYS, self._arrays["daily"], self._arrays["daily_days"])
+            moments = GradeMoments(self._arrays["moments_n"], self._arrays["moments_mean"],
+                                   self._arrays["moments_comoment"])
+            view = Aggregates(self._arrays["hist"], self._arrays["future"], self._arrays["past"],
+                              self._arrays["grades"], int(self._header[_H_TOTAL]), seq // 2,
+                              int(self._header[_H_UPDATED]) / 1e9, daily, moments, self._arrays["joint"])
+            result = fn(view)
+            if int(self._header[_H_SEQ]) == seq:
+                return result
+        raise TimeoutError("aggregate store is being updated continuously")
+
+    def snapshot(self):
+        """現在の集計値のコピーを返す（未書き込みなら None）"""
+        return self.read(lambda view: view.copy())
+
+
+# --- スナップショット（起動時のウォームスタート用） ---
+def save_snapshot(path, aggregates):
+    """集計値を集計ファイルと同じ形式で書き出す（一時ファイルに書いてから置き換える）"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.snap"
+    store = AggregateStore(tmp_path, writable=True)
+    try:
+        store.write(aggregates, updated_at=aggregates.updated_at or None)
+    finally:
+        store.close()
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path):
+    """スナップショットを読み込む（無い・形式が異なる場合は None）"""
+    store = AggregateStore(path)
+    try:
+        return store.snapshot()
+    finally:
+        store.close()
+
+
+# --- リフレッシュプロセス ---
+def acquire_writer_lock(path):
+    """同じ集計ファイルの書き手を1つに制限する（閉じると解放されるロックファイルを返す）
+
+    他の書き手がロックを持っていれば BlockingIOError を送出する。
+    """
+    import fcntl
+    lock_file = open(f"{path}.lock", "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError as e:
+        lock_file.close()
+        raise BlockingIOError(e.errno, f"another refresher is already updating {path}")
+    return lock_file
+
+
+def fetch_aggregates(secrets):
+    """Sheets から全回答をチャンク単位で読み込んで集計する"""
+    import sheet_reader
+    import sheets_storage
+    import sharding
+    gc = sheets_storage.client_from_secrets(secrets)
+    chunk_rows = int(secrets["app"].get("sheet_chunk_rows", sheet_reader.DEFAULT_CHUNK_ROWS))
+    policy = sharding.policy_from_settings(secrets["app"])
+    if policy is not None:
+        sh = gc.open_by_url(secrets["app"]["spreadsheet_url"])
+        return sharding.read_population(sh, policy, chunk_rows).aggregates
+    ws = sheets_storage.open_response_worksheet_from_secrets(gc, secrets)
+    return sheet_reader.read_aggregates(ws, chunk_rows=chunk_rows).aggregates
+
+
+def refresh(path, secrets, interval=60.0, once=False):
+    """Sheets から集計し直して集計ファイルを更新し続ける"""
+    lock = acquire_writer_lock(path)
+    store = AggregateStore(path, writable=True)
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                version = store.write(fetch_aggregates(secrets))
+                print(f"aggregates v{version} written in {time.perf_counter() - started:.2f}s", flush=True)
+            except Exception as e:
+                print(f"refresh failed: {e}", file=sys.stderr, flush=True)
+                if once:
+                    return 1
+            if once:
+                return 0
+            time.sleep(max(0.0, interval - (time.perf_counter() - started)))
+    finally:
+        store.close()
+        lock.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", default=None, help="集計ファイル（既定: テナントの aggregate_file / APP_AGGREGATE_FILE）")
+    parser.add_argument("--secrets", default=None, help="secrets.toml のパス（既定: .streamlit/secrets.toml）")
+    parser.add_argument("--tenant", default=None, help="集計するテナント（secrets の [tenants.<id>]。既定: [app]）")
+    parser.add_argument("--interval", type=float, default=60.0, help="更新間隔（秒）")
+    parser.add_argument("--once", action="store_true", help="1回だけ更新して終了")
+    args = parser.parse_args(argv)
+
+    import sheets_storage
+    from tenants import tenant_secrets
+    secrets = tenant_secrets(sheets_storage.load_secrets(args.secrets), args.tenant)
+    path = args.file or (secrets.get("app", {}).get("aggregate_file") if args.tenant
+                         else os.environ.get("APP_AGGREGATE_FILE"))
+    if not path:
+        parser.error("--file is required (or aggregate_file for the tenant / APP_AGGREGATE_FILE)")
+    try:
+        return refresh(path, secrets, args.interval, args.once)
+    except BlockingIOError as e:
+        raise SystemExit(e.strerror)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,35 +1,62 @@
 import streamlit as st
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-import matplotlib.font_manager as fm
 import os
-import urllib.request
 from datetime import datetime
-import pandas as pd
-import numpy as np
-import io
 import base64
+import hmac
+import random
+import secrets
+import tempfile
+from urllib.parse import urlparse
 
-# --- Google Sheets連携用 ---
-from google.oauth2.service_account import Credentials
-import gspread
+# --- 重量級モジュールは初回利用時に読み込む ---
+from lazy_imports import lazy_import
+
+# --- 診断定義・ストレージ ---
+from survey import GRADES, METRICS, QSET_VERSION
+import sheets_storage
+aggregate_store = lazy_import("aggregate_store")
+sheet_reader = lazy_import("sheet_reader")
+sharding = lazy_import("sharding")
+rolling_window = lazy_import("rolling_window")
+online_stats = lazy_import("online_stats")
+item_responses = lazy_import("item_responses")
+live_session = lazy_import("live_session")
+dedup_index = lazy_import("dedup_index")
+archetypes = lazy_import("archetypes")
+percentile_bounds = lazy_import("percentile_bounds")
+rerun_profiler = lazy_import("rerun_profiler")
+
+# --- 起動時のウォームアップ（warm_start.py から起動した場合は認証・集計・描画が済んでいる） ---
+import warm_start
+
+# --- テナント（事業部ごとの保存先・全体比較） ---
+import tenants
+
+# --- 保存・取得と描画の並行パイプライン ---
+from results_pipeline import run_in_background, wait_result, Deadline
+
+# --- 軽量SVGレンダラ ---
+from svg_charts import render_matrix_svg, render_result_card_svg, render_strip_svg
+
+# --- 判定ロジック・結果画像（英語版）。一括生成ツール・APIと共用 ---
+from scoring import build_strategy_summary_en, score_answers, summary_en, summary_ja
+from result_report import EXPORT_PROFILES, generate_result_image_with_summary, profile_file_type
 
 # --- フォント設定 (安定版) ---
-def configure_font():
-    font_filename = 'NotoSansJP-Regular.ttf'
-    font_url = 'https://raw.githubusercontent.com/google/fonts/main/ofl/notosansjp/NotoSansJP-Regular.ttf'
-    if not os.path.exists(font_filename):
-        try:
-            urllib.request.urlretrieve(font_url, font_filename)
-        except Exception:
-            pass
-    if os.path.exists(font_filename):
+def configure_font(_module=None):
+    font_filename = warm_start.ensure_font_file()
+    if font_filename:
         fm.fontManager.addfont(font_filename)
         plt.rcParams['font.family'] = 'Noto Sans JP'
     else:
         plt.rcParams['font.family'] = 'sans-serif'
 
-configure_font()
+plt = lazy_import("matplotlib.pyplot", on_load=configure_font)
+patches = lazy_import("matplotlib.patches")
+mcolors = lazy_import("matplotlib.colors")
+fm = lazy_import("matplotlib.font_manager")
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
 
 # --- ページ設定 ---
 st.set_page_config(page_title="時間感覚テスト", layout="centered")
@@ -51,6 +78,26 @@ if all(k in query_params for k in ['ei', 'eq', 'ra', 'rp']):
     except (ValueError, TypeError):
         pass
 
+# --- テナントの振り分け（?tenant=<id> または URL パスの先頭。指定なしは [app] の設定） ---
+@st.cache_resource
+def get_tenant_registry():
+    """secrets の [tenants] から作るテナント一覧（プロセス内で共有）"""
+    try:
+        return tenants.TenantRegistry(st.secrets)
+    except FileNotFoundError:
+        return tenants.TenantRegistry({})
+
+def request_path():
+    """ブラウザの URL のパス（server.baseUrlPath を除く）"""
+    path = urlparse(getattr(st.context, "url", None) or "").path
+    base = "/" + str(st.get_option("server.baseUrlPath") or "").strip("/")
+    return path[len(base):] if base != "/" and path.startswith(base) else path
+
+TENANT = get_tenant_registry().resolve(query_params.get("tenant"), request_path())
+if TENANT is None:
+    st.error("指定されたテナントは設定されていません。URL をご確認ください。")
+    st.stop()
+
 # --- スタイル調整 (CSS) ---
 st.markdown("""
 <style>
@@ -92,94 +139,213 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# --- アプリ設定 ---
+def get_app_setting(key, default=None):
+    """デプロイ設定を取得（環境変数 APP_<KEY> > st.secrets["app"][key] > 既定値）"""
+    env_value = os.environ.get(f"APP_{key.upper()}")
+    if env_value:
+        return env_value
+    try:
+        return st.secrets["app"][key]
+    except Exception:
+        return default
+
+# チャート描画バックエンド: "matplotlib"（既定） / "svg"（軽量・高速）
+CHART_BACKEND = str(get_app_setting("chart_backend", "matplotlib")).lower()
+# 結果画像のダウンロード形式: "svg"、または result_report.EXPORT_PROFILES のプロファイル
+# （"png" / "png8"（パレットPNG） / "webp" / "mobile"（低解像度） / "print"（300dpi））
+DOWNLOAD_FORMAT = str(get_app_setting("download_format", "svg" if CHART_BACKEND == "svg" else "png")).lower()
+
+# 全体比較データ（保存・取得）を待つ上限秒数。超過時は本人のみの結果を表示する
+POPULATION_TIMEOUT = float(get_app_setting("population_timeout", 8))
+
+# Sheetsから全回答を読むときの1回あたりの取得行数
+SHEET_CHUNK_ROWS = int(get_app_setting("sheet_chunk_rows", 2000))
+
+# ファシリテーター向けライブビューのポーリング間隔（秒）
+LIVE_POLL_SECONDS = float(get_app_setting("live_poll_seconds", 5))
+
+# 全体集計のローカルスナップショット（新しいインスタンスの初回表示用。テナントごと）と書き出し間隔（秒）
+SNAPSHOT_FILE = TENANT.setting("snapshot_file")
+SNAPSHOT_INTERVAL = float(get_app_setting("snapshot_interval", warm_start.DEFAULT_SNAPSHOT_INTERVAL))
+
+# 同じ画面セッションから同じ回答が再送されたときに保存を省く期間（秒）
+DEDUP_TTL = float(get_app_setting("dedup_ttl", 600))
+
+# 回答者のタイプ分けの数（0 でタイプ表示なし）
+ARCHETYPES = int(get_app_setting("archetypes", 6))
+
+# --- 再実行のサンプリングプロファイル（rerun_profiler.py） ---
+# 計測する再実行の割合（0 で無効。?profile=<admin_token> のときはその再実行を必ず計測）と保存先・間隔
+PROFILE_SAMPLE_RATE = float(get_app_setting("profile_sample_rate", 0))
+PROFILE_DIR = get_app_setting("profile_dir") or os.path.join(tempfile.gettempdir(), "tpt_profiles")
+PROFILE_INTERVAL_MS = float(get_app_setting("profile_interval_ms", 5))
+
+def start_rerun_profile():
+    """この再実行を計測するなら RerunProfiler を開始して返す"""
+    download = st.session_state.pop("download_clicked", False)
+    token = TENANT.setting("admin_token")
+    forced = bool(token) and hmac.compare_digest(str(query_params.get("profile", "")), str(token))
+    if not forced and random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    profiler = rerun_profiler.RerunProfiler(__file__, PROFILE_DIR, PROFILE_INTERVAL_MS / 1000,
+                                            tag="download" if download else "form")
+    return profiler.start()
+
+def tag_rerun_profile(path):
+    """計測中の再実行に経路（submit / restore / admin / live）を付ける（ダウンロードの再実行はそのまま）"""
+    if RERUN_PROFILE is not None and RERUN_PROFILE.tag != "download":
+        RERUN_PROFILE.tag = path
+
+def mark_download_clicked():
+    st.session_state["download_clicked"] = True
+
+RERUN_PROFILE = start_rerun_profile()
+
 # --- Google Sheets接続関数 ---
+# 以下の cache_resource はテナント id ごとに別の資源を持つ（あるテナントの集計・キャッシュが
+# 他のテナントのものを追い出したり、上限を使い切ったりしない）。id は設定済みのテナントに限られる。
 @st.cache_resource
-def get_gspread_client():
-    """Google Sheets接続を取得"""
+def get_gspread_client(tenant_id):
+    """テナントの Google Sheets 接続を取得（同じ認証情報のテナントと HTTP セッションを共有。
+    テナントごとの呼び出し枠で制限する。default テナントはウォームアップで認証済みならそれを使う）"""
+    tenant = get_tenant_registry().get(tenant_id)
     try:
-        creds_dict = dict(st.secrets["gcp_service_account"])
-        creds = Credentials.from_service_account_info(
-            creds_dict,
-            scopes=[
-                "https://www.googleapis.com/auth/spreadsheets",
-                "https://www.googleapis.com/auth/drive"
-            ]
-        )
-        return gspread.authorize(creds)
+        warm_client = warm_start.STATE.client if tenant.is_default else None
+        return get_tenant_registry().authorize(tenant, warm_client)
     except Exception as e:
         st.warning(f"Google Sheets接続エラー: {e}")
         return None
 
-def load_all_responses():
-    """全回答データを読み込み"""
-    try:
-        gc = get_gspread_client()
-        if gc is None:
-            return pd.DataFrame()
-        
-        sheet_url = st.secrets["app"]["spreadsheet_url"]
-        worksheet_name = st.secrets["app"]["worksheet_name"]
-        
-        sh = gc.open_by_url(sheet_url)
-        ws = sh.worksheet(worksheet_name)
-        
-        data = ws.get_all_records()
-        if data:
-            return pd.DataFrame(data)
-        return pd.DataFrame()
-    except Exception as e:
-        return pd.DataFrame()
+@st.cache_resource
+def get_warm_state(tenant_id):
+    """直近の全体集計とスナップショット（default テナントは warm_start.py のウォームアップと共有）"""
+    return warm_start.STATE if tenant_id == tenants.DEFAULT_TENANT else warm_start.WarmState()
+
+@st.cache_resource
+def get_aggregate_store(tenant_id):
+    """テナントの共有集計ファイル（aggregate_file 設定時のみ）を読み取り専用で開く"""
+    path = get_tenant_registry().get(tenant_id).setting("aggregate_file")
+    if not path:
+        return None
+    return aggregate_store.AggregateStore(path)
+
+def open_response_worksheet(gc):
+    """回答保存先のワークシートを開く"""
+    return sheets_storage.open_worksheet(gc, TENANT.spreadsheet_url, TENANT.worksheet_name)
+
+def get_shard_policy():
+    """ワークシート分割の設定（shard_mode が none/未設定なら None）"""
+    return sharding.policy_from_settings({
+        "worksheet_name": TENANT.worksheet_name,
+        "shard_mode": TENANT.setting("shard_mode", "none"),
+        "shard_rows": TENANT.setting("shard_rows", sharding.DEFAULT_SHARD_ROWS),
+    })
+
+def fetch_population(gc, own_row=None):
+    """全回答をチャンク単位で読み込み集計（own_row がシートに含まれていたかも記録）"""
+    policy = get_shard_policy()
+    if policy is not None:
+        sh = gc.open_by_url(TENANT.spreadsheet_url)
+        return sharding.read_population(sh, policy, chunk_rows=SHEET_CHUNK_ROWS, watch_row=own_row)
+    ws = open_response_worksheet(gc)
+    return sheet_reader.read_aggregates(ws, chunk_rows=SHEET_CHUNK_ROWS, watch_row=own_row)
 
-def save_response(user_data: dict):
-    """回答データを保存"""
+def append_response(gc, user_data: dict):
+    """回答データを1行追記（画面出力なし。例外は呼び出し側で処理）"""
+    policy = get_shard_policy()
+    if policy is not None:
+        sh = gc.open_by_url(TENANT.spreadsheet_url)
+        return sharding.append_sharded(sh, policy, user_data)
+    
+    ws = open_response_worksheet(gc)
+    
+    # 空シート・旧形式の判定はヘッダ行だけで行う（シート全体を読まない）
+    sheets_storage.ensure_response_headers(ws)
+    
+    ws.append_row(sheets_storage.response_row(user_data))
+    return True
+
+@st.cache_resource
+def get_dedup_index(tenant_id):
+    """送信の冪等キー（テナントごと。dedup_file 設定時はファイルにも記録し、他プロセスと共有）"""
+    return dedup_index.DedupIndex(DEDUP_TTL, get_tenant_registry().get(tenant_id).setting("dedup_file"))
+
+def get_client_id():
+    """送信の冪等キーに使うブラウザの識別子
+
+    初回の表示で URL の ?cid= に置き、再読み込みや WebSocket の再接続で画面セッションが
+    作り直されても同じ値を使う（再送された回答が同じキーになる）。
+    """
+    client_id = str(query_params.get("cid", ""))[:32]
+    if not client_id:
+        client_id = st.session_state.get("client_id") or secrets.token_hex(8)
+        query_params["cid"] = client_id
+    st.session_state["client_id"] = client_id
+    return client_id
+
+@st.cache_resource
+def get_archetype_tracker(tenant_id):
+    """回答者のタイプ分け（プロセス内で共有。全体集計の更新に合わせて裏で学習し直す）"""
+    return archetypes.ArchetypeTracker(ARCHETYPES)
+
+def append_response_once(gc, user_data: dict, dedup, submission):
+    """冪等キーを記録済みの回答を保存（失敗したらキーを取り消し、再送を受け付ける）"""
     try:
-        gc = get_gspread_client()
-        if gc is None:
-            return False
-        
-        sheet_url = st.secrets["app"]["spreadsheet_url"]
-        worksheet_name = st.secrets["app"]["worksheet_name"]
-        
-        sh = gc.open_by_url(sheet_url)
-        ws = sh.worksheet(worksheet_name)
-        
-        existing_data = ws.get_all_values()
-        if not existing_data:
-            headers = ["timestamp", "grade", "s_exp_int", "s_exp_qty", "s_rec_acc", "s_rec_pos"]
-            ws.append_row(headers)
-        
-        row = [
-            user_data.get("timestamp", ""),
-            user_data.get("grade", ""),
-            user_data.get("s_exp_int", 0),
-            user_data.get("s_exp_qty", 0),
-            user_data.get("s_rec_acc", 0),
-            user_data.get("s_rec_pos", 0),
-        ]
-        ws.append_row(row)
-        return True
-    except Exception as e:
-        st.error(f"データ保存エラー: {e}")
-        return False
+        return append_response(gc, user_data)
+    except Exception:
+        dedup.release(submission)
+        raise
 
-def calculate_percentile(value, all_values):
-    """パーセンタイルを計算"""
-    if len(all_values) == 0:
-        return None
-    return (np.sum(all_values < value) / len(all_values)) * 100
+@st.cache_resource
+def get_live_stats(tenant_id):
+    """職位別の平均・偏差積和（テナントごとにプロセス内で共有し、保存ごとに1件ずつ加算）"""
+    return online_stats.LiveStats()
+
+def refresh_live_stats(gc):
+    """集計ファイルが更新されていれば基準を差し替え、基準が無ければ全回答から作る"""
+    live = get_live_stats(TENANT.id)
+    store = get_aggregate_store(TENANT.id)
+    if store is not None:
+        latest = store.read(lambda view: (view.version, view.updated_at, view.moments.copy()))
+        if latest is not None:
+            version, updated_at, moments = latest
+            live.rebase(moments, version, updated_at)
+    if live.snapshot() is None:
+        warm = get_warm_state(TENANT.id).load_snapshot(SNAPSHOT_FILE)
+        if warm is not None:
+            live.rebase(warm.moments, updated_at=warm.updated_at)
+        elif gc is not None:
+            live.rebase(fetch_population(gc).aggregates.moments, updated_at=datetime.now().timestamp())
+    return live
+
+def fetch_response_arrays(gc):
+    """全回答（分割時は全シャード）を型付き配列として読み込む（項目分析用）"""
+    policy = get_shard_policy()
+    if policy is not None:
+        sh = gc.open_by_url(TENANT.spreadsheet_url)
+        titles = [ws.title for ws in sh.worksheets()]
+        worksheets = [sh.worksheet(name) for name in policy.shard_names(titles)]
+    else:
+        worksheets = [open_response_worksheet(gc)]
+    folder = sheet_reader.ChunkFolder(keep_arrays=True)
+    for ws in worksheets:
+        for header, rows in sheet_reader.iter_row_chunks(ws, SHEET_CHUNK_ROWS):
+            folder.fold(header, rows)
+    return folder.arrays.finalize()
 
 def generate_result_url(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos):
     """結果再表示用のURLを生成"""
-    try:
-        base_url = st.secrets["app"]["app_url"]
-    except (KeyError, TypeError):
-        base_url = ""
+    base_url = TENANT.setting("app_url") or ""
+    query = f"?ei={s_exp_int}&eq={s_exp_qty}&ra={s_rec_acc}&rp={s_rec_pos}"
+    if not TENANT.is_default:
+        query += f"&tenant={TENANT.id}"
     
     if not base_url:
-        return f"?ei={s_exp_int}&eq={s_exp_qty}&ra={s_rec_acc}&rp={s_rec_pos}"
+        return query
     
     base_url = base_url.rstrip('/')
-    return f"{base_url}?ei={s_exp_int}&eq={s_exp_qty}&ra={s_rec_acc}&rp={s_rec_pos}"
+    return f"{base_url}{query}"
 
 def generate_summary_text(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos, summary_future, summary_past):
     """結果サマリのテキストを生成"""
@@ -197,124 +363,127 @@ def generate_summary_text(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos, summary_fu
 ----------------------------------------"""
     return text
 
-# --- グラフ画像ダウンロード（サマリ付き版・英語）---
-def generate_result_image_with_summary(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos, summary_future_en, summary_past_en):
-    """サマリ付きの結果画像を生成（英語版・文字化け防止）"""
-    
-    fig = plt.figure(figsize=(10, 14))
-    gs = fig.add_gridspec(3, 2, height_ratios=[1, 2, 2], hspace=0.3, wspace=0.3)
-    
-    # --- サマリセクション（上段全体） ---
-    ax_summary = fig.add_subplot(gs[0, :])
-    ax_summary.axis('off')
-    
-    summary_title = "Time Perception Test Result"
-    summary_content = f"""
-Future Perspective: {', '.join(summary_future_en)}
-Past Perspective: {', '.join(summary_past_en)}
-
-Score Details:
-  Expectation Intensity: {s_exp_int}/25    Expectation Quantity: {s_exp_qty}/25
-  Recall Accuracy: {s_rec_acc}/25    Recall Positivity: {s_rec_pos}/25
-"""
-    
-    ax_summary.text(0.5, 0.85, summary_title, transform=ax_summary.transAxes,
-                   fontsize=16, fontweight='bold', ha='center', va='top',
-                   color='#2C3E50')
-    
-    bbox_props = dict(boxstyle="round,pad=0.5", facecolor='#F8F9FA', edgecolor='#E74C3C', linewidth=2)
-    ax_summary.text(0.5, 0.45, summary_content, transform=ax_summary.transAxes,
-                   fontsize=10, ha='center', va='center',
-                   color='#34495E', bbox=bbox_props,
-                   family='monospace', linespacing=1.5)
-    
-    # --- Future Matrix（中段左） ---
-    ax_future = fig.add_subplot(gs[1, 0])
-    plot_matrix_on_ax(ax_future, s_exp_qty, s_exp_int, 
-                     "Quantity", "Intensity",
-                     "Future Matrix", "Low", "High", "Weak", "Strong")
-    
-    # --- Past Matrix（中段右） ---
-    ax_past = fig.add_subplot(gs[1, 1])
-    plot_matrix_on_ax(ax_past, s_rec_pos, s_rec_acc,
-                     "Positivity", "Accuracy",
-                     "Past Matrix", "Negative", "Positive", "Low", "High")
-    
-    # --- 推奨戦略のサマリ（下段全体） ---
-    ax_strategy = fig.add_subplot(gs[2, :])
-    ax_strategy.axis('off')
-    
-    strategies = []
-    if s_exp_int <= 12:
-        strategies.append("- Future Connection")
-    if s_exp_int >= 13:
-        strategies.append("- Sustainable Pace")
-    if s_exp_qty >= 13:
-        strategies.append("- Mental Declutter")
-    if s_exp_qty <= 12:
-        strategies.append("- Deep Focus")
-    if s_rec_acc <= 12:
-        strategies.append("- Estimation Calibration")
-    if s_rec_pos >= 13 and s_rec_acc <= 12:
-        strategies.append("- Optimism Calibration")
-    if s_rec_pos <= 12:
-        strategies.append("- Confidence Building")
-    
-    positives = []
-    if s_rec_acc >= 13:
-        positives.append("+ Recall Accuracy: Good")
-    if s_rec_pos >= 13 and s_rec_acc >= 13:
-        positives.append("+ Recall Balance: Ideal")
-    
-    strategy_title = "Recommended Strategies"
-    strategy_text = "\n".join(strategies) if strategies else "Excellent Balance - No specific intervention needed."
-    
-    if positives:
-        strategy_text += "\n\n" + "\n".join(positives)
-    
-    ax_strategy.text(0.5, 0.9, strategy_title, transform=ax_strategy.transAxes,
-                    fontsize=14, fontweight='bold', ha='center', va='top',
-                    color='#2C3E50')
-    
-    bbox_props_strategy = dict(boxstyle="round,pad=0.5", facecolor='#E8F6E8', edgecolor='#27AE60', linewidth=2)
-    ax_strategy.text(0.5, 0.5, strategy_text, transform=ax_strategy.transAxes,
-                    fontsize=11, ha='center', va='center',
-                    color='#2C3E50', bbox=bbox_props_strategy,
-                    linespacing=1.8)
-    
-    ax_strategy.text(0.5, 0.05, f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')} | Dirbato Co., Ltd.",
-                    transform=ax_strategy.transAxes, fontsize=8, ha='center', va='bottom',
-                    color='#95A5A6')
-    
-    plt.tight_layout()
-    
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png', dpi=150, bbox_inches='tight', facecolor='white')
-    buf.seek(0)
-    plt.close(fig)
-    
-    return buf
-
-def plot_matrix_on_ax(ax, x_score, y_score, x_label, y_label, title, x_min, x_max, y_min, y_max):
-    """既存のAxesにマトリクスを描画（英語版・文字化け防止）"""
-    ax.set_xlim(0, 25)
-    ax.set_ylim(0, 25)
-    ax.axvline(x=12.5, color='#BDC3C7', linestyle='--', alpha=0.7)
-    ax.axhline(y=12.5, color='#BDC3C7', linestyle='--', alpha=0.7)
-    
-    ax.scatter(x_score, y_score, color='#E74C3C', s=250, zorder=5, edgecolors='white', linewidth=2)
-    
-    ax.set_xlabel(x_label, fontsize=11, color='#34495E')
-    ax.set_ylabel(y_label, fontsize=11, color='#34495E')
-    ax.set_title(title, fontsize=14, fontweight='bold', color='#2C3E50', pad=15)
-    
-    ax.text(1, 6, y_min, ha='left', va='center', rotation=90, color='#95A5A6', fontsize=10)
-    ax.text(1, 19, y_max, ha='left', va='center', rotation=90, color='#95A5A6', fontsize=10)
-    ax.text(6, 1, x_min, ha='center', va='bottom', color='#95A5A6', fontsize=10)
-    ax.text(19, 1, x_max, ha='center', va='bottom', color='#95A5A6', fontsize=10)
-    
-    rect = patches.Rectangle((12.5, 12.5), 12.5, 12.5, linewidth=0, edgecolor='none', facecolor='#F0F2F6', alpha=0.5)
-    ax.add_patch(rect)
+# --- 管理者向け統計ビュー ---
+def render_admin_view():
+    """4指標の平均・標準偏差・相関と職位別の内訳（全回答の再集計なしで表示）"""
+    st.header("回答統計（管理者向け）")
+    try:
+        live = refresh_live_stats(get_gspread_client(TENANT.id))
+    except Exception as e:
+        st.error(f"集計データの取得に失敗しました: {e}")
+        return
+    moments = live.snapshot()
+    if moments is None:
+        st.info("集計データがありません。")
+        return
+
+    labels = ["予期の濃さ", "予期の量", "想起の正確性", "想起の肯定度"]
+    pooled = moments.pooled()
+    if live.updated_at:
+        st.caption(f"基準: {datetime.fromtimestamp(live.updated_at):%Y-%m-%d %H:%M:%S} の集計（以降の保存は逐次反映）")
+    st.metric("回答数（4指標とも有効）", pooled.n)
+
+    st.subheader("指標別")
+    st.dataframe(pd.DataFrame({"平均": pooled.mean, "標準偏差": pooled.std()}, index=labels).round(2))
+
+    st.subheader("指標間の相関")
+    st.dataframe(pd.DataFrame(pooled.correlation(), index=labels, columns=labels).round(3))
+
+    st.subheader("職位別")
+    rows = []
+    for g, grade in enumerate(GRADES + ["その他"]):
+        m = moments.grade(g)
+        if m.n == 0:
+            continue
+        row = {"職位": grade, "回答数": m.n}
+        for label, mean, sd in zip(labels, m.mean, m.std()):
+            row[f"{label} 平均"] = round(float(mean), 2)
+            row[f"{label} SD"] = round(float(sd), 2)
+        rows.append(row)
+    if rows:
+        st.dataframe(pd.DataFrame(rows).set_index("職位"))
+
+    if os.path.isdir(PROFILE_DIR):
+        st.subheader("再実行プロファイル")
+        hot = rerun_profiler.hot_functions(PROFILE_DIR)
+        st.caption(f"{PROFILE_DIR} の {hot['runs']} 回分の計測を合算した、自己時間の上位の関数"
+                   f"（個別の再実行は .speedscope.json を https://www.speedscope.app で開く）")
+        if hot["functions"]:
+            st.dataframe(pd.DataFrame(hot["functions"]).set_index("function"))
+
+    st.subheader("項目分析")
+    st.caption(f"設問ごとの回答が保存された回答（設問セット v{QSET_VERSION}）から内的一貫性を計算します。")
+    if st.button("Cronbach の α を計算"):
+        gc = get_gspread_client(TENANT.id)
+        if gc is None:
+            st.info("Google Sheets に接続できません。")
+            return
+        arrays = fetch_response_arrays(gc)
+        matrix = arrays["items"][arrays["qset"] == QSET_VERSION]
+        complete = int((matrix > 0).all(axis=1).sum())
+        alphas = item_responses.alpha_by_metric(matrix)
+        st.metric("対象回答数", complete)
+        st.dataframe(pd.DataFrame({
+            "α": [None if a is None else round(float(a), 3) for a in alphas.values()],
+        }, index=labels))
+
+# ?admin=<admin_token> のときだけ表示（admin_token 未設定なら無効）
+ADMIN_TOKEN = TENANT.setting("admin_token")
+if ADMIN_TOKEN and hmac.compare_digest(str(query_params.get("admin", "")), str(ADMIN_TOKEN)):
+    tag_rerun_profile("admin")
+    render_admin_view()
+    st.stop()
+
+# --- ファシリテーター向けライブビュー ---
+def render_live_view(session):
+    """セッション参加者の Future/Past 分布を、新しい回答だけを取得しながら更新表示する"""
+    st.header(f"セッション {session} のライブ集計")
+    gc = get_gspread_client(TENANT.id)
+    if gc is None:
+        st.info("Google Sheets に接続できません。")
+        return
+    feed_key = f"live_feed_{TENANT.id}_{session}"
+    charts_key = f"live_charts_{TENANT.id}_{session}"
+    if feed_key not in st.session_state:
+        sh = gc.open_by_url(TENANT.spreadsheet_url)
+        st.session_state[feed_key] = live_session.SessionFeed(
+            session, sh, TENANT.worksheet_name, get_shard_policy(), SHEET_CHUNK_ROWS)
+
+    @st.fragment(run_every=LIVE_POLL_SECONDS)
+    def live_panel():
+        feed = st.session_state[feed_key]
+        try:
+            added = feed.poll()
+        except Exception as e:
+            st.warning(f"新しい回答の取得に失敗しました（次回再試行します）: {e}")
+            added = 0
+        # 全体分布の層は新しい回答があったときだけ描き直す
+        charts = st.session_state.get(charts_key)
+        if added or charts is None:
+            future = feed.aggregates.matrix_points("future")
+            past = feed.aggregates.matrix_points("past")
+            charts = (
+                render_matrix_svg(None, None, "Quantity", "Intensity", "Future Matrix",
+                                  "Low", "High", "Weak", "Strong", *future),
+                render_matrix_svg(None, None, "Positivity", "Accuracy", "Past Matrix",
+                                  "Negative", "Positive", "Low", "High", *past),
+            )
+            st.session_state[charts_key] = charts
+        st.metric("回答数", feed.aggregates.total, delta=added or None)
+        col1, col2 = st.columns(2)
+        col1.markdown(charts[0], unsafe_allow_html=True)
+        col2.markdown(charts[1], unsafe_allow_html=True)
+        if feed.updated_at is not None:
+            st.caption(f"最終更新 {feed.updated_at:%H:%M:%S}（{LIVE_POLL_SECONDS:g}秒ごとに新しい回答のみ取得）")
+
+    live_panel()
+
+# ?live=<セッションコード> のときはライブビューのみ表示
+live_code = sheets_storage.normalize_session_code(query_params.get("live", ""))
+if live_code:
+    tag_rerun_profile("live")
+    render_live_view(live_code)
+    st.stop()
 
 # --- 免責事項 ---
 st.markdown("""
@@ -377,21 +546,12 @@ questions = {
 }
 
 # --- 職位選択肢 ---
-grades = [
-    "回答しない",
-    "アナリスト",
-    "コンサルタント",
-    "シニアコンサルタント",
-    "マネージャー",
-    "アーキテクト",
-    "シニアマネージャー",
-    "シニアアーキテクト",
-    "パートナー"
-]
+grades = GRADES
 
 # --- フォーム作成 ---
 options = ["全く当てはまらない", "あまり当てはまらない", "どちらともいえない", "やや当てはまる", "完全に当てはまる"]
 option_values = {options[0]: 1, options[1]: 2, options[2]: 3, options[3]: 4, options[4]: 5}
+client_id = get_client_id()
 
 with st.form("diagnosis_form"):
     st.header("Section 1: 未来の視点（Future Perspective）")
@@ -439,6 +599,12 @@ with st.form("diagnosis_form"):
     
     user_grade = st.selectbox("職位（任意）", grades, help="匿名での傾向分析に使用します。")
     
+    session_code = st.text_input(
+        "セッションコード（任意）",
+        value=query_params.get("session", ""),
+        help="ワークショップで案内されたコードを入力すると、会場全体の集計に反映されます。"
+    )
+    
     data_consent = st.checkbox(
         "回答結果を匿名で蓄積し、全体傾向の比較表示に使用することに同意します",
         help="同意しない場合も診断結果は表示されますが、データは保存されず、全体比較も表示されません。"
@@ -447,51 +613,84 @@ with st.form("diagnosis_form"):
     submitted = st.form_submit_button("診断を実行", type="primary")
 
 # --- 結果表示関数 ---
-def display_results(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos, is_restored=False, show_comparison=True):
-    """結果を表示する共通関数"""
-    
-    all_responses = pd.DataFrame()
-    percentiles = {}
-    total_responses = 0
+def display_results(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos, is_restored=False, show_comparison=True,
+                    save_future=None, save_slot=None, own_row=None):
+    """結果を表示する共通関数
+
+    保存と全体データの取得はバックグラウンドで進め、スコアだけで描ける部分を先に表示する。
+    全体比較に依存する部分は、データ到着後（上限 POPULATION_TIMEOUT 秒）に差し替える。
+    """
     
+    scores = {'s_exp_int': s_exp_int, 's_exp_qty': s_exp_qty, 's_rec_acc': s_rec_acc, 's_rec_pos': s_rec_pos}
+
+    def compare(population, own=None):
+        """全体比較の表示に使う値（パーセンタイル・信頼区間・期間別・分布・タイプ）を計算する
+
+        population は集計ファイルのビュー（コピーなし）でもよい。戻り値は小さな配列（4×21、21×21）の
+        コピーと数値だけで、読み取りの後も使える。own は population にまだ含まれない本人の回答の集計。
+        """
+        own = own if own is not None else aggregate_store.Aggregates()
+        values = [scores[m] for m in METRICS]
+        hist = population.hist + own.hist
+        total = population.total + own.total
+        n = hist.sum(axis=1)
+        below = percentile_bounds.below_counts(hist, values)
+        # 95%信頼区間（ヒストグラムの再抽出。回答者が少ないほど幅が広い）
+        bounds = percentile_bounds.percentile_intervals(hist, values)
+        result = {
+            "total": int(total),
+            "hist": hist,
+            "percentiles": {m: float(below[i] / n[i] * 100) if n[i] else None for i, m in enumerate(METRICS)},
+            "intervals": {m: None if np.isnan(b).any() else (float(b[0]), float(b[1])) for m, b in zip(METRICS, bounds)},
+            "future": population.future + own.future,
+            "past": population.past + own.past,
+            "windows": [],
+            "archetype": None,
+        }
+        # 期間別パーセンタイル（日別ヒストグラムの合計）: [{指標: (パーセンタイル, 回答数)}, ...]
+        today = datetime.now().date()
+        for start, end in (rolling_window.last_n_days(today, 90), rolling_window.this_quarter(today)):
+            window = population.daily.window(start, end) + own.daily.window(start, end)
+            window_n = window.sum(axis=1)
+            window_below = percentile_bounds.below_counts(window, values)
+            result["windows"].append({
+                m: (float(window_below[i] / window_n[i] * 100) if window_n[i] else None, int(window_n[i]))
+                for i, m in enumerate(METRICS)
+            })
+        # タイプ（事前計算した表を引くだけ。同時分布は読み取り中のビューのまま渡す）
+        if ARCHETYPES > 0 and total >= archetypes.MIN_POPULATION:
+            index = get_archetype_tracker(TENANT.id).index_for(population.joint)
+            if index is not None:
+                result["archetype"] = dict(index.classify(scores), radius=index.radius)
+        return result
+
+    def read_stored(view):
+        """集計ファイルのビューから表示用の値と、読み取り後も使う職位別の統計量を取り出す"""
+        return compare(view), view.moments.copy(), view.version, view.updated_at
+
+    # 全体比較は共有集計ファイルを優先し、無ければSheetsから取得する
+    # （取得を待つ間は、直近の集計またはスナップショットで仮表示する）
+    stored = None
+    responses_future = None
+    warm_population = None
     if show_comparison:
-        all_responses = load_all_responses()
-        if not all_responses.empty and len(all_responses) >= 5:
-            total_responses = len(all_responses)
-            if 's_exp_int' in all_responses.columns:
-                percentiles['exp_int'] = calculate_percentile(s_exp_int, pd.to_numeric(all_responses['s_exp_int'], errors='coerce').dropna().values)
-            if 's_exp_qty' in all_responses.columns:
-                percentiles['exp_qty'] = calculate_percentile(s_exp_qty, pd.to_numeric(all_responses['s_exp_qty'], errors='coerce').dropna().values)
-            if 's_rec_acc' in all_responses.columns:
-                percentiles['rec_acc'] = calculate_percentile(s_rec_acc, pd.to_numeric(all_responses['s_rec_acc'], errors='coerce').dropna().values)
-            if 's_rec_pos' in all_responses.columns:
-                percentiles['rec_pos'] = calculate_percentile(s_rec_pos, pd.to_numeric(all_responses['s_rec_pos'], errors='coerce').dropna().values)
+        store = get_aggregate_store(TENANT.id)
+        try:
+            stored = store.read(read_stored) if store is not None else None
+        except TimeoutError:
+            # 集計ファイルが更新中のまま読めない場合は、ファイルが無いときと同じく Sheets から取得する
+            stored = None
+        if stored is None:
+            warm_population = get_warm_state(TENANT.id).load_snapshot(SNAPSHOT_FILE)
+            gc = get_gspread_client(TENANT.id)
+            if gc is not None:
+                responses_future = run_in_background(fetch_population, gc, own_row)
 
     # --- 診断サマリの判定（日本語版：画面表示用） ---
-    summary_future = []
-    if s_exp_int <= 12: summary_future.append("予期が薄い")
-    if s_exp_int >= 13: summary_future.append("予期が濃い")
-    if s_exp_qty >= 13: summary_future.append("予期が多い")
-    if s_exp_qty <= 12: summary_future.append("予期が少ない")
-
-    summary_past = []
-    if s_rec_acc <= 12: summary_past.append("見積もりが曖昧")
-    if s_rec_acc >= 13: summary_past.append("見積もりが正確")
-    if s_rec_pos <= 12: summary_past.append("過去に否定的")
-    if s_rec_pos >= 13: summary_past.append("過去に肯定的")
+    summary_future, summary_past = summary_ja(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos)
 
     # --- 診断サマリ（英語版：画像出力用） ---
-    summary_future_en = []
-    if s_exp_int <= 12: summary_future_en.append("Weak Expectation")
-    if s_exp_int >= 13: summary_future_en.append("Strong Expectation")
-    if s_exp_qty >= 13: summary_future_en.append("High Quantity")
-    if s_exp_qty <= 12: summary_future_en.append("Low Quantity")
-
-    summary_past_en = []
-    if s_rec_acc <= 12: summary_past_en.append("Low Accuracy")
-    if s_rec_acc >= 13: summary_past_en.append("High Accuracy")
-    if s_rec_pos <= 12: summary_past_en.append("Negative Recall")
-    if s_rec_pos >= 13: summary_past_en.append("Positive Recall")
+    summary_future_en, summary_past_en = summary_en(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos)
 
     st.markdown(f"""
     <div class="summary-box">
@@ -502,98 +701,173 @@ def display_results(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos, is_restored=Fals
     """, unsafe_allow_html=True)
     
     # --- 全体比較（パーセンタイル）の表示 ---
-    if percentiles and total_responses >= 5:
-        def get_position_description(pct, metric_type):
-            """スコアの位置を中立的に説明"""
-            if pct is None:
-                return "N/A", ""
+    percentile_slot = st.empty()
+    distribution_slot = st.empty()
+    archetype_slot = st.empty()
+    if show_comparison:
+        percentile_slot.caption("全体比較データを読み込んでいます…")
+
+    def render_archetype(comparison):
+        """本人のタイプと、ほぼ同じプロフィールの回答者の割合"""
+        result = comparison["archetype"]
+        if result is None:
+            return
+        archetype_slot.markdown(f"""
+        <div class="percentile-box">
+            <div class="percentile-title">あなたのタイプ: タイプ{result['archetype']}（{result['name']}）</div>
+            <p class="summary-text">回答者の {result['share']:.0f}% がこのタイプに分類されます。</p>
+            <p class="summary-text">4指標すべてがあなたと±{result['radius']}点以内の回答者: {result['near_share']:.1f}%（{result['near_count']}名）</p>
+            <p style="font-size:0.8rem; margin-top:10px; opacity:0.7;">
+                タイプは回答者全体の4指標の分布から自動的に分けたもので、優劣はありません。
+            </p>
+        </div>
+        """, unsafe_allow_html=True)
+
+    def render_distributions(comparison):
+        """指標ごとの全体分布に本人のスコアとパーセンタイルを重ねた小さなチャート（21ビンの集計から描く）"""
+        cells = []
+        for metric, label in zip(METRICS, ["予期の濃さ", "予期の量", "想起の正確性", "想起の肯定度"]):
+            counts = comparison["hist"][METRICS.index(metric)]
+            svg = render_strip_svg(counts, scores[metric], comparison["percentiles"][metric],
+                                   comparison["intervals"][metric])
+            cells.append(f'<div><div style="font-size:0.85rem; opacity:0.8;">{label}</div>{svg}</div>')
+        distribution_slot.markdown(f"""
+        <div style="display:grid; grid-template-columns:1fr 1fr; gap:8px 16px; margin-bottom:20px;">
+            {"".join(cells)}
+        </div>
+        """, unsafe_allow_html=True)
+
+    def render_percentiles(comparison):
+        percentiles = {}
+        total_responses = 0
+        if comparison["total"] >= 5:
+            total_responses = comparison["total"]
+            percentiles = {metric[2:]: pct for metric, pct in comparison["percentiles"].items()}
+            intervals = comparison["intervals"]
+
+        if percentiles and total_responses >= 5:
+            def get_position_description(pct, metric_type):
+                """スコアの位置を中立的に説明"""
+                if pct is None:
+                    return "N/A", ""
             
-            position = f"{pct:.0f}%"
+                position = f"{pct:.0f}%"
+                interval = intervals.get(f"s_{metric_type}")
+                if interval is not None:
+                    low, high = interval
+                    position += f'<br><span style="font-size:0.75rem; opacity:0.7;">{low:.0f}–{high:.0f}%</span>'
             
-            if metric_type == "exp_int":
-                if pct >= 70:
-                    note = "将来への意識が高い傾向"
-                elif pct <= 30:
-                    note = "現在志向の傾向"
-                else:
-                    note = "バランス型"
-            elif metric_type == "exp_qty":
-                if pct >= 70:
-                    note = "多くの予定を抱える傾向"
-                elif pct <= 30:
-                    note = "集中型の傾向"
-                else:
-                    note = "バランス型"
-            elif metric_type == "rec_acc":
-                if pct >= 70:
-                    note = "見積もり精度が高い傾向"
-                elif pct <= 30:
-                    note = "楽観的な見積もりの傾向"
-                else:
-                    note = "バランス型"
-            elif metric_type == "rec_pos":
-                if pct >= 70:
-                    note = "過去を肯定的に捉える傾向"
-                elif pct <= 30:
-                    note = "過去に厳しい傾向"
+                if metric_type == "exp_int":
+                    if pct >= 70:
+                        note = "将来への意識が高い傾向"
+                    elif pct <= 30:
+                        note = "現在志向の傾向"
+                    else:
+                        note = "バランス型"
+                elif metric_type == "exp_qty":
+                    if pct >= 70:
+                        note = "多くの予定を抱える傾向"
+                    elif pct <= 30:
+                        note = "集中型の傾向"
+                    else:
+                        note = "バランス型"
+                elif metric_type == "rec_acc":
+                    if pct >= 70:
+                        note = "見積もり精度が高い傾向"
+                    elif pct <= 30:
+                        note = "楽観的な見積もりの傾向"
+                    else:
+                        note = "バランス型"
+                elif metric_type == "rec_pos":
+                    if pct >= 70:
+                        note = "過去を肯定的に捉える傾向"
+                    elif pct <= 30:
+                        note = "過去に厳しい傾向"
+                    else:
+                        note = "バランス型"
                 else:
-                    note = "バランス型"
-            else:
-                note = ""
+                    note = ""
             
-            return position, note
+                return position, note
         
-        exp_int_pos, exp_int_note = get_position_description(percentiles.get('exp_int'), 'exp_int')
-        exp_qty_pos, exp_qty_note = get_position_description(percentiles.get('exp_qty'), 'exp_qty')
-        rec_acc_pos, rec_acc_note = get_position_description(percentiles.get('rec_acc'), 'rec_acc')
-        rec_pos_pos, rec_pos_note = get_position_description(percentiles.get('rec_pos'), 'rec_pos')
+            exp_int_pos, exp_int_note = get_position_description(percentiles.get('exp_int'), 'exp_int')
+            exp_qty_pos, exp_qty_note = get_position_description(percentiles.get('exp_qty'), 'exp_qty')
+            rec_acc_pos, rec_acc_note = get_position_description(percentiles.get('rec_acc'), 'rec_acc')
+            rec_pos_pos, rec_pos_note = get_position_description(percentiles.get('rec_pos'), 'rec_pos')
+
+            # 期間別パーセンタイル（日別ヒストグラムの合計。回答者5名未満の期間は表示しない）
+            def window_positions(metric):
+                cells = []
+                for window in comparison["windows"]:
+                    pct, n = window[metric]
+                    cells.append(f"{pct:.0f}%" if n >= 5 else "—")
+                return cells
+
+            exp_int_90, exp_int_q = window_positions('s_exp_int')
+            exp_qty_90, exp_qty_q = window_positions('s_exp_qty')
+            rec_acc_90, rec_acc_q = window_positions('s_rec_acc')
+            rec_pos_90, rec_pos_q = window_positions('s_rec_pos')
         
-        st.markdown(f"""
-        <div class="percentile-box">
-            <div class="percentile-title">全体比較（回答者 {total_responses} 名中の分布位置）</div>
-            <table style="width:100%; border-collapse: collapse;">
-                <tr style="border-bottom: 1px solid rgba(100,100,255,0.3);">
-                    <th style="text-align:left; padding:8px;">指標</th>
-                    <th style="text-align:center; padding:8px;">スコア</th>
-                    <th style="text-align:center; padding:8px;">パーセンタイル</th>
-                    <th style="text-align:left; padding:8px;">傾向</th>
-                </tr>
-                <tr>
-                    <td style="padding:8px;">予期の濃さ</td>
-                    <td style="text-align:center; padding:8px;">{s_exp_int}/25</td>
-                    <td style="text-align:center; padding:8px;">{exp_int_pos}</td>
-                    <td style="padding:8px; font-size:0.85rem; opacity:0.8;">{exp_int_note}</td>
-                </tr>
-                <tr>
-                    <td style="padding:8px;">予期の量</td>
-                    <td style="text-align:center; padding:8px;">{s_exp_qty}/25</td>
-                    <td style="text-align:center; padding:8px;">{exp_qty_pos}</td>
-                    <td style="padding:8px; font-size:0.85rem; opacity:0.8;">{exp_qty_note}</td>
-                </tr>
-                <tr>
-                    <td style="padding:8px;">想起の正確性</td>
-                    <td style="text-align:center; padding:8px;">{s_rec_acc}/25</td>
-                    <td style="text-align:center; padding:8px;">{rec_acc_pos}</td>
-                    <td style="padding:8px; font-size:0.85rem; opacity:0.8;">{rec_acc_note}</td>
-                </tr>
-                <tr>
-                    <td style="padding:8px;">想起の肯定度</td>
-                    <td style="text-align:center; padding:8px;">{s_rec_pos}/25</td>
-                    <td style="text-align:center; padding:8px;">{rec_pos_pos}</td>
-                    <td style="padding:8px; font-size:0.85rem; opacity:0.8;">{rec_pos_note}</td>
-                </tr>
-            </table>
-            <p style="font-size:0.8rem; margin-top:10px; opacity:0.7;">
-                パーセンタイルは「あなたより低いスコアの回答者の割合」を示します。
-                これらの指標に良し悪しはなく、異なる認知傾向を表しています。
-            </p>
-        </div>
-        """, unsafe_allow_html=True)
-    elif show_comparison and total_responses < 5:
-        st.info(f"全体比較は回答者が5名以上になると表示されます（現在: {total_responses}名）")
+            percentile_slot.markdown(f"""
+            <div class="percentile-box">
+                <div class="percentile-title">全体比較（回答者 {total_responses} 名中の分布位置）</div>
+                <table style="width:100%; border-collapse: collapse;">
+                    <tr style="border-bottom: 1px solid rgba(100,100,255,0.3);">
+                        <th style="text-align:left; padding:8px;">指標</th>
+                        <th style="text-align:center; padding:8px;">スコア</th>
+                        <th style="text-align:center; padding:8px;">パーセンタイル</th>
+                        <th style="text-align:center; padding:8px;">直近90日</th>
+                        <th style="text-align:center; padding:8px;">今四半期</th>
+                        <th style="text-align:left; padding:8px;">傾向</th>
+                    </tr>
+                    <tr>
+                        <td style="padding:8px;">予期の濃さ</td>
+                        <td style="text-align:center; padding:8px;">{s_exp_int}/25</td>
+                        <td style="text-align:center; padding:8px;">{exp_int_pos}</td>
+                        <td style="text-align:center; padding:8px;">{exp_int_90}</td>
+                        <td style="text-align:center; padding:8px;">{exp_int_q}</td>
+                        <td style="padding:8px; font-size:0.85rem; opacity:0.8;">{exp_int_note}</td>
+                    </tr>
+                    <tr>
+                        <td style="padding:8px;">予期の量</td>
+                        <td style="text-align:center; padding:8px;">{s_exp_qty}/25</td>
+                        <td style="text-align:center; padding:8px;">{exp_qty_pos}</td>
+                        <td style="text-align:center; padding:8px;">{exp_qty_90}</td>
+                        <td style="text-align:center; padding:8px;">{exp_qty_q}</td>
+                        <td style="padding:8px; font-size:0.85rem; opacity:0.8;">{exp_qty_note}</td>
+                    </tr>
+                    <tr>
+                        <td style="padding:8px;">想起の正確性</td>
+                        <td style="text-align:center; padding:8px;">{s_rec_acc}/25</td>
+                        <td style="text-align:center; padding:8px;">{rec_acc_pos}</td>
+                        <td style="text-align:center; padding:8px;">{rec_acc_90}</td>
+                        <td style="text-align:center; padding:8px;">{rec_acc_q}</td>
+                        <td style="padding:8px; font-size:0.85rem; opacity:0.8;">{rec_acc_note}</td>
+                    </tr>
+                    <tr>
+                        <td style="padding:8px;">想起の肯定度</td>
+                        <td style="text-align:center; padding:8px;">{s_rec_pos}/25</td>
+                        <td style="text-align:center; padding:8px;">{rec_pos_pos}</td>
+                        <td style="text-align:center; padding:8px;">{rec_pos_90}</td>
+                        <td style="text-align:center; padding:8px;">{rec_pos_q}</td>
+                        <td style="padding:8px; font-size:0.85rem; opacity:0.8;">{rec_pos_note}</td>
+                    </tr>
+                </table>
+                <p style="font-size:0.8rem; margin-top:10px; opacity:0.7;">
+                    パーセンタイルは「あなたより低いスコアの回答者の割合」を示します。
+                    下段は95%信頼区間で、回答者が少ないうちは幅が広くなります。
+                    直近90日・今四半期は、その期間の回答者が5名以上の場合に表示します。
+                    これらの指標に良し悪しはなく、異なる認知傾向を表しています。
+                </p>
+            </div>
+            """, unsafe_allow_html=True)
+            render_distributions(comparison)
+            render_archetype(comparison)
+        elif show_comparison and total_responses < 5:
+            percentile_slot.info(f"全体比較は回答者が5名以上になると表示されます（現在: {total_responses}名）")
 
     # --- チャート描画（英語版・文字化け防止） ---
-    def plot_matrix(x_score, y_score, x_label, y_label, title, x_min, x_max, y_min, y_max, all_x=None, all_y=None):
+    def plot_matrix(x_score, y_score, x_label, y_label, title, x_min, x_max, y_min, y_max, all_x=None, all_y=None, all_counts=None):
         fig, ax = plt.subplots(figsize=(6, 6))
         ax.set_xlim(0, 25)
         ax.set_ylim(0, 25)
@@ -601,7 +875,13 @@ def display_results(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos, is_restored=Fals
         ax.axhline(y=12.5, color='#BDC3C7', linestyle='--', alpha=0.7)
         
         if all_x is not None and all_y is not None and len(all_x) > 0:
-            ax.scatter(all_x, all_y, color='#BDC3C7', s=50, alpha=0.3, zorder=3, label='Others')
+            if all_counts is None:
+                ax.scatter(all_x, all_y, color='#BDC3C7', s=50, alpha=0.3, zorder=3, label='Others')
+            else:
+                # 同一座標の件数分の重ね描きと同じ不透明度で1点ずつ描く
+                colors = np.tile(mcolors.to_rgba('#BDC3C7'), (len(all_x), 1))
+                colors[:, 3] = 1 - (1 - 0.3) ** np.asarray(all_counts)
+                ax.scatter(all_x, all_y, c=colors, s=50, zorder=3, label='Others')
         
         ax.scatter(x_score, y_score, color='#E74C3C', s=250, zorder=5, edgecolors='white', linewidth=2, label='You')
         
@@ -620,24 +900,44 @@ def display_results(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos, is_restored=Fals
         
         return fig
 
-    all_exp_qty = pd.to_numeric(all_responses['s_exp_qty'], errors='coerce').dropna().values if not all_responses.empty and 's_exp_qty' in all_responses.columns else None
-    all_exp_int = pd.to_numeric(all_responses['s_exp_int'], errors='coerce').dropna().values if not all_responses.empty and 's_exp_int' in all_responses.columns else None
-    all_rec_pos = pd.to_numeric(all_responses['s_rec_pos'], errors='coerce').dropna().values if not all_responses.empty and 's_rec_pos' in all_responses.columns else None
-    all_rec_acc = pd.to_numeric(all_responses['s_rec_acc'], errors='coerce').dropna().values if not all_responses.empty and 's_rec_acc' in all_responses.columns else None
+    if CHART_BACKEND == "svg":
+        plot_matrix = render_matrix_svg
+        def show_chart(slot, svg):
+            slot.markdown(svg, unsafe_allow_html=True)
+    else:
+        def show_chart(slot, fig):
+            slot.pyplot(fig)
+            plt.close(fig)
+
+    def render_charts(comparison=None):
+        all_exp_qty, all_exp_int, future_counts = aggregate_store.grid_cells(comparison["future"]) if comparison is not None else (None, None, None)
+        all_rec_pos, all_rec_acc, past_counts = aggregate_store.grid_cells(comparison["past"]) if comparison is not None else (None, None, None)
+
+        fig1 = plot_matrix(s_exp_qty, s_exp_int, "Quantity", "Intensity", 
+                          "Future Matrix", "Low", "High", "Weak", "Strong",
+                          all_exp_qty, all_exp_int, future_counts)
+        show_chart(chart_slot1, fig1)
+        fig2 = plot_matrix(s_rec_pos, s_rec_acc, "Positivity", "Accuracy", 
+                          "Past Matrix", "Negative", "Positive", "Low", "High",
+                          all_rec_pos, all_rec_acc, past_counts)
+        show_chart(chart_slot2, fig2)
 
+    # 本人のスコアのみのチャートを先に表示し、全体データの到着後に差し替える
     col1, col2 = st.columns(2)
     with col1:
         st.markdown("**Future（未来の視点）**")
-        fig1 = plot_matrix(s_exp_qty, s_exp_int, "Quantity", "Intensity", 
-                          "Future Matrix", "Low", "High", "Weak", "Strong",
-                          all_exp_qty, all_exp_int)
-        st.pyplot(fig1)
+        chart_slot1 = st.empty()
     with col2:
         st.markdown("**Past（過去の視点）**")
-        fig2 = plot_matrix(s_rec_pos, s_rec_acc, "Positivity", "Accuracy", 
-                          "Past Matrix", "Negative", "Positive", "Low", "High",
-                          all_rec_pos, all_rec_acc)
-        st.pyplot(fig2)
+        chart_slot2 = st.empty()
+    comparison = None
+    if stored is not None:
+        comparison = stored[0]
+    elif warm_population is not None:
+        comparison = compare(warm_population)
+    if comparison is not None:
+        render_percentiles(comparison)
+    render_charts(comparison)
 
     # --- 結果保存セクション ---
     st.markdown("---")
@@ -655,14 +955,24 @@ def display_results(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos, is_restored=Fals
         st.text_area("テキストサマリ", summary_text, height=200, help="コピーしてSlackやメモアプリに貼り付けられます")
     
     with col_save2:
-        buf = generate_result_image_with_summary(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos, summary_future_en, summary_past_en)
+        if DOWNLOAD_FORMAT == "svg":
+            strategies, positives = build_strategy_summary_en(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos)
+            buf = render_result_card_svg(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos, summary_future_en, summary_past_en,
+                                         strategies, positives)
+            image_ext, image_mime = "svg", "image/svg+xml"
+        else:
+            profile = DOWNLOAD_FORMAT if DOWNLOAD_FORMAT in EXPORT_PROFILES else "png"
+            buf = generate_result_image_with_summary(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos, summary_future_en, summary_past_en,
+                                                     profile=None if profile == "png" else profile)
+            image_ext, image_mime = profile_file_type(profile)
         
         st.download_button(
             label="結果画像をダウンロード",
             data=buf,
-            file_name=f"time_perception_result_{datetime.now().strftime('%Y%m%d_%H%M')}.png",
-            mime="image/png",
-            help="サマリ・グラフ・推奨戦略を含む画像をダウンロードできます"
+            file_name=f"time_perception_result_{datetime.now().strftime('%Y%m%d_%H%M')}.{image_ext}",
+            mime=image_mime,
+            help="サマリ・グラフ・推奨戦略を含む画像をダウンロードできます",
+            on_click=mark_download_clicked
         )
     
     with col_save3:
@@ -1154,10 +1464,65 @@ def display_results(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos, is_restored=Fals
         if not positive_messages:
             st.success("現在の時間感覚バランスは非常に良好です。現在の習慣を維持してください。")
 
+    # --- 保存・全体データ取得の完了を上限付きで待ち、全体比較を反映 ---
+    deadline = Deadline(POPULATION_TIMEOUT)
+    saved = False
+    if save_future is not None:
+        saved, save_status = wait_result(save_future, deadline, default=False)
+        if save_status == "done" and saved:
+            save_slot.success("回答が保存されました。ご協力ありがとうございます。")
+        elif save_status == "timeout":
+            save_slot.info("回答を保存しています。結果はこのままご覧いただけます。")
+        elif save_status == "error":
+            save_slot.error(f"データ保存エラー: {save_future.exception()}")
+
+    live = get_live_stats(TENANT.id) if show_comparison else None
+    if stored is not None:
+        _, moments, version, updated_at = stored
+        live.rebase(moments, version, updated_at)
+        # 集計ファイルはリフレッシュ待ちのため、保存できた本人の回答を加えて計算し直す
+        if saved:
+            own = aggregate_store.Aggregates().add_response(own_row)
+            live.add_response(own_row)
+            try:
+                comparison = store.read(lambda view: compare(view, own)) or comparison
+            except TimeoutError:
+                pass
+            render_percentiles(comparison)
+            render_charts(comparison)
+    elif responses_future is not None:
+        folder, status = wait_result(responses_future, deadline)
+        if status == "timeout":
+            if warm_population is None:
+                percentile_slot.info("全体比較データの取得に時間がかかっているため、今回は表示を省略しました。")
+            elif saved:
+                # 仮表示の集計に本人の回答を加えて表示し直す（共有の集計値は変更しない）
+                comparison = compare(warm_population, aggregate_store.Aggregates().add_response(own_row))
+                render_percentiles(comparison)
+                render_charts(comparison)
+            if saved:
+                live.add_response(own_row)
+        else:
+            population = folder.aggregates if folder is not None else aggregate_store.Aggregates()
+            # 取得が追記より先に終わった場合は、保存できた本人の回答を手元で加算する
+            if saved and (folder is None or not folder.watch_found):
+                population = population.add_response(own_row)
+            if folder is not None:
+                live.rebase(population.moments, updated_at=datetime.now().timestamp())
+                get_warm_state(TENANT.id).update_population(population, SNAPSHOT_FILE, SNAPSHOT_INTERVAL)
+            elif saved:
+                live.add_response(own_row)
+            comparison = compare(population)
+            render_percentiles(comparison)
+            render_charts(comparison)
+    elif show_comparison:
+        render_percentiles(compare(aggregate_store.Aggregates()))
+
     return summary_future, summary_past
 
 # --- メイン処理 ---
 if submitted:
+    tag_rerun_profile("submit")
     q_scores = [
         option_values[q1_score], option_values[q2_score], option_values[q3_score],
         option_values[q4_score], option_values[q5_score], option_values[q6_score],
@@ -1168,32 +1533,43 @@ if submitted:
         option_values[q19_score], option_values[q20_score]
     ]
     
-    s_exp_int = sum(q_scores[0:5])
-    s_exp_qty = sum(q_scores[5:10])
-    s_rec_acc = sum(q_scores[10:15])
-    s_rec_pos = sum(q_scores[15:20])
+    scores = score_answers(q_scores)
+    s_exp_int = scores["s_exp_int"]
+    s_exp_qty = scores["s_exp_qty"]
+    s_rec_acc = scores["s_rec_acc"]
+    s_rec_pos = scores["s_rec_pos"]
     
     if data_consent:
-        user_data = {
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "grade": user_grade if user_grade != "回答しない" else "",
-            "s_exp_int": s_exp_int,
-            "s_exp_qty": s_exp_qty,
-            "s_rec_acc": s_rec_acc,
-            "s_rec_pos": s_rec_pos
-        }
+        user_data = sheets_storage.build_response(q_scores, user_grade, session_code)
         
-        save_success = save_response(user_data)
-        if save_success:
-            st.success("回答が保存されました。ご協力ありがとうございます。")
+    
+    # 保存はバックグラウンドで実行し、結果表示と並行させる
+    save_slot = st.empty()
+    save_future = None
+    if data_consent:
+        # 二度押し・再送で同じ回答を重複して保存しない（URL の識別子と回答内容から冪等キーを作る）
+        submission = dedup_index.submission_key(client_id, user_data["grade"], user_data["items"],
+                                                user_data["qset"], user_data["session"])
+        dedup = get_dedup_index(TENANT.id)
+        if dedup.claim(submission):
+            gc = get_gspread_client(TENANT.id)
+            if gc is not None:
+                save_future = run_in_background(append_response_once, gc, user_data, dedup, submission)
+            else:
+                dedup.release(submission)
+        else:
+            save_slot.info("この回答は保存済みです（同じ内容の再送信のため、重複して保存していません）。")
     
     st.markdown("---")
     st.header("診断結果")
     
     display_results(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos, 
-                   is_restored=False, show_comparison=data_consent)
+                   is_restored=False, show_comparison=data_consent,
+                   save_future=save_future, save_slot=save_slot,
+                   own_row=user_data if data_consent else None)
 
 elif show_restored_results:
+    tag_rerun_profile("restore")
     st.markdown("---")
     st.header("診断結果（保存された結果）")
     
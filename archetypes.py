@@ -0,0 +1,199 @@
+"""回答者のタイプ分け（4指標のクラスタリング）と、スコア空間全体の事前計算インデックス
+
+全体集計の同時分布（Aggregates.joint: 4指標のスコアの組み合わせ 21^4 通りごとの件数）を
+重み付きのミニバッチ k-means（Sculley 2010。中心ごとの累積件数で学習率を下げる）で
+k 個のタイプにまとめる。生の回答は使わず、件数に比例してセルを抽出したバッチで学習する。
+集計が増えたら増えた分（前回の同時分布との差）だけを追加で学習し、シャードの入れ替えなどで
+件数が減った場合は現在の中心から学習し直す（タイプの番号は変わらない）。
+
+学習後、21^4 通りすべてのスコアについて
+  - 最も近い中心（タイプ番号）
+  - 各指標 ±NEAR_RADIUS 点以内の回答者数（同時分布の箱型の累積和）
+を配列に持つ（約 19 万セル。タイプ番号 uint8 と件数 int64 で約 1.7 MB）。結果画面では本人のスコアの
+セルを1回引くだけで、タイプと「ほぼ同じプロフィールの人の割合」が決まる（回答者との距離計算はしない）。
+"""
+import functools
+import threading
+import time
+
+import numpy as np
+
+from aggregate_store import JOINT_SHAPE
+from results_pipeline import run_in_background
+from scoring import summary_ja
+from survey import METRICS, SCORE_MIN
+
+DEFAULT_ARCHETYPES = 6
+NEAR_RADIUS = 1
+BATCH_SIZE = 1024
+INITIAL_BATCHES = 100
+# タイプを表示する最小回答者数
+MIN_POPULATION = 30
+# インデックスを作り直す最短間隔（秒）
+DEFAULT_REFRESH_INTERVAL = 60.0
+
+
+@functools.lru_cache(maxsize=1)
+def grid_points():
+    """21^4 通りのスコア（同時分布のセル順、shape (194481, 4)）"""
+    return (np.indices(JOINT_SHAPE).reshape(len(JOINT_SHAPE), -1).T + SCORE_MIN).astype(float)
+
+
+def near_counts(joint, radius=NEAR_RADIUS):
+    """各セルについて、各指標 ±radius 以内のセルの件数の合計（軸ごとの累積和の差）"""
+    counts = joint
+    for axis in range(counts.ndim):
+        pad = [(0, 0)] * counts.ndim
+        pad[axis] = (radius + 1, radius)
+        cumsum = np.cumsum(np.pad(counts, pad), axis=axis)
+        n = counts.shape[axis]
+        counts = (np.take(cumsum, np.arange(2 * radius + 1, 2 * radius + 1 + n), axis=axis)
+                  - np.take(cumsum, np.arange(n), axis=axis))
+    return counts
+
+
+def _nearest(points, centers):
+    distances = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+    return distances.argmin(axis=1)
+
+
+def sample_cells(joint, size, rng):
+    """同時分布から件数に比例してセルを抽出し、(スコア, 1点あたりの重み) を返す"""
+    flat = joint.reshape(-1)
+    cells = np.flatnonzero(flat)
+    weights = flat[cells].astype(float)
+    total = weights.sum()
+    picked = rng.choice(cells, size=size, p=weights / total)
+    return grid_points()[picked], np.full(size, total / size)
+
+
+class ArchetypeModel:
+    """重み付きミニバッチ k-means の中心と、中心ごとの累積件数"""
+
+    def __init__(self, k=DEFAULT_ARCHETYPES, seed=0):
+        self.k = k
+        self.rng = np.random.default_rng(seed)
+        self.centers = None
+        self.counts = np.zeros(k)
+
+    def init_centers(self, points, weights):
+        """k-means++（重み付き）で初期中心を選ぶ"""
+        centers = [points[self.rng.choice(len(points), p=weights / weights.sum())]]
+        for _ in range(1, self.k):
+            d2 = ((points[:, None, :] - np.array(centers)[None]) ** 2).sum(axis=2).min(axis=1) * weights
+            if d2.sum() == 0:  # 異なるスコアが k 種類未満
+                centers.append(centers[-1])
+                continue
+            centers.append(points[self.rng.choice(len(points), p=d2 / d2.sum())])
+        self.centers = np.array(centers)
+
+    def partial_fit(self, points, weights):
+        """1バッチ分の更新（中心ごとの学習率 = バッチの重み / 累積件数）"""
+        labels = _nearest(points, self.centers)
+        batch_w = np.bincount(labels, weights=weights, minlength=self.k)
+        batch_sum = np.stack([np.bincount(labels, weights=weights * points[:, j], minlength=self.k)
+                              for j in range(points.shape[1])], axis=1)
+        hit = batch_w > 0
+        self.counts[hit] += batch_w[hit]
+        eta = batch_w[hit] / self.counts[hit]
+        batch_mean = batch_sum[hit] / batch_w[hit][:, None]
+        self.centers[hit] += eta[:, None] * (batch_mean - self.centers[hit])
+        return self
+
+    def fit_histogram(self, joint, batches):
+        """同時分布から batches 回抽出して学習する（中心が未設定なら初期化し、番号をスコア順に揃える）"""
+        if joint.sum() <= 0:
+            return self
+        first = self.centers is None
+        if first:
+            self.init_centers(*sample_cells(joint, BATCH_SIZE, self.rng))
+        for _ in range(batches):
+            points, weights = sample_cells(joint, BATCH_SIZE, self.rng)
+            self.partial_fit(points, weights / batches)
+        if first:
+            order = np.lexsort(self.centers.T[::-1])
+            self.centers, self.counts = self.centers[order], self.counts[order]
+        return self
+
+
+def describe(center):
+    """中心のスコアを診断サマリの言葉で表す"""
+    summary_future, summary_past = summary_ja(*(int(round(c)) for c in center))
+    return "・".join(summary_future + summary_past)
+
+
+class ArchetypeIndex:
+    """21^4 通りのスコアごとのタイプ番号と近傍件数（学習時点の同時分布から作る）"""
+
+    def __init__(self, centers, joint, radius=NEAR_RADIUS):
+        self.centers = centers.copy()
+        self.radius = radius
+        self.labels = np.concatenate([
+            _nearest(chunk, self.centers) for chunk in np.array_split(grid_points(), 16)
+        ]).astype(np.uint8).reshape(JOINT_SHAPE)
+        self.near = near_counts(joint, radius)
+        self.sizes = np.bincount(self.labels.reshape(-1), weights=joint.reshape(-1),
+                                 minlength=len(centers)).astype(np.int64)
+        self.total = int(joint.sum())
+        self.names = [describe(c) for c in self.centers]
+
+    def classify(self, scores):
+        """本人のスコア（{指標: 点}）のタイプと、ほぼ同じプロフィールの回答者の割合"""
+        cell = tuple(int(scores[m]) - SCORE_MIN for m in METRICS)
+        label = int(self.labels[cell])
+        near = int(self.near[cell])
+        total = max(self.total, 1)
+        return {
+            "archetype": label + 1,
+            "name": self.names[label],
+            "center": {m: round(float(v), 1) for m, v in zip(METRICS, self.centers[label])},
+            "share": float(self.sizes[label] / total * 100),
+            "near_count": near,
+            "near_share": near / total * 100,
+        }
+
+
+class ArchetypeTracker:
+    """全体集計の更新に合わせてモデルを追加学習し、インデックスを差し替える（プロセス内で共有）"""
+
+    def __init__(self, k=DEFAULT_ARCHETYPES, refresh_interval=DEFAULT_REFRESH_INTERVAL, seed=0):
+        self.model = ArchetypeModel(k, seed)
+        self.refresh_interval = refresh_interval
+        self.index = None
+        self.built_at = 0.0
+        self._trained = None  # 学習済みの同時分布
+        self._lock = threading.Lock()
+        self._pending = None
+
+    def update(self, joint):
+        """前回から増えた分を学習する（減っていれば現在の中心から学習し直す）"""
+        with self._lock:
+            if self._trained is None:
+                self.model.fit_histogram(joint, INITIAL_BATCHES)
+            else:
+                delta = joint - self._trained
+                if (delta < 0).any():
+                    self.model.counts[:] = 0
+                    self.model.fit_histogram(joint, INITIAL_BATCHES)
+                elif delta.sum() > 0:
+                    self.model.fit_histogram(delta, max(1, min(INITIAL_BATCHES, int(delta.sum()) // BATCH_SIZE)))
+            if self.model.centers is None:  # 4指標すべてが有効な回答がまだ無い
+                return None
+            self._trained = joint.copy()
+            index = ArchetypeIndex(self.model.centers, joint)
+            self.index, self.built_at = index, time.monotonic()
+            return index
+
+    def index_for(self, joint):
+        """joint に対応するインデックスを返す
+
+        初回は同期で作る。以降は古いインデックスを返し、refresh_interval 秒ごとに裏で作り直す。
+        学習できる回答が無ければ None。
+        """
+        if self.index is None:
+            return self.update(joint)
+        stale = not np.array_equal(joint, self._trained)
+        due = time.monotonic() - self.built_at >= self.refresh_interval
+        if stale and due and (self._pending is None or self._pending.done()):
+            self._pending = run_in_background(self.update, joint.copy())
+        return self.index
@@ -0,0 +1,382 @@
+"""過去の回答（紙・Google フォームの結果）の一括取り込み
+
+CSV / Excel（.xlsx）を先頭から順に読み、1行ずつ検証・採点してから回答シートに batch_rows 行ずつ
+append_rows で追記する。採点と保存する行の形式はアプリの送信（sheets_storage.build_response）と同じ。
+
+    python backfill.py history.csv
+    python backfill.py forms.xlsx --sheet "フォームの回答 1" --tenant sales
+    python backfill.py history.csv --dry-run        # 検証と重複判定のみ（書き込みなし）
+
+入力の列（見出し行の名前で指定。bulk_reports.py と同じスコアの与え方）:
+  - timestamp（必須。YYYY-MM-DD HH:MM:SS、YYYY/MM/DD HH:MM、YYYY-MM-DD など）
+  - 次のいずれか: q1〜q20（各設問 1〜5） / items（20問の数字列） / s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos
+    （合計点のみの行は items・qset を空欄で保存する）
+  - grade、session（任意。grade は survey.GRADES のいずれか）
+
+取り込みの動作:
+  - 重複: シートの既存行と入力内の行を、保存する行の内容（日時・職位・スコア・設問回答・セッション）の
+    ダイジェストで照合し、同じ行は追記しない。
+  - 不正な行は追記せず、行番号と理由を <入力>.rejects.csv に書く。
+  - 追記は Sheets の呼び出し枠（--quota-per-minute。アプリと枠を分け合うため既定 30回/分）で制限し、
+    429 / 5xx は間隔を空けて再試行する。
+  - 追記が済むたびに、読み終えた入力の行番号を <入力>.backfill.json に書く。中断後に同じコマンドを
+    実行すると続きから再開する（チェックポイント前に追記済みだった行は重複判定で飛ばす）。
+  - 最後に1回だけ派生集計を更新する（分割時はロールアップの集約。集約済みの月に追記した場合は作り直す。
+    aggregate_file / snapshot_file の設定があれば全体集計を1回読み直して書き出す）。
+"""
+import argparse
+import csv
+from datetime import date, datetime
+import itertools
+import json
+import os
+import sys
+import time
+
+import sharding
+import sheet_reader
+import sheets_storage
+from dedup_index import submission_key
+from item_responses import decode_items
+from sheets_storage import RESPONSE_HEADERS, TIMESTAMP_FORMAT, gspread
+from survey import GRADES, METRICS, NO_GRADE, SCORE_MAX, SCORE_MIN
+from tenants import TokenBucket, limit_requests, tenant_secrets
+
+DEFAULT_BATCH_ROWS = 500
+DEFAULT_QUOTA_PER_MINUTE = 30
+RETRY_STATUS = (429, 500, 502, 503)
+MAX_ATTEMPTS = 6
+
+TIMESTAMP_FORMATS = (
+    "%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M", "%Y/%m/%d %H:%M", "%Y-%m-%d", "%Y/%m/%d",
+)
+
+
+# --- 入力 ---
+def read_rows(path, sheet=None):
+    """入力の (行番号, {列名: 値}) を順に返す（ファイル全体を読み込まない）"""
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        yield from _excel_rows(path, sheet)
+        return
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        yield from enumerate(csv.DictReader(f), start=2)
+
+
+def _excel_rows(path, sheet):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise SystemExit("reading .xlsx requires openpyxl (pip install openpyxl)")
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = (wb[sheet] if sheet else wb.worksheets[0]).iter_rows(values_only=True)
+        header = [str(h).strip() if h is not None else "" for h in next(rows, [])]
+        for line, values in enumerate(rows, start=2):
+            yield line, {h: v for h, v in zip(header, values) if h}
+    finally:
+        wb.close()
+
+
+def _text(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def parse_timestamp(value):
+    """日時の値を保存形式（YYYY-MM-DD HH:MM:SS）に揃える（解釈できなければ ValueError）"""
+    if isinstance(value, datetime):
+        return value.strftime(TIMESTAMP_FORMAT)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day).strftime(TIMESTAMP_FORMAT)
+    text = _text(value)
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime(TIMESTAMP_FORMAT)
+        except ValueError:
+            pass
+    raise ValueError(f"unrecognized timestamp {text!r}")
+
+
+def row_response(row):
+    """入力の1行を検証・採点し、保存する回答データ（dict）を返す（不正なら ValueError）"""
+    timestamp = parse_timestamp(row.get("timestamp"))
+    grade = _text(row.get("grade"))
+    if grade and grade not in GRADES:
+        raise ValueError(f"unknown grade {grade!r}")
+    if grade == NO_GRADE:
+        grade = ""
+    session = _text(row.get("session"))
+
+    answers = None
+    if any(_text(row.get(f"q{i}")) for i in range(1, 21)):
+        answers = [_text(row.get(f"q{i}")) for i in range(1, 21)]
+    elif _text(row.get("items")):
+        if not isinstance(row["items"], str):
+            raise ValueError("items must be stored as text (20 digits)")
+        matrix = decode_items([row["items"].strip()])
+        if not (matrix > 0).all():
+            raise ValueError("items must be 20 answers in 1..5")
+        answers = matrix[0].tolist()
+    if answers is not None:
+        try:
+            return sheets_storage.build_response(answers, grade, session, timestamp)
+        except ValueError:
+            raise ValueError("q1..q20 must all be answers in 1..5")
+
+    if not all(_text(row.get(m)) for m in METRICS):
+        raise ValueError("needs q1..q20, items or all four scores")
+    scores = {}
+    for metric in METRICS:
+        try:
+            scores[metric] = int(_text(row[metric]))
+        except ValueError:
+            raise ValueError(f"{metric} is not an integer")
+        if not SCORE_MIN <= scores[metric] <= SCORE_MAX:
+            raise ValueError(f"{metric}={scores[metric]} is out of range")
+    return {
+        "timestamp": timestamp,
+        "grade": grade,
+        **scores,
+        "items": "",
+        "qset": "",
+        "session": sheets_storage.normalize_session_code(session),
+    }
+
+
+def row_key(values):
+    """保存する行（RESPONSE_HEADERS 順）の重複判定キー"""
+    values = [str(v) for v in values] + [""] * (len(RESPONSE_HEADERS) - len(values))
+    return submission_key(*values[:len(RESPONSE_HEADERS)])
+
+
+# --- 保存先 ---
+class Target:
+    """追記先のワークシート（分割時は日時に応じたシャード）"""
+
+    def __init__(self, sh, policy, worksheet_name):
+        self.sh = sh
+        self.policy = policy
+        self.worksheet_name = worksheet_name
+        self.touched = set()  # 追記したワークシート名
+        self._worksheets = {}  # 確認済み（ヘッダ行あり）のワークシート
+
+    def existing_worksheets(self):
+        if self.policy is None:
+            return [self.sh.worksheet(self.worksheet_name)]
+        titles = [ws.title for ws in self.sh.worksheets()]
+        return [self.sh.worksheet(name) for name in self.policy.shard_names(titles)]
+
+    def existing_keys(self, chunk_rows):
+        """既存の全行の重複判定キー（チャンク単位で読む）"""
+        keys = set()
+        for ws in self.existing_worksheets():
+            for _, rows in sheet_reader.iter_row_chunks(ws, chunk_rows, header=RESPONSE_HEADERS):
+                keys.update(row_key(row) for row in rows)
+        return keys
+
+    def _worksheet(self, timestamp):
+        if self.policy is None:
+            ws = self._worksheets.get(self.worksheet_name) or self.sh.worksheet(self.worksheet_name)
+        else:
+            ws = sharding.current_shard(self.sh, self.policy, timestamp)
+        if ws.title not in self._worksheets:
+            sheets_storage.ensure_response_headers(ws)
+            self._worksheets[ws.title] = ws
+        return ws
+
+    def append(self, rows):
+        """行を追記する（月別シャードでは月ごとに、行数のシャードでは残りの行数ごとに分けて追記）"""
+        groups = itertools.groupby(sorted(rows, key=lambda r: r[0]), key=self._group)
+        for _, group in groups:
+            group = list(group)
+            while group:
+                ws = self._worksheet(group[0][0])
+                n_rows = len(group)
+                if self.policy is not None and self.policy.mode == "rows":
+                    n_rows = min(n_rows, max(1, sharding.shard_room(self.sh, self.policy)))
+                response = append_with_retry(ws, group[:n_rows])
+                sharding.record_append(self.sh, self.policy, ws, n_rows, response)
+                self.touched.add(ws.title)
+                group = group[n_rows:]
+
+    def _group(self, row):
+        if self.policy is not None and self.policy.mode == "monthly":
+            return self.policy.monthly_name(row[0])
+        return ""
+
+
+def append_with_retry(ws, rows, attempts=MAX_ATTEMPTS):
+    for attempt in range(attempts):
+        try:
+            return ws.append_rows(rows)
+        except gspread.exceptions.APIError as e:
+            status = getattr(e.response, "status_code", None)
+            if status not in RETRY_STATUS or attempt == attempts - 1:
+                raise
+            time.sleep(min(60, 2 ** attempt))
+
+
+# --- チェックポイント ---
+class Checkpoint:
+    """読み終えた入力の行番号と件数（追記のたびに書き換える）"""
+
+    def __init__(self, path, identity):
+        self.path = path
+        self.identity = identity  # 入力ファイルと保存先（別の取り込みのチェックポイントで再開しない）
+        # would_append は --dry-run で追記するはずだった行数（書き込まないため appended とは分ける）
+        self.state = {"line": 1, "appended": 0, "would_append": 0, "duplicates": 0, "rejected": 0, "touched": [],
+                      "done": False}
+
+    def load(self, restart=False):
+        if restart or not os.path.exists(self.path):
+            return self
+        with open(self.path, encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("identity") != self.identity:
+            raise SystemExit(f"{self.path} belongs to a different input or target; remove it or pass --restart")
+        self.state.update(saved["state"])
+        return self
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"identity": self.identity, "state": self.state}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def refresh_derived(sh, secrets, policy, touched, chunk_rows, log):
+    """取り込み後に派生集計を1回で更新する"""
+    if policy is not None:
+        rollup = sharding.read_rollup(sh, policy)
+        rebuild = any(name in rollup.shards for name in touched)
+        compacted = sharding.compact(sh, policy, chunk_rows, rebuild=rebuild)
+        print(f"rollup: {'rebuilt' if rebuild else 'compacted'} {len(compacted)} shard(s)", file=log)
+    aggregate_file = secrets["app"].get("aggregate_file")
+    snapshot_file = secrets["app"].get("snapshot_file")
+    if not (aggregate_file or snapshot_file):
+        return
+    import aggregate_store
+    aggregates = aggregate_store.fetch_aggregates(secrets)
+    if aggregate_file:
+        try:
+            lock = aggregate_store.acquire_writer_lock(aggregate_file)
+        except BlockingIOError:
+            print(f"{aggregate_file}: the refresh process is running and will pick up the imported rows", file=log)
+        else:
+            try:
+                store = aggregate_store.AggregateStore(aggregate_file, writable=True)
+                store.write(aggregates)
+                store.close()
+            finally:
+                lock.close()
+            print(f"{aggregate_file}: {aggregates.total} responses", file=log)
+    if snapshot_file:
+        aggregate_store.save_snapshot(snapshot_file, aggregates)
+        print(f"{snapshot_file}: {aggregates.total} responses", file=log)
+
+
+def appended_label(state, dry_run=False):
+    """進捗と結果の表示用の追記件数（--dry-run では追記するはずだった件数）"""
+    if dry_run:
+        return f"{state['would_append']} would append"
+    return f"{state['appended']} appended"
+
+
+def backfill(rows, target, checkpoint, existing, batch_rows, rejects, dry_run=False, log=sys.stderr):
+    """入力の行を検証・重複排除して batch_rows 行ずつ追記する（checkpoint の行より後のみ）"""
+    state = checkpoint.state
+    counted = "would_append" if dry_run else "appended"
+    seen = set(existing)
+    pending, last_line = [], state["line"]
+    started = time.perf_counter()
+
+    def flush():
+        if pending and not dry_run:
+            target.append(pending)
+            state["touched"] = sorted(target.touched | set(state["touched"]))
+        state[counted] += len(pending)
+        state["line"] = last_line
+        pending.clear()
+        if not dry_run:
+            checkpoint.save()
+        print(f"\rline {state['line']}: {appended_label(state, dry_run)}, {state['duplicates']} duplicate(s), "
+              f"{state['rejected']} rejected  {time.perf_counter() - started:.1f}s", end="", file=log, flush=True)
+
+    for line, row in rows:
+        if line <= state["line"]:
+            continue
+        last_line = line
+        try:
+            values = sheets_storage.response_row(row_response(row))
+        except ValueError as e:
+            state["rejected"] += 1
+            rejects.writerow([line, str(e)])
+            continue
+        key = row_key(values)
+        if key in seen:
+            state["duplicates"] += 1
+            continue
+        seen.add(key)
+        pending.append(values)
+        if len(pending) >= batch_rows:
+            flush()
+    flush()
+    state["done"] = True
+    if not dry_run:
+        checkpoint.save()
+    print(file=log)
+    return state
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="取り込む CSV / .xlsx")
+    parser.add_argument("--sheet", default=None, help="Excel のシート名（既定: 先頭のシート）")
+    parser.add_argument("--secrets", default=None, help="secrets.toml のパス（既定: .streamlit/secrets.toml）")
+    parser.add_argument("--tenant", default=None, help="取り込み先のテナント（secrets の [tenants.<id>]。既定: [app]）")
+    parser.add_argument("--batch-rows", type=int, default=DEFAULT_BATCH_ROWS, help="1回の append_rows の行数")
+    parser.add_argument("--quota-per-minute", type=float, default=DEFAULT_QUOTA_PER_MINUTE,
+                        help="Sheets の呼び出し回数の上限（回/分）")
+    parser.add_argument("--checkpoint", default=None, help="再開用のファイル（既定: <入力>.backfill.json）")
+    parser.add_argument("--rejects", default=None, help="不正な行の一覧（既定: <入力>.rejects.csv）")
+    parser.add_argument("--restart", action="store_true", help="チェックポイントを無視して最初から取り込む")
+    parser.add_argument("--dry-run", action="store_true", help="検証と重複判定のみ行い、書き込まない")
+    args = parser.parse_args(argv)
+
+    secrets = tenant_secrets(sheets_storage.load_secrets(args.secrets), args.tenant)
+    app = secrets["app"]
+    chunk_rows = int(app.get("sheet_chunk_rows", sheet_reader.DEFAULT_CHUNK_ROWS))
+    gc = limit_requests(sheets_storage.client_from_secrets(secrets), TokenBucket(args.quota_per_minute))
+    sh = gc.open_by_url(app["spreadsheet_url"])
+    policy = sharding.policy_from_settings(app)
+    target = Target(sh, policy, app["worksheet_name"])
+
+    identity = {"input": os.path.abspath(args.input), "size": os.path.getsize(args.input),
+                "spreadsheet_url": app["spreadsheet_url"], "worksheet_name": app["worksheet_name"]}
+    checkpoint = Checkpoint(args.checkpoint or f"{args.input}.backfill.json", identity).load(args.restart)
+    if checkpoint.state["line"] > 1:
+        print(f"resuming after line {checkpoint.state['line']}", file=sys.stderr)
+
+    started = time.perf_counter()
+    existing = target.existing_keys(chunk_rows)
+    print(f"{len(existing)} existing row(s) loaded in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    rejects_path = args.rejects or f"{args.input}.rejects.csv"
+    with open(rejects_path, "a" if checkpoint.state["line"] > 1 else "w", newline="", encoding="utf-8") as f:
+        rejects = csv.writer(f)
+        if checkpoint.state["line"] <= 1:
+            rejects.writerow(["line", "reason"])
+        state = backfill(read_rows(args.input, args.sheet), target, checkpoint, existing, args.batch_rows,
+                         rejects, dry_run=args.dry_run)
+    print(f"{appended_label(state, args.dry_run)}, {state['duplicates']} duplicate(s), {state['rejected']} rejected "
+          f"({rejects_path}) in {time.perf_counter() - started:.1f}s")
+    if not args.dry_run and state["appended"]:
+        refresh_derived(sh, secrets, policy, state["touched"], chunk_rows, sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""スコアリングAPIのスループット計測（requests/sec、p50/p99 レイテンシ）
+
+    python bench_scoring_api.py                          # 合成データのサーバを別プロセスで起動して計測
+    python bench_scoring_api.py --url http://127.0.0.1:8502 --requests 50000 --concurrency 32
+
+各クライアントスレッドは keep-alive の接続1本で、ランダムな回答を POST /v1/score に送り続ける。
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import random
+import socket
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+
+def _serve_synthetic(port, n_responses, ready):
+    """合成した全体データでAPIサーバを起動する（計測用の子プロセス）"""
+    import numpy as np
+
+    from aggregate_store import Aggregates
+    from scoring_api import PopulationCache, make_server
+    from survey import METRICS
+
+    rng = np.random.default_rng(0)
+    columns = {m: rng.integers(5, 26, n_responses).astype(float) for m in METRICS}
+    population = Aggregates().add_columns(columns, n_responses)
+    cache = PopulationCache(lambda: population)
+    cache.refresh()
+    server = make_server("127.0.0.1", port, cache)
+    ready.set()
+    server.serve_forever()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _client(host, port, n_requests, latencies, errors, seed):
+    rnd = random.Random(seed)
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    headers = {"Content-Type": "application/json"}
+    for _ in range(n_requests):
+        body = json.dumps({"answers": [rnd.randint(1, 5) for _ in range(20)]}).encode("utf-8")
+        start = time.perf_counter()
+        try:
+            conn.request("POST", "/v1/score", body, headers)
+            response = conn.getresponse()
+            response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=10)
+            ok = False
+        latencies.append(time.perf_counter() - start)
+        if not ok:
+            errors.append(1)
+    conn.close()
+
+
+def run(host, port, total, concurrency):
+    latencies, errors = [], []
+    per_client = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+    threads = [
+        threading.Thread(target=_client, args=(host, port, n, latencies, errors, i))
+        for i, n in enumerate(per_client)
+    ]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    def pct(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "seconds": elapsed,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": pct(0.50),
+        "p99_ms": pct(0.99),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="計測対象（未指定なら合成データのサーバを起動）")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--population", type=int, default=10000, help="合成サーバの回答者数")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.url:
+        parsed = urlparse(args.url)
+        host, port = parsed.hostname, parsed.port or 80
+    else:
+        host, port = "127.0.0.1", _free_port()
+        ready = multiprocessing.Event()
+        server = multiprocessing.Process(target=_serve_synthetic, args=(port, args.population, ready), daemon=True)
+        server.start()
+        if not ready.wait(30):
+            raise SystemExit("benchmark server did not start")
+    try:
+        result = run(host, port, args.requests, args.concurrency)
+    finally:
+        if server is not None:
+            server.terminate()
+    print(f"{result['requests']} requests ({result['errors']} errors) in {result['seconds']:.2f}s "
+          f"with {args.concurrency} connections: {result['rps']:.0f} req/s, "
+          f"p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms")
+    return 1 if result["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
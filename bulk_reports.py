@@ -0,0 +1,164 @@
+"""チーム全員分の結果画像（PNG / PDF / SVG）を一括生成する
+
+入力は CSV（1行1名）。id 列（任意。無ければ行番号）と、次のいずれかでスコアを与える。
+  - s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos（各指標の合計点）
+  - items（20問の回答の数字列。item_responses.encode_items 形式）
+  - q1〜q20（各設問の回答 1〜5）
+
+    python bulk_reports.py team.csv --out reports/               # ディレクトリに出力
+    python bulk_reports.py team.csv --out reports.zip --jobs 8   # zip にまとめる
+    python bulk_reports.py team.csv --out reports/ --format pdf
+    python bulk_reports.py team.csv --out reports/ --format png8      # パレットPNG（result_report の書き出しプロファイル）
+
+プロセスプールで並列に描画し、出力済みのファイルは飛ばすため、中断後に同じコマンドで再開できる。
+zip 出力の場合は <出力名>.parts/ に描画してから最後にまとめる。
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import os
+import re
+import shutil
+import sys
+import time
+import warnings
+import zipfile
+
+from item_responses import decode_items, metric_items
+from result_report import EXPORT_PROFILES
+from survey import METRICS, SCORE_MAX, SCORE_MIN
+
+# png 以外の書き出しプロファイルも指定できる（拡張子はプロファイルの形式）
+FORMATS = ("png", "pdf", "svg", *(p for p in EXPORT_PROFILES if p != "png"))
+
+
+def file_extension(image_format):
+    return EXPORT_PROFILES[image_format]["format"] if image_format in EXPORT_PROFILES else image_format
+
+
+def read_tasks(path):
+    """CSV を読み、(出力名, スコア dict) のリストを返す（不正な行は ValueError）"""
+    tasks = []
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            name = re.sub(r"[^\w.-]", "_", (row.get("id") or "").strip()) or f"{line - 1:05d}"
+            tasks.append((name, _row_scores(row, line)))
+    names = [name for name, _ in tasks]
+    if len(set(names)) != len(names):
+        raise ValueError("duplicate id values in input")
+    return tasks
+
+
+def _row_scores(row, line):
+    if all(row.get(m, "").strip() for m in METRICS):
+        scores = {m: int(row[m]) for m in METRICS}
+    else:
+        if row.get("items", "").strip():
+            codes = [row["items"].strip()]
+        else:
+            codes = ["".join(str(row.get(f"q{i}", "")).strip() for i in range(1, 21))]
+        matrix = decode_items(codes)
+        if not (matrix > 0).all():
+            raise ValueError(f"line {line}: needs scores, items or q1..q20 answers")
+        scores = {m: int(matrix[0, metric_items(m)].sum()) for m in METRICS}
+    for metric, value in scores.items():
+        if not SCORE_MIN <= value <= SCORE_MAX:
+            raise ValueError(f"line {line}: {metric}={value} is out of range")
+    return scores
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+    # 結果画像のレイアウトでは常に出る警告（app.py でも同じ）
+    warnings.filterwarnings("ignore", message="This figure includes Axes that are not compatible with tight_layout")
+
+
+def render_report(task):
+    """1名分の画像を out_path に書き出す（一時ファイルに書いてから置き換える）"""
+    out_path, image_format, scores = task
+    from result_report import generate_result_image_with_summary
+    from scoring import build_strategy_summary_en, summary_en
+    args = [scores[m] for m in METRICS]
+    future_en, past_en = summary_en(*args)
+    if image_format == "svg":
+        from svg_charts import render_result_card_svg
+        data = render_result_card_svg(*args, future_en, past_en, *build_strategy_summary_en(*args)).encode("utf-8")
+    elif image_format in EXPORT_PROFILES and image_format != "png":
+        data = generate_result_image_with_summary(*args, future_en, past_en, profile=image_format).getvalue()
+    else:
+        data = generate_result_image_with_summary(*args, future_en, past_en, image_format=image_format).getvalue()
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def _zip_directory(directory, zip_path):
+    """画像をまとめる（PNG / PDF は圧縮済みのため無圧縮で格納）"""
+    tmp_path = f"{zip_path}.tmp"
+    with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_STORED) as zf:
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".tmp"):
+                zf.write(os.path.join(directory, name), arcname=name)
+    os.replace(tmp_path, zip_path)
+
+
+def generate(tasks, out_dir, image_format="png", jobs=None, progress=sys.stderr):
+    """未出力の分だけ並列に描画し、(描画件数, 秒数, ワーカー数) を返す"""
+    os.makedirs(out_dir, exist_ok=True)
+    ext = file_extension(image_format)
+    pending = [
+        (os.path.join(out_dir, f"{name}.{ext}"), image_format, scores)
+        for name, scores in tasks
+        if not os.path.exists(os.path.join(out_dir, f"{name}.{ext}"))
+    ]
+    skipped = len(tasks) - len(pending)
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(pending) or 1))
+    started = time.perf_counter()
+    done = 0
+    if pending:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+            for _ in pool.map(render_report, pending, chunksize=max(1, min(16, len(pending) // (jobs * 4)))):
+                done += 1
+                if progress is not None and (done == len(pending) or done % 10 == 0):
+                    elapsed = time.perf_counter() - started
+                    print(f"\r{skipped + done}/{len(tasks)}  {done / elapsed:.1f} reports/s", end="",
+                          file=progress, flush=True)
+        if progress is not None:
+            print(file=progress)
+    return done, time.perf_counter() - started, jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="スコアまたは設問回答の CSV")
+    parser.add_argument("--out", required=True, help="出力先ディレクトリ、または .zip のパス")
+    parser.add_argument("--format", choices=FORMATS, default="png")
+    parser.add_argument("--jobs", type=int, default=None, help="ワーカープロセス数（既定: CPU数）")
+    args = parser.parse_args(argv)
+
+    try:
+        tasks = read_tasks(args.input)
+    except ValueError as e:
+        raise SystemExit(f"invalid input: {e}")
+    as_zip = args.out.lower().endswith(".zip")
+    out_dir = f"{args.out}.parts" if as_zip else args.out
+
+    done, elapsed, jobs = generate(tasks, out_dir, args.format, args.jobs)
+    if done:
+        rate = done / elapsed
+        print(f"rendered {done} report(s) in {elapsed:.1f}s with {jobs} worker(s): "
+              f"{rate:.1f} reports/s, {rate / jobs:.2f} reports/s/core")
+    else:
+        print("all reports already rendered")
+    if as_zip:
+        _zip_directory(out_dir, args.out)
+        shutil.rmtree(out_dir)
+        print(f"wrote {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
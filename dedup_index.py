@@ -0,0 +1,131 @@
+"""回答送信の重複排除（冪等キーのインデックス）
+
+ボタンの二度押しやブラウザの再送で同じ回答が複数回 append_row されないように、送信ごとの
+冪等キー（セッションとフォームの内容から作る16バイトのダイジェスト）を期限付きで記録する。
+期限内に同じキーが来たら Sheets にアクセスせずに打ち切る。
+
+メモリ上は {キー: 期限} の dict（挿入順＝期限順なので、先頭から期限切れを捨てる）。
+path を指定すると、固定長レコード（キー16バイト＋期限8バイト）の追記ログにも書き、
+再起動後や同じホストの他プロセスが記録したキーも参照する（追記・読み込みは flock で直列化）。
+ログは有効なキーの数に比べて十分に長くなったら書き直す。
+"""
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import os
+import struct
+import threading
+import time
+
+RECORD = struct.Struct("<16sd")
+DEFAULT_TTL = 600.0
+DEFAULT_MAX_ENTRIES = 100_000
+COMPACT_MIN_RECORDS = 4096
+
+
+def submission_key(*parts):
+    """送信内容から冪等キー（16バイト）を作る"""
+    return hashlib.blake2b("\x1f".join(str(p) for p in parts).encode("utf-8"), digest_size=16).digest()
+
+
+class DedupIndex:
+    """期限付きの冪等キー集合"""
+
+    def __init__(self, ttl=DEFAULT_TTL, path=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.path = path
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._offset = 0
+        self._inode = None
+        self._records = 0  # ログのレコード数（書き直しの判定用）
+
+    def _evict(self, now):
+        entries = self._entries
+        while entries:
+            key = next(iter(entries))
+            if entries[key] > now and len(entries) <= self.max_entries:
+                break
+            del entries[key]
+
+    def _apply(self, key, expires_at):
+        self._entries.pop(key, None)  # 期限を延ばしたキーは末尾へ（挿入順＝期限順を保つ）
+        if expires_at > 0:
+            self._entries[key] = expires_at
+
+    def _sync(self, f):
+        """ログの未読部分（他プロセスの追記）を取り込む。書き直されていれば最初から読む"""
+        inode = os.fstat(f.fileno()).st_ino
+        if inode != self._inode:
+            self._inode, self._offset, self._records = inode, 0, 0
+        f.seek(self._offset)
+        data = f.read()
+        usable = len(data) - len(data) % RECORD.size
+        for key, expires_at in RECORD.iter_unpack(data[:usable]):
+            self._apply(key, expires_at)
+        self._offset += usable
+        self._records += usable // RECORD.size
+
+    @contextmanager
+    def _log(self):
+        """ログを排他ロックして未読部分を取り込む（path 未指定なら何もしない）"""
+        if self.path is None:
+            yield None
+            return
+        while True:
+            f = open(self.path, "a+b")
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                same = os.stat(self.path).st_ino == os.fstat(f.fileno()).st_ino
+            except FileNotFoundError:
+                same = False
+            if same:
+                break
+            f.close()  # ロック待ちの間に書き直された
+        try:
+            self._sync(f)
+            yield f
+        finally:
+            f.close()
+
+    def _append(self, f, key, expires_at):
+        f.seek(0, os.SEEK_END)
+        f.write(RECORD.pack(key, expires_at))
+        f.flush()
+        self._offset = f.tell()
+        self._records += 1
+
+    def _compact(self):
+        """有効なキーだけのログに書き直す（他プロセスは inode の変化で読み直す）"""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as tmp:
+            tmp.write(b"".join(RECORD.pack(k, e) for k, e in self._entries.items()))
+        os.replace(tmp_path, self.path)
+        self._inode = os.stat(self.path).st_ino
+        self._offset = len(self._entries) * RECORD.size
+        self._records = len(self._entries)
+
+    def claim(self, key, now=None):
+        """未記録（または期限切れ）のキーなら記録して True、期限内の重複なら False"""
+        now = time.time() if now is None else now
+        with self._lock, self._log() as f:
+            self._evict(now)
+            if self._entries.get(key, 0) > now:
+                return False
+            self._apply(key, now + self.ttl)
+            if f is not None:
+                self._append(f, key, now + self.ttl)
+                if self._records >= max(COMPACT_MIN_RECORDS, 2 * len(self._entries)):
+                    self._compact()
+            return True
+
+    def release(self, key):
+        """保存に失敗した送信のキーを取り消し、再送を受け付ける"""
+        with self._lock, self._log() as f:
+            self._apply(key, 0.0)
+            if f is not None:
+                self._append(f, key, 0.0)
+
+    def __len__(self):
+        return len(self._entries)
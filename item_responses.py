@@ -0,0 +1,71 @@
+"""設問ごとの回答（q1〜q20）の圧縮表現と項目分析
+
+20問の回答（各1〜5）を設問順に並べた20文字の数字列（例: "34512..."）として1セルに保存する。
+3ビット×20問を1つの整数に詰めると60ビットになり、Sheets の数値（倍精度、53ビット）では
+保持できないため文字列にしている。デコードは文字列をまとめてバイト列にし、NumPy で
+(回答数, 20) の int8 行列に一括変換する（欠損・不正な行は 0）。
+"""
+import numpy as np
+
+from survey import ITEMS_PER_METRIC, METRICS
+
+N_ITEMS = len(METRICS) * ITEMS_PER_METRIC
+ITEM_MIN, ITEM_MAX = 1, 5
+
+
+def encode_items(answers):
+    """設問順の回答（1〜5 の整数×20）を数字列に変換"""
+    answers = [int(a) for a in answers]
+    if len(answers) != N_ITEMS or not all(ITEM_MIN <= a <= ITEM_MAX for a in answers):
+        raise ValueError(f"expected {N_ITEMS} answers in {ITEM_MIN}..{ITEM_MAX}")
+    return "".join(map(str, answers))
+
+
+def decode_items(codes):
+    """数字列の配列を (回答数, 20) の int8 行列に変換（長さ・文字が不正な行は全て 0）"""
+    codes = [str(c) if c is not None else "" for c in codes]
+    matrix = np.zeros((len(codes), N_ITEMS), dtype=np.int8)
+    valid = np.fromiter((len(c) == N_ITEMS and c.isascii() for c in codes), dtype=bool, count=len(codes))
+    if not valid.any():
+        return matrix
+    raw = "".join(c for c, ok in zip(codes, valid) if ok).encode("ascii")
+    digits = np.frombuffer(raw, dtype=np.uint8).reshape(-1, N_ITEMS).astype(np.int8) - ord("0")
+    in_range = ((digits >= ITEM_MIN) & (digits <= ITEM_MAX)).all(axis=1)
+    digits[~in_range] = 0
+    matrix[valid] = digits
+    return matrix
+
+
+def metric_items(metric):
+    """指標に対応する設問の列範囲（slice）"""
+    i = METRICS.index(metric)
+    return slice(i * ITEMS_PER_METRIC, (i + 1) * ITEMS_PER_METRIC)
+
+
+def subscale_scores(matrix):
+    """項目行列から指標ごとの合計点 {指標: 配列} を再計算（欠損を含む行は NaN）"""
+    complete = (matrix > 0).all(axis=1)
+    scores = {}
+    for metric in METRICS:
+        total = matrix[:, metric_items(metric)].sum(axis=1, dtype=np.int64).astype(float)
+        total[~complete] = np.nan
+        scores[metric] = total
+    return scores
+
+
+def cronbach_alpha(items):
+    """(回答数, 項目数) の行列から Cronbach の α を計算（欠損を含む行は除く。2行未満は None）"""
+    items = np.asarray(items, dtype=float)
+    items = items[(items > 0).all(axis=1)]
+    n, k = items.shape
+    if n < 2 or k < 2:
+        return None
+    total_var = items.sum(axis=1).var(ddof=1)
+    if total_var == 0:
+        return None
+    return k / (k - 1) * (1 - items.var(axis=0, ddof=1).sum() / total_var)
+
+
+def alpha_by_metric(matrix):
+    """指標ごとの Cronbach の α {指標: α}"""
+    return {metric: cronbach_alpha(matrix[:, metric_items(metric)]) for metric in METRICS}
@@ -0,0 +1,66 @@
+"""重量級モジュールの遅延インポートと読み込み時間の記録
+
+matplotlib / pandas / numpy / gspread などは、実際に属性へアクセスされた時点で
+初めてインポートする。フォームだけを表示する初回描画ではこれらを読み込まない。
+"""
+import importlib
+import sys
+import threading
+import time
+
+# 実際にインポートしたモジュール名 -> 読み込み時間（秒）
+IMPORT_TIMES = {}
+_lock = threading.RLock()
+
+
+class LazyModule:
+    """属性アクセス時に初めてモジュールをインポートするプロキシ"""
+
+    def __init__(self, name, on_load=None):
+        self.__dict__["_name"] = name
+        self.__dict__["_on_load"] = on_load
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is not None:
+            return module
+        with _lock:
+            module = self.__dict__["_module"]
+            if module is None:
+                name = self.__dict__["_name"]
+                already_loaded = name in sys.modules
+                start = time.perf_counter()
+                module = importlib.import_module(name)
+                if not already_loaded:
+                    IMPORT_TIMES.setdefault(name, time.perf_counter() - start)
+                self.__dict__["_module"] = module
+                on_load = self.__dict__["_on_load"]
+                if on_load is not None:
+                    on_load(module)
+        return module
+
+    @property
+    def is_loaded(self):
+        return self.__dict__["_module"] is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = "loaded" if self.is_loaded else "not loaded"
+        return f"<LazyModule {self.__dict__['_name']} ({state})>"
+
+
+def lazy_import(name, on_load=None):
+    """遅延インポート用のプロキシを返す（on_loadは初回読み込み直後に1度だけ呼ばれる）"""
+    return LazyModule(name, on_load=on_load)
+
+
+def import_report():
+    """読み込み済みモジュールを時間の長い順に [(name, seconds), ...] で返す"""
+    with _lock:
+        return sorted(IMPORT_TIMES.items(), key=lambda kv: kv[1], reverse=True)
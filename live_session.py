@@ -0,0 +1,130 @@
+"""ワークショップ用：セッションコードごとの回答を差分取得して集計する
+
+ワークシートの「次に読む行」（カーソル）を覚えておき、ポーリングのたびにカーソル以降の
+範囲だけを取得して、セッションコードが一致する行を手元の Aggregates に畳み込む。
+定常時の1回のポーリングは get_values 1回（新しい行だけ）で済み、シート全体の行数に依存しない。
+途中の空行のまとまりは、ワークシートの行数（row_count）まで読み進めて飛ばす。
+ワークシート分割（sharding）時は現在のシャードを追いかける。
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from aggregate_store import Aggregates
+from sheet_reader import DEFAULT_CHUNK_ROWS, chunk_columns, iter_row_ranges
+from sheets_storage import gspread, normalize_session_code
+
+# まだ無いワークシート（最初の回答前のシャード）を探し直す間隔
+MISSING_RECHECK = timedelta(seconds=60)
+
+
+def select_rows(columns, mask):
+    """列ごとの配列 {列名: 配列} から mask の行だけを取り出す"""
+    return {
+        name: values[mask] if isinstance(values, np.ndarray) else [v for v, keep in zip(values, mask) if keep]
+        for name, values in columns.items()
+    }
+
+
+class SheetTail:
+    """1つのワークシートの読み込み位置"""
+
+    def __init__(self):
+        self.header = None
+        self.cursor = 2  # 次に読む行（1行目はヘッダ）
+
+    def poll(self, ws, chunk_rows):
+        """カーソル以降の行を (header, rows) のリストで返し、カーソルを進める"""
+        # 旧形式のヘッダ（session 列なし）は、新形式の追記で拡張されるまで読み直す
+        if self.header is None or "session" not in self.header:
+            self.header = ws.row_values(1)
+            if "session" not in self.header:
+                return []
+        chunks = []
+        # 途中の空行のまとまりはシートの行数まで読み飛ばす。カーソルは最後に読めた行の次に置く
+        # （末尾の空行には次の回答が追記されるため、その手前で止める）
+        for first_row, header, rows in iter_row_ranges(ws, chunk_rows, self.header, self.cursor):
+            chunks.append((header, rows))
+            self.cursor = first_row + len(rows)
+        return chunks
+
+
+class SessionFeed:
+    """セッションの回答を差分ポーリングで集計する
+
+    sh はスプレッドシート、worksheet_name は回答保存先。policy（sharding.ShardPolicy）を渡すと
+    現在のシャードを追う。開いたワークシートは保持し、ポーリングごとにメタデータを取得しない。
+    """
+
+    def __init__(self, session, sh, worksheet_name, policy=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        self.session = normalize_session_code(session)
+        if not self.session:
+            raise ValueError(f"invalid session code: {session!r}")
+        self.sh = sh
+        self.worksheet_name = worksheet_name
+        self.policy = policy
+        self.chunk_rows = chunk_rows
+        self.aggregates = Aggregates()
+        self.tails = {}  # ワークシート名 -> SheetTail
+        self._finished = set()  # 追記されなくなったワークシート（最後に1回読んだもの）
+        self._worksheets = {}
+        self._missing = {}  # 見つからなかったワークシート名 -> 次に探す時刻
+        self._current = None  # rows モードで追っているシャード名
+        self.polls = 0
+        self.updated_at = None
+
+    def _target_names(self, now):
+        """このポーリングで読むワークシート名（現在のシャードと、切り替わった直後の旧シャード）"""
+        if self.policy is None:
+            return [self.worksheet_name]
+        if self.policy.mode == "monthly":
+            current = self.policy.monthly_name(now.strftime("%Y-%m-%d %H:%M:%S"))
+        elif self._current is None:
+            # 初回のみ一覧を取得して最新のシャードを探す（まだ無ければ作成されるまで名前で探す）
+            titles = [ws.title for ws in self.sh.worksheets()]
+            shards = self.policy.shard_names(titles)
+            current = self._current = shards[-1] if shards else self.policy.rows_name(1)
+        else:
+            current = self._current
+            tail = self.tails.get(current)
+            if tail is not None and tail.cursor - 2 >= self.policy.shard_rows:
+                current = self._current = self.policy.rows_name(int(current[-5:]) + 1)
+        names = [current]
+        for name in self.tails:
+            if name != current and name not in self._finished:
+                # 切り替え前に追記された行を読み切るため、旧シャードは最後に1回だけ読む
+                names.insert(0, name)
+                self._finished.add(name)
+        return names
+
+    def _worksheet(self, name, now):
+        if name not in self._worksheets:
+            # 見つからなかったワークシートは MISSING_RECHECK の間は探さない（ポーリングごとの取得を省く）
+            if name in self._missing and now < self._missing[name]:
+                return None
+            try:
+                self._worksheets[name] = self.sh.worksheet(name)
+            except gspread.exceptions.WorksheetNotFound:
+                self._missing[name] = now + MISSING_RECHECK
+                return None
+            self._missing.pop(name, None)
+        return self._worksheets[name]
+
+    def poll(self, now=None):
+        """新しい行を取得して集計に加え、このセッションの新しい回答数を返す"""
+        now = now or datetime.now()
+        added = 0
+        for name in self._target_names(now):
+            ws = self._worksheet(name, now)
+            if ws is None:
+                continue
+            tail = self.tails.setdefault(name, SheetTail())
+            for header, rows in tail.poll(ws, self.chunk_rows):
+                columns, _ = chunk_columns(header, rows)
+                mask = np.array([normalize_session_code(s) == self.session for s in columns["session"]], dtype=bool)
+                if mask.any():
+                    self.aggregates.add_columns(select_rows(columns, mask), int(mask.sum()))
+                    added += int(mask.sum())
+        self.polls += 1
+        self.updated_at = now
+        return added
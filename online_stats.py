@@ -0,0 +1,145 @@
+"""4指標のオンライン統計量（平均・分散・相関、職位別）
+
+Welford 法を多変量・職位別に拡張したもの。職位ごとに件数 n、平均ベクトル、偏差積和行列
+（co-moment: Σ(x-平均)(x-平均)ᵀ）を持つ。1件の追加は O(1) で、チャンクや別の集計との
+合成は Chan らの並列公式で行う。生データを読み直さずに分散・相関をいつでも計算できる。
+4指標すべてが有効な回答だけを対象にする。
+"""
+import threading
+
+import numpy as np
+
+from survey import METRICS, N_GRADES, grade_index
+
+N_METRICS = len(METRICS)
+
+
+def combine(n_a, mean_a, m2_a, n_b, mean_b, m2_b):
+    """2つの集合の (件数, 平均, 偏差積和) を合成する（先頭の軸は職位などのバッチ軸でもよい）"""
+    n = n_a + n_b
+    safe = np.where(n > 0, n, 1).astype(float)
+    delta = mean_b - mean_a
+    mean = mean_a + delta * (n_b / safe)[..., None]
+    m2 = m2_a + m2_b + delta[..., :, None] * delta[..., None, :] * (n_a * n_b / safe)[..., None, None]
+    return n, mean, m2
+
+
+class Moments:
+    """1集団の件数・平均・偏差積和"""
+
+    def __init__(self, n=0, mean=None, comoment=None):
+        self.n = int(n)
+        self.mean = np.zeros(N_METRICS) if mean is None else np.asarray(mean, dtype=float)
+        self.comoment = np.zeros((N_METRICS, N_METRICS)) if comoment is None else np.asarray(comoment, dtype=float)
+
+    def covariance(self, ddof=1):
+        if self.n <= ddof:
+            return np.full((N_METRICS, N_METRICS), np.nan)
+        return self.comoment / (self.n - ddof)
+
+    def variance(self, ddof=1):
+        return np.diag(self.covariance(ddof)).copy()
+
+    def std(self, ddof=1):
+        return np.sqrt(self.variance(ddof))
+
+    def correlation(self):
+        """指標間の相関係数行列（分散0の指標は NaN）"""
+        sd = np.sqrt(np.diag(self.comoment))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.comoment / np.outer(sd, sd)
+
+
+class GradeMoments:
+    """職位ごとの Moments をまとめた配列（n: (職位,), mean: (職位,4), comoment: (職位,4,4)）"""
+
+    def __init__(self, n=None, mean=None, comoment=None):
+        self.n = np.zeros(N_GRADES, dtype=np.int64) if n is None else n
+        self.mean = np.zeros((N_GRADES, N_METRICS)) if mean is None else mean
+        self.comoment = np.zeros((N_GRADES, N_METRICS, N_METRICS)) if comoment is None else comoment
+
+    def copy(self):
+        return GradeMoments(self.n.copy(), self.mean.copy(), self.comoment.copy())
+
+    def add(self, grade, x):
+        """1件の回答（職位添字, 4指標の値）を加算する（Welford 更新, O(1)）"""
+        x = np.asarray(x, dtype=float)
+        n = self.n[grade] + 1
+        delta = x - self.mean[grade]
+        self.mean[grade] += delta / n
+        self.comoment[grade] += np.outer(delta, delta) * ((n - 1) / n)
+        self.n[grade] = n
+        return self
+
+    def add_rows(self, grades, values):
+        """職位添字の配列と (行数, 4) の値を加算する（欠損を含む行は除く）"""
+        values = np.asarray(values, dtype=float).reshape(-1, N_METRICS)
+        ok = np.isfinite(values).all(axis=1)
+        grades, values = np.asarray(grades)[ok], values[ok]
+        if len(values) == 1:
+            return self.add(int(grades[0]), values[0])
+        if len(values) == 0:
+            return self
+        batch = GradeMoments()
+        for g in np.unique(grades):
+            x = values[grades == g]
+            batch.n[g] = len(x)
+            batch.mean[g] = x.mean(axis=0)
+            d = x - batch.mean[g]
+            batch.comoment[g] = d.T @ d
+        return self.merge(batch)
+
+    def merge(self, other):
+        """別の集計（同じ職位区分）を合成する"""
+        n, mean, m2 = combine(self.n, self.mean, self.comoment, other.n, other.mean, other.comoment)
+        self.n[...] = n
+        self.mean[...] = mean
+        self.comoment[...] = m2
+        return self
+
+    def grade(self, g):
+        return Moments(self.n[g], self.mean[g].copy(), self.comoment[g].copy())
+
+    def pooled(self):
+        """全職位を合成した Moments"""
+        n, mean, m2 = 0, np.zeros(N_METRICS), np.zeros((N_METRICS, N_METRICS))
+        for g in range(N_GRADES):
+            n, mean, m2 = combine(np.int64(n), mean, m2, self.n[g], self.mean[g], self.comoment[g])
+        return Moments(n, mean, m2)
+
+
+class LiveStats:
+    """プロセス内で最新に保つ職位別統計量
+
+    集計ファイルや Sheets から得た集計を基準にし（rebase）、以降の保存は1件ずつ O(1) で加算する。
+    複数スレッド（Streamlit のセッション）から共有される。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._moments = None
+        self._version = None
+        self.updated_at = None
+
+    def rebase(self, moments, version=None, updated_at=None):
+        """基準の集計を差し替える（version を指定した場合は、より新しいときのみ）"""
+        with self._lock:
+            if version is not None and self._version is not None and version <= self._version:
+                return False
+            self._moments = moments.copy()
+            self._version = version
+            self.updated_at = updated_at
+            return True
+
+    def add_response(self, row):
+        """保存できた1件の回答（dict）を加算する（基準が未設定なら何もしない）"""
+        values = np.array([row.get(m) for m in METRICS], dtype=float)
+        with self._lock:
+            if self._moments is None:
+                return
+            self._moments.add_rows(np.array([grade_index(row.get("grade", ""))]), values.reshape(1, -1))
+
+    def snapshot(self):
+        """現在の統計量のコピー（基準が未設定なら None）"""
+        with self._lock:
+            return None if self._moments is None else self._moments.copy()
@@ -0,0 +1,213 @@
+"""分析用の Parquet エクスポート（月・職位で分割、差分のみ取得）
+
+アナリストが回答シートを直接開く代わりに、型付きの列で書き出した Parquet を読めるようにする。
+アプリと Sheets の呼び出し枠を奪い合わないよう、前回から追記された行だけを取得する。
+
+    python parquet_export.py --out /data/tpt_parquet            # 前回の続きから書き出す
+    python parquet_export.py --out /data/tpt_parquet --full     # 全行を書き出し直す
+    python parquet_export.py --out /data/tpt_parquet --tenant sales
+
+出力は month=YYYY-MM/grade=<職位>/ の Hive 形式のディレクトリ（pyarrow が必要）。
+
+    pd.read_parquet("/data/tpt_parquet", filters=[("month", ">=", "2026-01")])
+    duckdb: SELECT grade, avg(s_exp_int) FROM read_parquet('/data/tpt_parquet/**/*.parquet',
+            hive_partitioning = true) GROUP BY grade
+
+列: timestamp（timestamp[s]）、4指標（int8）、q1〜q20（int8。設問回答の無い行は null）、
+qset・session・sheet（辞書エンコードの文字列）、row（シートの行番号）。grade は空欄を「回答しない」、
+一覧に無い職位を「その他」にまとめた区分で、month と同じくディレクトリ名になる（読み込み時はカテゴリ列）。
+
+ワークシートごとの書き出し済みの行番号と、その行の timestamp（高水位）を <out>/_export_state.json に持つ。
+次回はその行の timestamp が一致することを確かめてから、後ろの行だけを chunk_rows 行ずつ取得する
+（一致しなければシートが書き換えられたとみなし、--full での書き出し直しを求める）。
+ファイル名はワークシートと開始行から決まるため、中断後に実行し直しても同じファイルを上書きするだけで
+行は重複しない。パーティション内のファイルが max_files を超えたら1つにまとめる。
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+import numpy as np
+
+import sharding
+import sheet_reader
+import sheets_storage
+from item_responses import N_ITEMS, decode_items
+from survey import GRADES, METRICS, grade_index
+
+STATE_FILE = "_export_state.json"
+PARTITIONS = ["month", "grade"]
+DEFAULT_MAX_FILES = 16
+# grade_index の区分（末尾は一覧に無い職位）
+GRADE_LABELS = GRADES + ["その他"]
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise SystemExit("parquet export requires pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def chunk_table(header, rows, sheet, first_row):
+    """シートの行を型付きの Arrow テーブルに変換（日時の無い行は除く）"""
+    pa = _pyarrow()
+    columns, _ = sheet_reader.chunk_columns(header, rows)
+    n_rows = len(rows)
+    timestamps = columns.get("timestamp", np.full(n_rows, np.datetime64("NaT"), dtype="datetime64[s]"))
+    keep = ~np.isnat(timestamps)
+    data = {
+        "timestamp": pa.array(timestamps[keep], type=pa.timestamp("s")),
+        "month": pa.array(np.datetime_as_string(timestamps[keep], unit="M")).dictionary_encode(),
+        "grade": pa.array([GRADE_LABELS[grade_index(g)] for g, k in
+                           zip(columns.get("grade", [""] * n_rows), keep) if k]).dictionary_encode(),
+    }
+    for metric in METRICS:
+        values = columns.get(metric, np.full(n_rows, np.nan))[keep]
+        ok = np.isfinite(values)
+        data[metric] = pa.array(np.where(ok, values, 0).astype(np.int8), mask=~ok)
+    items = decode_items(columns.get("items", [""] * n_rows))[keep]
+    answered = (items > 0).all(axis=1)
+    for i in range(N_ITEMS):
+        data[f"q{i + 1}"] = pa.array(items[:, i], mask=~answered)
+    for name in ("qset", "session"):
+        data[name] = pa.array([v for v, k in zip(columns.get(name, [""] * n_rows), keep) if k]).dictionary_encode()
+    data["sheet"] = pa.array([sheet] * int(keep.sum())).dictionary_encode()
+    data["row"] = pa.array((first_row + np.flatnonzero(keep)).astype(np.int32))
+    return pa.table(data)
+
+
+def _partitioning():
+    pa = _pyarrow()
+    schema = pa.schema([(name, pa.dictionary(pa.int32(), pa.string())) for name in PARTITIONS])
+    return pa.dataset.partitioning(schema, flavor="hive")
+
+
+def write_chunk(table, out_dir, sheet, first_row):
+    """パーティションごとに part-<シート>-<開始行>-<i>.parquet を書く（同じ範囲の書き直しは上書き）"""
+    pa = _pyarrow()
+    safe = re.sub(r"[^\w-]", "_", sheet)
+    pa.dataset.write_dataset(
+        table, out_dir, format="parquet", partitioning=_partitioning(),
+        basename_template=f"part-{safe}-{first_row:09d}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def compact_partitions(out_dir, max_files=DEFAULT_MAX_FILES):
+    """ファイルが max_files を超えたパーティションを1ファイルにまとめ、まとめた数を返す"""
+    pa = _pyarrow()
+    compacted = 0
+    for directory, _, files in os.walk(out_dir):
+        parts = sorted(f for f in files if f.endswith(".parquet"))
+        if len(parts) <= max_files:
+            continue
+        table = pa.parquet.read_table([os.path.join(directory, f) for f in parts])
+        tmp_path = os.path.join(directory, "compacted.parquet.tmp")
+        pa.parquet.write_table(table, tmp_path)
+        # 先頭のファイル名で置き換える（後続の差分の書き出しと名前が衝突しない）
+        os.replace(tmp_path, os.path.join(directory, parts[0]))
+        for name in parts[1:]:
+            os.remove(os.path.join(directory, name))
+        compacted += 1
+    return compacted
+
+
+class ExportState:
+    """ワークシートごとの書き出し済みの行番号と、その行の timestamp"""
+
+    def __init__(self, out_dir):
+        self.path = os.path.join(out_dir, STATE_FILE)
+        self.sheets = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                self.sheets = json.load(f)["sheets"]
+
+    @property
+    def high_water(self):
+        stamps = [s["timestamp"] for s in self.sheets.values() if s.get("timestamp")]
+        return max(stamps) if stamps else None
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"sheets": self.sheets, "high_water": self.high_water}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+def _check_cursor(ws, cursor):
+    """前回の最終行の timestamp が変わっていないか"""
+    if cursor["row"] < 2:
+        return True
+    rows = sheet_reader.get_rows(ws, f"A{cursor['row']}:A{cursor['row']}")
+    return (rows[0][0] if rows and rows[0] else "") == cursor["timestamp"]
+
+
+def export(worksheets, out_dir, state, chunk_rows=sheet_reader.DEFAULT_CHUNK_ROWS, log=sys.stderr):
+    """各ワークシートの未書き出しの行を書き出し、書き出した行数を返す"""
+    exported = 0
+    for ws in worksheets:
+        cursor = state.sheets.get(ws.title, {"row": 1, "timestamp": ""})
+        if not _check_cursor(ws, cursor):
+            raise SystemExit(f"{ws.title}: row {cursor['row']} no longer holds {cursor['timestamp']!r}; "
+                             f"the sheet was rewritten, re-run with --full")
+        for first_row, header, rows in sheet_reader.iter_row_ranges(ws, chunk_rows, start=cursor["row"] + 1):
+            table = chunk_table(header, rows, ws.title, first_row)
+            if table.num_rows:
+                write_chunk(table, out_dir, ws.title, first_row)
+            last = rows[-1][0] if rows[-1] else ""
+            state.sheets[ws.title] = cursor = {"row": first_row + len(rows) - 1, "timestamp": last}
+            state.save()
+            exported += table.num_rows
+            print(f"{ws.title}: rows up to {cursor['row']} exported", file=log, flush=True)
+    return exported
+
+
+def response_worksheets(secrets):
+    """回答のワークシート（分割時は全シャード）"""
+    app = secrets["app"]
+    gc = sheets_storage.client_from_secrets(secrets)
+    policy = sharding.policy_from_settings(app)
+    if policy is None:
+        return [sheets_storage.open_response_worksheet_from_secrets(gc, secrets)]
+    sh = gc.open_by_url(app["spreadsheet_url"])
+    titles = [ws.title for ws in sh.worksheets()]
+    return [sh.worksheet(name) for name in policy.shard_names(titles)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, help="出力先ディレクトリ")
+    parser.add_argument("--secrets", default=None, help="secrets.toml のパス（既定: .streamlit/secrets.toml）")
+    parser.add_argument("--tenant", default=None, help="書き出すテナント（secrets の [tenants.<id>]。既定: [app]）")
+    parser.add_argument("--full", action="store_true", help="出力を削除して全行を書き出し直す")
+    parser.add_argument("--max-files", type=int, default=DEFAULT_MAX_FILES,
+                        help="パーティションあたりのファイル数の上限（超えたら1つにまとめる）")
+    args = parser.parse_args(argv)
+
+    _pyarrow()
+    from tenants import tenant_secrets
+    secrets = tenant_secrets(sheets_storage.load_secrets(args.secrets), args.tenant)
+    if args.full and os.path.isdir(args.out):
+        shutil.rmtree(args.out)
+    os.makedirs(args.out, exist_ok=True)
+    state = ExportState(args.out)
+    chunk_rows = int(secrets["app"].get("sheet_chunk_rows", sheet_reader.DEFAULT_CHUNK_ROWS))
+
+    started = time.perf_counter()
+    exported = export(response_worksheets(secrets), args.out, state, chunk_rows)
+    compacted = compact_partitions(args.out, args.max_files)
+    print(f"{exported} row(s) exported in {time.perf_counter() - started:.1f}s "
+          f"(high-water mark {state.high_water or '-'}; {compacted} partition(s) compacted)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
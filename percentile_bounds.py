@@ -0,0 +1,42 @@
+"""パーセンタイルの信頼区間（ヒストグラムからのブートストラップ）
+
+回答者が少ないうちは「あなたより低いスコアの割合」が見かけほど確かではないため、
+指標ごとのヒストグラム（4×21）を多項分布で再抽出するブートストラップで区間を付ける。
+生の回答は使わない。あなたのスコアより低いビンの件数は、再抽出した21ビンのうち
+その範囲の合計なので、多項分布の周辺分布である二項分布 Binomial(n, 低いビンの割合) から
+直接引ける（21ビンを引くのと同じ分布で、計算量は回答者数によらず 再抽出回数×指標数）。
+
+再抽出では全員があなたより低い（または高い）ときに区間の幅が 0 になるため、
+その場合は正確な二項区間（Clopper–Pearson）の閉形式 1-(α/2)^(1/n) を使う。
+同じヒストグラムには同じ区間を返すよう、乱数の種は固定する。
+"""
+import numpy as np
+
+from survey import SCORE_BINS, SCORE_MIN
+
+DEFAULT_LEVEL = 0.95
+DEFAULT_RESAMPLES = 2000
+
+
+def below_counts(hist, values):
+    """指標ごとの、values より低いスコアの件数（hist は (指標, 21)、values は (指標,)）"""
+    hist = np.asarray(hist, dtype=np.int64)
+    cut = np.clip(np.ceil(np.asarray(values, dtype=float)) - SCORE_MIN, 0, SCORE_BINS).astype(int)
+    return (hist * (np.arange(SCORE_BINS) < cut[:, None])).sum(axis=1)
+
+
+def percentile_intervals(hist, values, level=DEFAULT_LEVEL, resamples=DEFAULT_RESAMPLES, seed=0):
+    """指標ごとのパーセンタイルの (下限, 上限)（%）を (指標, 2) の配列で返す（回答0件の指標は NaN）"""
+    hist = np.asarray(hist, dtype=np.int64)
+    n = hist.sum(axis=1)
+    below = below_counts(hist, values)
+    safe_n = np.maximum(n, 1)
+    alpha = (1 - level) / 2
+    rng = np.random.default_rng(seed)
+    draws = rng.binomial(n, below / safe_n, size=(resamples, len(n))) / safe_n
+    bounds = np.quantile(draws, [alpha, 1 - alpha], axis=0).T
+    edge = alpha ** (1 / safe_n)
+    bounds[:, 1] = np.where(below == 0, 1 - edge, bounds[:, 1])
+    bounds[:, 0] = np.where(below == n, edge, bounds[:, 0])
+    bounds[n == 0] = np.nan
+    return bounds * 100
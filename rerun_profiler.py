@@ -0,0 +1,226 @@
+"""再実行ごとのサンプリングプロファイラ（speedscope / flamegraph 出力）
+
+app.py の1回の再実行（スクリプトの実行）の間、別スレッドから一定間隔でスクリプトのスレッドの
+スタック（sys._current_frames）を記録する。関数の呼び出しごとに計測する cProfile と違い、
+スクリプト側には何も差し込まないため、間隔 5ms でもオーバーヘッドは数%以下に収まる。
+スクリプトのフレーム（<module>）がスタックから消えた時点（st.stop() や例外で終わった場合を含む）で
+記録を終え、サンプリングのスレッドで次の2つを書き出す。
+
+    <dir>/<日時>-<経路>-<pid>-<連番>.speedscope.json   # https://www.speedscope.app で開く
+    <dir>/<日時>-<経路>-<pid>-<連番>.folded            # flamegraph.pl / inferno 用の折り畳みスタック
+
+経路（submit / restore / download / admin / live / form）はアプリが実行中に tag で付ける。
+結果画像のダウンロードは、ボタンのクリックで始まる再実行を download とする。
+ファイル数が max_files を超えたら古いものから消す。
+
+profile_sample_rate（再実行のうち計測する割合。既定 0 で無効）を指定するか、
+?profile=<admin_token> を付けて開くと有効になる（後者はその URL のままの再実行をすべて計測する）。
+保存先は profile_dir（既定: 一時ディレクトリの tpt_profiles）、間隔は profile_interval_ms（既定 5）。
+
+    APP_PROFILE_DIR=/var/tmp/tpt_profiles APP_PROFILE_SAMPLE_RATE=0.05 streamlit run app.py
+
+プロセスをまたいだ集計（経路ごとの自己時間・累積時間の上位 N 関数）:
+
+    python rerun_profiler.py /var/tmp/tpt_profiles --top 20
+    python rerun_profiler.py /var/tmp/tpt_profiles --tag submit
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+DEFAULT_INTERVAL = 0.005
+DEFAULT_MAX_SECONDS = 120.0
+DEFAULT_MAX_FILES = 500
+DEFAULT_TOP = 20
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+_counter = itertools.count(1)
+
+
+def _frame_key(code):
+    return code.co_filename, code.co_name, code.co_firstlineno
+
+
+def _frame_label(key):
+    filename, name, line = key
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+class RerunProfiler:
+    """1回の再実行のスタックを記録し、終了時にファイルへ書き出す"""
+
+    def __init__(self, script_path, out_dir, interval=DEFAULT_INTERVAL, max_seconds=DEFAULT_MAX_SECONDS,
+                 max_files=DEFAULT_MAX_FILES, tag="form"):
+        self.script_path = os.path.abspath(script_path)
+        self.out_dir = out_dir
+        self.interval = float(interval)
+        self.max_seconds = float(max_seconds)
+        self.max_files = int(max_files)
+        self.tag = tag
+        self.stacks = Counter()  # (フレームのキー, ...) 根から葉 -> 秒
+        self.path = None
+        self.elapsed = 0.0
+        self._thread_id = None
+        self._started = 0.0
+
+    def start(self):
+        """呼び出したスレッド（スクリプトのスレッド）の計測を始める"""
+        self._thread_id = threading.get_ident()
+        self._started = time.perf_counter()
+        threading.Thread(target=self._run, name="rerun-profiler", daemon=True).start()
+        return self
+
+    def _stack(self, frame):
+        """スクリプトのフレームから葉までのスタック（スクリプトが終わっていれば None）"""
+        keys = []
+        while frame is not None:
+            keys.append(_frame_key(frame.f_code))
+            if frame.f_code.co_name == "<module>" and os.path.abspath(frame.f_code.co_filename) == self.script_path:
+                return tuple(reversed(keys))
+            frame = frame.f_back
+        return None
+
+    def _run(self):
+        deadline = self._started + self.max_seconds
+        last = self._started
+        while last < deadline:
+            frame = sys._current_frames().get(self._thread_id)
+            stack = self._stack(frame) if frame is not None else None
+            del frame
+            if stack is None:
+                break
+            # 各サンプルは前回のサンプルからの実経過時間を表す（sleep の遅れで間隔が伸びても合計は実時間）
+            now = time.perf_counter()
+            self.stacks[stack] += now - last
+            last = now
+            time.sleep(self.interval)
+        self.elapsed = last - self._started
+        try:
+            self.save()
+        except OSError:
+            pass
+
+    def save(self):
+        """speedscope と折り畳みスタックを書き出し、speedscope のパスを返す"""
+        if not self.stacks:
+            return None
+        os.makedirs(self.out_dir, exist_ok=True)
+        base = os.path.join(self.out_dir, f"{datetime.now():%Y%m%d-%H%M%S}-{self.tag}-{os.getpid()}-{next(_counter)}")
+        # speedscope を後に書く（集計は speedscope の有無で再実行を数える）
+        with open(base + ".folded", "w", encoding="utf-8") as f:
+            f.write(to_folded(self.stacks))
+        with open(base + ".speedscope.json", "w", encoding="utf-8") as f:
+            json.dump(to_speedscope(self.stacks, f"{self.tag} rerun"), f)
+        self.path = base + ".speedscope.json"
+        prune(self.out_dir, self.max_files)
+        return self.path
+
+
+def to_speedscope(stacks, name):
+    """{スタック: 秒} を speedscope の sampled プロファイル（単位 ms）に変換"""
+    frames, index = [], {}
+    samples, weights = [], []
+    for stack, seconds in stacks.items():
+        ids = []
+        for key in stack:
+            if key not in index:
+                index[key] = len(frames)
+                frames.append({"name": key[1], "file": key[0], "line": key[2]})
+            ids.append(index[key])
+        samples.append(ids)
+        weights.append(round(seconds * 1000, 3))
+    return {
+        "$schema": SPEEDSCOPE_SCHEMA,
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled", "name": name, "unit": "milliseconds",
+            "startValue": 0, "endValue": sum(weights), "samples": samples, "weights": weights,
+        }],
+        "name": name,
+        "exporter": "rerun_profiler",
+    }
+
+
+def to_folded(stacks):
+    """{スタック: 秒} を「関数;関数;... ミリ秒」の行に変換（flamegraph.pl は末尾の数を件数として扱う）"""
+    return "".join(f"{';'.join(_frame_label(k) for k in stack)} {max(1, round(seconds * 1000))}\n"
+                   for stack, seconds in stacks.items())
+
+
+def prune(out_dir, max_files):
+    """古いプロファイルを消し、max_files 件だけ残す"""
+    paths = sorted(glob.glob(os.path.join(out_dir, "*.speedscope.json")), key=os.path.getmtime)
+    for path in paths[:max(0, len(paths) - max_files)]:
+        for stale in (path, path[:-len(".speedscope.json")] + ".folded"):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def profile_tag(path):
+    """ファイル名（<日時>-<経路>-<pid>-<連番>.speedscope.json）の経路"""
+    return os.path.basename(path).split("-")[2]
+
+
+def hot_functions(out_dir, top=DEFAULT_TOP, tag=None):
+    """保存済みのプロファイルを合算し、自己時間の上位 top 関数を返す
+
+    戻り値は {"runs": 再実行数, "functions": [{"function", "self_ms", "total_ms", "self_share"}, ...]}。
+    total_ms はその関数がスタック上にあった時間（再帰は1回と数える）。
+    """
+    self_ms, total_ms = Counter(), Counter()
+    runs = 0
+    for path in glob.glob(os.path.join(out_dir, "*.speedscope.json")):
+        if tag and profile_tag(path) != tag:
+            continue
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        frames = data["shared"]["frames"]
+        labels = [_frame_label((fr.get("file", ""), fr["name"], fr.get("line", 0))) for fr in frames]
+        runs += 1
+        for profile in data["profiles"]:
+            for ids, weight in zip(profile["samples"], profile["weights"]):
+                if not ids:
+                    continue
+                self_ms[labels[ids[-1]]] += weight
+                for label in {labels[i] for i in ids}:
+                    total_ms[label] += weight
+    sampled = sum(self_ms.values()) or 1
+    return {
+        "runs": runs,
+        "functions": [
+            {"function": label, "self_ms": round(ms, 1), "total_ms": round(total_ms[label], 1),
+             "self_share": round(ms / sampled * 100, 1)}
+            for label, ms in self_ms.most_common(top)
+        ],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dir", help="プロファイルの保存先（profile_dir）")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="表示する関数の数")
+    parser.add_argument("--tag", default=None, help="集計する経路（submit / restore / download / admin / live / form）")
+    args = parser.parse_args(argv)
+
+    summary = hot_functions(args.dir, args.top, args.tag)
+    print(f"{summary['runs']} rerun(s) profiled" + (f" (path: {args.tag})" if args.tag else ""))
+    print(f"{'self ms':>10} {'total ms':>10} {'self %':>7}  function")
+    for row in summary["functions"]:
+        print(f"{row['self_ms']:>10.1f} {row['total_ms']:>10.1f} {row['self_share']:>7.1f}  {row['function']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""結果画像（英語版）の生成
+
+app.py のダウンロードと、一括生成ツール（bulk_reports.py）の両方から使う。
+Streamlit に依存せず、matplotlib は初回描画時に読み込む。
+
+書き出しプロファイル（EXPORT_PROFILES）で形式・解像度・エンコード設定を選べる。結果画像は
+少数の単色と文字のアンチエイリアスだけで構成されるため、128色のパレットPNGや可逆WebPでも
+見た目を変えずに容量を大きく減らせる。各プロファイルの容量とエンコード時間は次で確認する。
+
+    python result_report.py                 # プロファイルごとの画素数・容量・描画/エンコード時間
+    python result_report.py --out samples/  # 見比べ用に各プロファイルの画像を書き出す
+"""
+import argparse
+from datetime import datetime
+import io
+import os
+import statistics
+import sys
+import time
+
+from lazy_imports import lazy_import
+from scoring import build_strategy_summary_en, summary_en
+
+plt = lazy_import("matplotlib.pyplot")
+patches = lazy_import("matplotlib.patches")
+Image = lazy_import("PIL.Image")
+
+# 書き出しプロファイル: format / dpi / colors（パレット色数。None はフルカラー）/ 保存オプション
+EXPORT_PROFILES = {
+    "png": {"format": "png", "dpi": 150, "colors": None, "options": {}},
+    "png8": {"format": "png", "dpi": 150, "colors": 128, "options": {}},
+    "webp": {"format": "webp", "dpi": 150, "colors": None, "options": {"lossless": True, "method": 1, "quality": 50}},
+    "mobile": {"format": "png", "dpi": 72, "colors": 128, "options": {}},  # 画面プレビュー用の低解像度
+    "print": {"format": "png", "dpi": 300, "colors": None, "options": {}},  # 印刷用
+}
+MIME_TYPES = {"png": "image/png", "webp": "image/webp", "pdf": "application/pdf", "svg": "image/svg+xml"}
+
+
+def profile_file_type(profile):
+    """プロファイルの (拡張子, MIMEタイプ)"""
+    image_format = EXPORT_PROFILES[profile]["format"]
+    return image_format, MIME_TYPES[image_format]
+
+
+# --- グラフ画像（サマリ付き版・英語）---
+def generate_result_image_with_summary(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos, summary_future_en, summary_past_en,
+                                       image_format="png", dpi=150, profile=None):
+    """サマリ付きの結果画像を生成（英語版・文字化け防止）
+
+    profile（EXPORT_PROFILES のキー）を指定するとその設定で書き出す。未指定なら image_format（png / pdf）と dpi。
+    """
+    fig = build_result_figure(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos, summary_future_en, summary_past_en)
+    try:
+        if profile is not None:
+            return encode_image(render_rgb(fig, EXPORT_PROFILES[profile]["dpi"]), profile)
+        buf = io.BytesIO()
+        fig.savefig(buf, format=image_format, dpi=dpi, bbox_inches='tight', facecolor='white')
+        buf.seek(0)
+        return buf
+    finally:
+        plt.close(fig)
+
+
+def build_result_figure(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos, summary_future_en, summary_past_en):
+    """結果画像の Figure を組み立てる（呼び出し側で plt.close する）"""
+    fig = plt.figure(figsize=(10, 14))
+    gs = fig.add_gridspec(3, 2, height_ratios=[1, 2, 2], hspace=0.3, wspace=0.3)
+    
+    # --- サマリセクション（上段全体） ---
+    ax_summary = fig.add_subplot(gs[0, :])
+    ax_summary.axis('off')
+    
+    summary_title = "Time Perception Test Result"
+    summary_content = f"""
+Future Perspective: {', '.join(summary_future_en)}
+Past Perspective: {', '.join(summary_past_en)}
+
+Score Details:
+  Expectation Intensity: {s_exp_int}/25    Expectation Quantity: {s_exp_qty}/25
+  Recall Accuracy: {s_rec_acc}/25    Recall Positivity: {s_rec_pos}/25
+"""
+    
+    ax_summary.text(0.5, 0.85, summary_title, transform=ax_summary.transAxes,
+                   fontsize=16, fontweight='bold', ha='center', va='top',
+                   color='#2C3E50')
+    
+    bbox_props = dict(boxstyle="round,pad=0.5", facecolor='#F8F9FA', edgecolor='#E74C3C', linewidth=2)
+    ax_summary.text(0.5, 0.45, summary_content, transform=ax_summary.transAxes,
+                   fontsize=10, ha='center', va='center',
+                   color='#34495E', bbox=bbox_props,
+                   family='monospace', linespacing=1.5)
+    
+    # --- Future Matrix（中段左） ---
+    ax_future = fig.add_subplot(gs[1, 0])
+    plot_matrix_on_ax(ax_future, s_exp_qty, s_exp_int, 
+                     "Quantity", "Intensity",
+                     "Future Matrix", "Low", "High", "Weak", "Strong")
+    
+    # --- Past Matrix（中段右） ---
+    ax_past = fig.add_subplot(gs[1, 1])
+    plot_matrix_on_ax(ax_past, s_rec_pos, s_rec_acc,
+                     "Positivity", "Accuracy",
+                     "Past Matrix", "Negative", "Positive", "Low", "High")
+    
+    # --- 推奨戦略のサマリ（下段全体） ---
+    ax_strategy = fig.add_subplot(gs[2, :])
+    ax_strategy.axis('off')
+    
+    strategies, positives = build_strategy_summary_en(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos)
+    
+    strategy_title = "Recommended Strategies"
+    strategy_text = "\n".join(strategies) if strategies else "Excellent Balance - No specific intervention needed."
+    
+    if positives:
+        strategy_text += "\n\n" + "\n".join(positives)
+    
+    ax_strategy.text(0.5, 0.9, strategy_title, transform=ax_strategy.transAxes,
+                    fontsize=14, fontweight='bold', ha='center', va='top',
+                    color='#2C3E50')
+    
+    bbox_props_strategy = dict(boxstyle="round,pad=0.5", facecolor='#E8F6E8', edgecolor='#27AE60', linewidth=2)
+    ax_strategy.text(0.5, 0.5, strategy_text, transform=ax_strategy.transAxes,
+                    fontsize=11, ha='center', va='center',
+                    color='#2C3E50', bbox=bbox_props_strategy,
+                    linespacing=1.8)
+    
+    ax_strategy.text(0.5, 0.05, f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')} | Dirbato Co., Ltd.",
+                    transform=ax_strategy.transAxes, fontsize=8, ha='center', va='bottom',
+                    color='#95A5A6')
+    
+    plt.tight_layout()
+    return fig
+
+
+def render_rgb(fig, dpi):
+    """図を余白を詰めて描画し、RGB の PIL 画像を返す（エンコードはしない）"""
+    raw = io.BytesIO()
+    fig.savefig(raw, format='rgba', dpi=dpi, bbox_inches='tight', facecolor='white')
+    # bbox_inches='tight' では画像サイズが描画時に決まるため、直前に使われたレンダラから得る
+    width = int(fig.canvas.renderer.width)
+    data = raw.getbuffer()
+    height = len(data) // (4 * width)
+    if width * height * 4 != len(data):
+        raise RuntimeError("unexpected raw buffer size")
+    return Image.frombuffer("RGBA", (width, height), data, "raw", "RGBA", 0, 1).convert("RGB")
+
+
+def quantize(image, colors):
+    """パレット画像に減色する（ディザなし。白に近いパレット色は背景と同じ白に戻す）"""
+    quantized = image.quantize(colors, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+    palette = quantized.getpalette()
+    for i in range(0, len(palette), 3):
+        if min(palette[i:i + 3]) >= 250:
+            palette[i:i + 3] = [255, 255, 255]
+    quantized.putpalette(palette)
+    return quantized
+
+
+def encode_image(image, profile):
+    """RGB 画像をプロファイルの形式でエンコードして BytesIO で返す"""
+    settings = EXPORT_PROFILES[profile]
+    if settings["colors"]:
+        image = quantize(image, settings["colors"])
+    buf = io.BytesIO()
+    image.save(buf, format=settings["format"], **settings["options"])
+    buf.seek(0)
+    return buf
+
+
+def plot_matrix_on_ax(ax, x_score, y_score, x_label, y_label, title, x_min, x_max, y_min, y_max):
+    """既存のAxesにマトリクスを描画（英語版・文字化け防止）"""
+    ax.set_xlim(0, 25)
+    ax.set_ylim(0, 25)
+    ax.axvline(x=12.5, color='#BDC3C7', linestyle='--', alpha=0.7)
+    ax.axhline(y=12.5, color='#BDC3C7', linestyle='--', alpha=0.7)
+    
+    ax.scatter(x_score, y_score, color='#E74C3C', s=250, zorder=5, edgecolors='white', linewidth=2)
+    
+    ax.set_xlabel(x_label, fontsize=11, color='#34495E')
+    ax.set_ylabel(y_label, fontsize=11, color='#34495E')
+    ax.set_title(title, fontsize=14, fontweight='bold', color='#2C3E50', pad=15)
+    
+    ax.text(1, 6, y_min, ha='left', va='center', rotation=90, color='#95A5A6', fontsize=10)
+    ax.text(1, 19, y_max, ha='left', va='center', rotation=90, color='#95A5A6', fontsize=10)
+    ax.text(6, 1, x_min, ha='center', va='bottom', color='#95A5A6', fontsize=10)
+    ax.text(19, 1, x_max, ha='center', va='bottom', color='#95A5A6', fontsize=10)
+    
+    rect = patches.Rectangle((12.5, 12.5), 12.5, 12.5, linewidth=0, edgecolor='none', facecolor='#F0F2F6', alpha=0.5)
+    ax.add_patch(rect)
+
+
+# --- プロファイルごとの容量・時間の計測 ---
+def measure_profiles(scores=(12, 18, 9, 21), repeat=3, out_dir=None):
+    """各プロファイルの {名前: (幅, 高さ, バイト数, 描画秒数, エンコード秒数)}（秒数は中央値）"""
+    fig = build_result_figure(*scores, *summary_en(*scores))
+    results = {}
+    try:
+        for profile, settings in EXPORT_PROFILES.items():
+            draw, encode = [], []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                image = render_rgb(fig, settings["dpi"])
+                draw.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                buf = encode_image(image, profile)
+                encode.append(time.perf_counter() - started)
+            results[profile] = (*image.size, len(buf.getvalue()), statistics.median(draw), statistics.median(encode))
+            if out_dir:
+                os.makedirs(out_dir, exist_ok=True)
+                with open(os.path.join(out_dir, f"result_{profile}.{profile_file_type(profile)[0]}"), "wb") as f:
+                    f.write(buf.getvalue())
+    finally:
+        plt.close(fig)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", default=None, help="各プロファイルの画像を書き出すディレクトリ")
+    args = parser.parse_args(argv)
+
+    import warnings
+    import matplotlib
+    matplotlib.use("Agg")
+    warnings.filterwarnings("ignore", message="This figure includes Axes that are not compatible with tight_layout")
+    baseline = None
+    print(f"{'profile':8} {'pixels':>11} {'bytes':>9} {'ratio':>6} {'draw ms':>8} {'encode ms':>9}")
+    for profile, (width, height, size, draw, encode) in measure_profiles(repeat=args.repeat, out_dir=args.out).items():
+        baseline = baseline or size
+        print(f"{profile:8} {width:5d}x{height:<5d} {size:9d} {size / baseline:6.2f} {draw * 1000:8.1f} {encode * 1000:9.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
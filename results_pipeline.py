@@ -0,0 +1,55 @@
+"""結果表示の並行パイプライン
+
+保存（append_row）と全体データ取得をスレッドプールで実行し、スコアだけで
+描画できる部分（サマリ・推奨戦略・本人のみのチャート）と重ね合わせる。
+ワーカーでは画面出力（st.*）を行わず、結果の反映はスクリプトのスレッドで行う。
+"""
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import threading
+import time
+
+MAX_WORKERS = 8
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """プロセス内で共有するスレッドプールを返す"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="results-io")
+    return _executor
+
+
+def run_in_background(fn, *args, **kwargs):
+    """fn をスレッドプールで実行し Future を返す"""
+    return get_executor().submit(fn, *args, **kwargs)
+
+
+class Deadline:
+    """複数のFutureで共有する待ち時間の上限"""
+
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+
+def wait_result(future, deadline, default=None):
+    """Futureの完了を期限まで待つ
+
+    戻り値は (value, status)。status は "done" / "timeout" / "error"。
+    タイムアウト・例外時の value は default。タイムアウトしたタスクはそのまま継続する。
+    """
+    if future is None:
+        return default, "error"
+    try:
+        return future.result(timeout=deadline.remaining()), "done"
+    except FutureTimeoutError:
+        return default, "timeout"
+    except Exception:
+        return default, "error"
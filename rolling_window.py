@@ -0,0 +1,103 @@
+"""日別スコアヒストグラムのリングバッファと期間別パーセンタイル
+
+日ごとの 4指標×21ビン のヒストグラムを RING_DAYS 日分の環状配列に保持する。
+「直近90日」「今四半期」などの期間のパーセンタイルは、該当する日のスロット
+（最大 RING_DAYS 個の小さな配列）を合計するだけで求まり、生データを読み直す必要はない。
+"""
+from datetime import date, timedelta
+
+import numpy as np
+
+from survey import METRICS, SCORE_BINS, SCORE_MIN
+
+RING_DAYS = 400  # 直近90日・四半期（最大92日）を十分に覆う日数
+_EPOCH = date(1970, 1, 1)
+
+
+def epoch_day(d):
+    """date を 1970-01-01 からの日数に変換"""
+    return (d - _EPOCH).days
+
+
+def last_n_days(today, n):
+    """today を含む直近 n 日間（epoch日の閉区間）"""
+    end = epoch_day(today)
+    return end - n + 1, end
+
+
+def this_quarter(today):
+    """today が属する四半期の初日から today まで（epoch日の閉区間）"""
+    start = date(today.year, 3 * ((today.month - 1) // 3) + 1, 1)
+    return epoch_day(start), epoch_day(today)
+
+
+class DailyHistogramRing:
+    """日別ヒストグラムの環状バッファ（スロット = epoch日 % days）"""
+
+    def __init__(self, days=RING_DAYS, counts=None, day_stamps=None):
+        self.days = days
+        self.counts = np.zeros((days, len(METRICS), SCORE_BINS), dtype=np.int64) if counts is None else counts
+        # 各スロットが保持している epoch日（-1 は空き）
+        self.day_stamps = np.full(days, -1, dtype=np.int64) if day_stamps is None else day_stamps
+
+    def copy(self):
+        return DailyHistogramRing(self.days, self.counts.copy(), self.day_stamps.copy())
+
+    def add_indices(self, day_numbers, metric_indices):
+        """行ごとの epoch日と、指標ごとのスコア添字（-1 は無効）を加算する
+
+        day_numbers: int64 配列（無効な日は負値）、metric_indices: {指標: 添字配列}
+        スロットがより新しい日で使われている行（リングより古い行）は捨てる。
+        """
+        valid_day = day_numbers >= 0
+        for day in np.unique(day_numbers[valid_day]):
+            slot = day % self.days
+            if self.day_stamps[slot] < day:
+                self.counts[slot] = 0
+                self.day_stamps[slot] = day
+        slots = day_numbers % self.days
+        keep = valid_day & (self.day_stamps[slots] == day_numbers)
+        for i, metric in enumerate(METRICS):
+            idx = metric_indices.get(metric)
+            if idx is None:
+                continue
+            ok = keep & (idx >= 0)
+            np.add.at(self.counts, (slots[ok], i, idx[ok]), 1)
+
+    def window(self, start_day, end_day):
+        """期間（epoch日の閉区間）のヒストグラム合計（4×21）"""
+        mask = (self.day_stamps >= start_day) & (self.day_stamps <= end_day)
+        return self.counts[mask].sum(axis=0)
+
+    def window_percentile(self, metric, value, start_day, end_day):
+        """期間内で「あなたより低いスコアの割合」（%）と、その指標の回答数を返す"""
+        hist = self.window(start_day, end_day)[METRICS.index(metric)]
+        n = int(hist.sum())
+        if n == 0:
+            return None, 0
+        below = hist[:min(SCORE_BINS, max(0, int(np.ceil(value)) - SCORE_MIN))].sum()
+        return below / n * 100, n
+
+    def nonzero_days(self):
+        """データのある (epoch日, スロット) を日付順に返す"""
+        slots = np.nonzero((self.day_stamps >= 0) & (self.counts.reshape(self.days, -1).sum(axis=1) > 0))[0]
+        order = np.argsort(self.day_stamps[slots])
+        return [(int(self.day_stamps[s]), int(s)) for s in slots[order]]
+
+    def prune_before(self, day):
+        """day より前のスロットを空にする"""
+        old = (self.day_stamps >= 0) & (self.day_stamps < day)
+        self.counts[old] = 0
+        self.day_stamps[old] = -1
+
+
+def day_numbers(timestamps):
+    """datetime64 配列を epoch日の int64 配列に変換（NaT は -1）"""
+    ts = np.asarray(timestamps, dtype="datetime64[s]")
+    days = ts.astype("datetime64[D]").astype(np.int64)
+    days[np.isnat(ts)] = -1
+    return days
+
+
+def day_to_date(day):
+    return _EPOCH + timedelta(days=int(day))
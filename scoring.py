@@ -0,0 +1,99 @@
+"""診断の判定ロジック（スコア計算・サマリ・推奨戦略の選択・パーセンタイル）
+
+app.py、一括生成ツール、スコアリングAPI（scoring_api.py）で共有する。Streamlit に依存しない。
+"""
+from survey import ITEMS_PER_METRIC, METRICS
+
+# パーセンタイルを表示する最小回答者数
+MIN_POPULATION = 5
+
+
+def score_answers(answers):
+    """設問順の回答（1〜5 ×20）から4指標の合計点を計算"""
+    answers = [int(a) for a in answers]
+    if len(answers) != len(METRICS) * ITEMS_PER_METRIC or not all(1 <= a <= 5 for a in answers):
+        raise ValueError(f"expected {len(METRICS) * ITEMS_PER_METRIC} answers in 1..5")
+    return {
+        metric: sum(answers[i * ITEMS_PER_METRIC:(i + 1) * ITEMS_PER_METRIC])
+        for i, metric in enumerate(METRICS)
+    }
+
+
+def summary_ja(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos):
+    """画面表示用の診断サマリ（日本語）を (Future, Past) のリストで返す"""
+    summary_future = []
+    if s_exp_int <= 12: summary_future.append("予期が薄い")
+    if s_exp_int >= 13: summary_future.append("予期が濃い")
+    if s_exp_qty >= 13: summary_future.append("予期が多い")
+    if s_exp_qty <= 12: summary_future.append("予期が少ない")
+
+    summary_past = []
+    if s_rec_acc <= 12: summary_past.append("見積もりが曖昧")
+    if s_rec_acc >= 13: summary_past.append("見積もりが正確")
+    if s_rec_pos <= 12: summary_past.append("過去に否定的")
+    if s_rec_pos >= 13: summary_past.append("過去に肯定的")
+    return summary_future, summary_past
+
+
+def summary_en(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos):
+    """画像出力用の診断サマリ（英語）を (Future, Past) のリストで返す"""
+    summary_future_en = []
+    if s_exp_int <= 12: summary_future_en.append("Weak Expectation")
+    if s_exp_int >= 13: summary_future_en.append("Strong Expectation")
+    if s_exp_qty >= 13: summary_future_en.append("High Quantity")
+    if s_exp_qty <= 12: summary_future_en.append("Low Quantity")
+
+    summary_past_en = []
+    if s_rec_acc <= 12: summary_past_en.append("Low Accuracy")
+    if s_rec_acc >= 13: summary_past_en.append("High Accuracy")
+    if s_rec_pos <= 12: summary_past_en.append("Negative Recall")
+    if s_rec_pos >= 13: summary_past_en.append("Positive Recall")
+    return summary_future_en, summary_past_en
+
+
+def build_strategy_summary_en(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos):
+    """画像出力用の推奨戦略・ポジティブ項目（英語）を判定"""
+    strategies = []
+    if s_exp_int <= 12:
+        strategies.append("- Future Connection")
+    if s_exp_int >= 13:
+        strategies.append("- Sustainable Pace")
+    if s_exp_qty >= 13:
+        strategies.append("- Mental Declutter")
+    if s_exp_qty <= 12:
+        strategies.append("- Deep Focus")
+    if s_rec_acc <= 12:
+        strategies.append("- Estimation Calibration")
+    if s_rec_pos >= 13 and s_rec_acc <= 12:
+        strategies.append("- Optimism Calibration")
+    if s_rec_pos <= 12:
+        strategies.append("- Confidence Building")
+    
+    positives = []
+    if s_rec_acc >= 13:
+        positives.append("+ Recall Accuracy: Good")
+    if s_rec_pos >= 13 and s_rec_acc >= 13:
+        positives.append("+ Recall Balance: Ideal")
+    
+    return strategies, positives
+
+
+def diagnose(scores, population=None):
+    """4指標のスコア（dict）から判定結果をまとめた dict を返す（population は Aggregates）"""
+    args = [scores[m] for m in METRICS]
+    future, past = summary_ja(*args)
+    future_en, past_en = summary_en(*args)
+    strategies, positives = build_strategy_summary_en(*args)
+    result = {
+        "scores": {m: scores[m] for m in METRICS},
+        "summary": {"future": future, "past": past},
+        "summary_en": {"future": future_en, "past": past_en},
+        "strategies": [s.lstrip("- ") for s in strategies],
+        "positives": [p.lstrip("+ ") for p in positives],
+        "percentiles": None,
+        "population": 0,
+    }
+    if population is not None and population.total >= MIN_POPULATION:
+        result["population"] = population.total
+        result["percentiles"] = {m: population.percentile(m, scores[m]) for m in METRICS}
+    return result
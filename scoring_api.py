@@ -0,0 +1,206 @@
+"""診断のスコアリングAPI（JSON over HTTP、標準ライブラリのみ）
+
+Slack ボットや人事ポータルから、Streamlit の画面を経由せずに診断結果を取得するためのサービス。
+app.py と同じ判定ロジック（scoring.py）を使う。
+
+    python scoring_api.py --port 8502
+    python scoring_api.py --port 8502 --aggregate-file /var/tmp/tpt_aggregates.bin
+
+    POST /v1/score   {"answers": [1〜5 ×20]} / {"items": "3451..."} / {"scores": {"s_exp_int": 15, ...}}
+    GET  /healthz
+    GET  /readyz     全体集計の読み込み前は 503（ロードバランサの振り分け開始の判定用）
+
+全体比較（パーセンタイル）は起動時に読み込んだ集計値を使い、バックグラウンドで定期的に差し替える。
+リクエストごとにストレージへはアクセスしない。集計値の取得元は集計ファイル（aggregate_file）を優先し、
+無ければ Sheets から集計する。
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import sys
+import threading
+import time
+
+from scoring import diagnose, score_answers
+from survey import METRICS, SCORE_MAX, SCORE_MIN
+
+MAX_BODY_BYTES = 16 * 1024
+
+
+class PopulationCache:
+    """全体比較用の集計値を保持し、バックグラウンドで定期的に読み直す"""
+
+    def __init__(self, loader, interval=60.0):
+        self._loader = loader
+        self.interval = interval
+        self.population = None
+        self.loaded_at = None
+
+    def refresh(self):
+        population = self._loader()
+        if population is not None:
+            self.population = population  # 参照の差し替えのみ（リクエスト処理はロック不要）
+            self.loaded_at = time.time()
+        return population is not None
+
+    def start(self):
+        def loop():
+            while True:
+                time.sleep(self.interval)
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"population refresh failed: {e}", file=sys.stderr, flush=True)
+        threading.Thread(target=loop, name="population-refresh", daemon=True).start()
+        return self
+
+
+def store_loader(path):
+    """集計ファイルの版が変わったときだけスナップショットを取る loader"""
+    from aggregate_store import AggregateStore
+    store = AggregateStore(path)
+    last = {"version": None, "population": None}
+
+    def load():
+        version = store.version
+        if version and version != last["version"]:
+            last["population"] = store.snapshot()
+            last["version"] = version
+        return last["population"]
+    return load
+
+
+def sheets_loader(secrets):
+    from aggregate_store import fetch_aggregates
+    return lambda: fetch_aggregates(secrets)
+
+
+def _is_int(value):
+    """JSON の整数か（true/false と 2.0 のような小数は含めない）"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_scores(payload):
+    """リクエストから4指標のスコアを取り出す（不正なら ValueError）"""
+    if not isinstance(payload, dict):
+        raise ValueError("request body must be a JSON object")
+    if "answers" in payload:
+        answers = payload["answers"]
+        if not isinstance(answers, list) or not all(_is_int(a) and 1 <= a <= 5 for a in answers):
+            raise ValueError("answers must be a list of integers in 1..5")
+        return score_answers(answers)
+    if "items" in payload:
+        items = payload["items"]
+        if not isinstance(items, str) or not all(c in "12345" for c in items):
+            raise ValueError("items must be a string of digits 1..5")
+        return score_answers([int(c) for c in items])
+    if "scores" in payload and isinstance(payload["scores"], dict):
+        scores = {}
+        for metric in METRICS:
+            value = payload["scores"].get(metric)
+            if not _is_int(value) or not SCORE_MIN <= value <= SCORE_MAX:
+                raise ValueError(f"scores.{metric} must be an integer in {SCORE_MIN}..{SCORE_MAX}")
+            scores[metric] = value
+        return scores
+    raise ValueError("one of answers, items or scores is required")
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True  # ヘッダと本文の2回の書き込みで遅延ACK待ちにならないように
+    server_version = "tpt-scoring/1"
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path not in ("/healthz", "/readyz"):
+            return self._send(404, {"error": "not found"})
+        cache = self.server.population_cache
+        population = cache.population
+        if self.path == "/readyz" and population is None:
+            return self._send(503, {"status": "loading"})
+        self._send(200, {
+            "status": "ok",
+            "population": population.total if population is not None else 0,
+            "loaded_at": cache.loaded_at,
+        })
+
+    def do_POST(self):
+        if self.path != "/v1/score":
+            return self._send(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length < 0:
+                raise ValueError
+        except ValueError:
+            # 本文の終わりが分からないため、同じ接続で次のリクエストを読まない
+            self.close_connection = True
+            return self._send(400, {"error": "invalid Content-Length"})
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            return self._send(413, {"error": "request body too large"})
+        try:
+            scores = parse_scores(json.loads(self.rfile.read(length) or b"null"))
+        except (TypeError, ValueError) as e:  # json.JSONDecodeError を含む
+            return self._send(400, {"error": str(e)})
+        result = diagnose(scores, self.server.population_cache.population)
+        if result["percentiles"] is not None:
+            result["percentiles"] = {m: round(p, 1) for m, p in result["percentiles"].items()}
+        self._send(200, result)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(host, port, population_cache, verbose=False):
+    server = ThreadingHTTPServer((host, port), ScoringHandler)
+    server.daemon_threads = True
+    server.population_cache = population_cache
+    server.verbose = verbose
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--aggregate-file", default=os.environ.get("APP_AGGREGATE_FILE"),
+                        help="共有集計ファイル（未指定なら Sheets から集計）")
+    parser.add_argument("--secrets", default=None, help="secrets.toml のパス（既定: .streamlit/secrets.toml）")
+    parser.add_argument("--refresh", type=float, default=None,
+                        help="集計値の再読み込み間隔（秒。既定: 集計ファイル 5 / Sheets 300）")
+    parser.add_argument("--verbose", action="store_true", help="リクエストごとにログを出す")
+    args = parser.parse_args(argv)
+
+    if args.aggregate_file:
+        cache = PopulationCache(store_loader(args.aggregate_file), args.refresh or 5.0)
+    else:
+        import sheets_storage
+        cache = PopulationCache(sheets_loader(sheets_storage.load_secrets(args.secrets)), args.refresh or 300.0)
+    try:
+        cache.refresh()
+    except Exception as e:
+        print(f"initial population load failed (percentiles disabled until next refresh): {e}", file=sys.stderr)
+    cache.start()
+
+    server = make_server(args.host, args.port, cache, args.verbose)
+    print(f"scoring API listening on http://{args.host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,358 @@
+"""期間（月）または行数でのワークシート分割と、ロールアップへの集約
+
+新しい回答は {worksheet_name}_YYYY-MM（monthly）または {worksheet_name}_00001（rows）の
+シャードに追記する。集約ジョブは閉じたシャードを {worksheet_name}_rollup タブの
+職位別・指標別件数、マトリクス格子、日別件数、職位別統計量、4指標の同時分布に畳み込む。アプリは「ロールアップ＋未集約のシャード
+（通常は現在のシャードのみ）」だけを読むため、データが年単位で増えても読み込み量は一定になる。
+分割前の単一ワークシート（worksheet_name そのもの）は最初の閉じたシャードとして扱う。
+
+    python sharding.py compact                   # 閉じたシャードをロールアップに集約
+    python sharding.py compact --grace-hours 24  # 閉じてから24時間経ったシャードのみ
+    python sharding.py compact --tenant sales    # テナント（tenants.py）の保存先を集約
+"""
+import argparse
+from datetime import date, datetime, timedelta
+import re
+import sys
+
+import numpy as np
+
+from aggregate_store import Aggregates, JOINT_SHAPE, N_GRADES, score_indices
+from online_stats import GradeMoments
+from rolling_window import DailyHistogramRing, day_numbers, day_to_date, epoch_day
+from sheet_reader import ChunkFolder, DEFAULT_CHUNK_ROWS, chunk_columns, iter_row_chunks
+from sheets_storage import RESPONSE_HEADERS, ensure_response_headers, gspread, response_row
+from survey import MATRICES, METRICS, SCORE_BINS, grade_index
+
+ROLLUP_SUFFIX = "_rollup"
+ROLLUP_HEADERS = ["kind", "shard", "grade", "metric", "counts"]
+DEFAULT_SHARD_ROWS = 50000
+# 同時分布（21^4）は件数のあるセルだけを「セル番号:件数」で書く（1セルの文字数上限 50000 に収まる数）
+JOINT_CELLS_PER_ROW = 2000
+# 新規タブの行数（足りない分は書き込み前に広げる）
+DEFAULT_SHEET_ROWS = 1000
+# rows モードで、記録した件数が上限のこの行数手前に達したらシートの件数を読み直す（他のプロセスの追記分）
+SHARD_RECHECK_ROWS = 100
+
+# このプロセスでヘッダ行を確認済みのシャード: (スプレッドシート, シャード名)（テナントごとに別のスプレッドシート）
+_headers_checked = set()
+# rows モードの現在のシャード: (スプレッドシート, 基本名) -> [ワークシート, データ行数]
+_rows_shards = {}
+
+
+class ShardPolicy:
+    """シャードの命名と切り替えの規則"""
+
+    def __init__(self, base_name, mode="monthly", shard_rows=DEFAULT_SHARD_ROWS):
+        if mode not in ("monthly", "rows"):
+            raise ValueError(f"unknown shard mode: {mode}")
+        self.base_name = base_name
+        self.mode = mode
+        self.shard_rows = int(shard_rows)
+        pattern = r"\d{4}-\d{2}" if mode == "monthly" else r"\d{5}"
+        self._shard_re = re.compile(re.escape(base_name) + "_(" + pattern + ")$")
+
+    @property
+    def rollup_name(self):
+        return self.base_name + ROLLUP_SUFFIX
+
+    def monthly_name(self, timestamp):
+        """'%Y-%m-%d %H:%M:%S' の日時が属する月のシャード名"""
+        return f"{self.base_name}_{str(timestamp)[:7]}"
+
+    def rows_name(self, index):
+        return f"{self.base_name}_{index:05d}"
+
+    def shard_names(self, titles):
+        """ワークシート名の一覧からシャードを古い順に返す（分割前の単一ワークシートを含む）"""
+        shards = sorted(t for t in titles if self._shard_re.match(t))
+        if self.base_name in titles:
+            shards.insert(0, self.base_name)
+        return shards
+
+    def closed_shards(self, titles, now=None, grace=timedelta(0)):
+        """追記されなくなったシャード（monthly は月末から grace 経過したもの）"""
+        shards = self.shard_names(titles)
+        if self.mode == "rows":
+            return shards[:-1]
+        now = now or datetime.now()
+        closed = []
+        for name in shards:
+            if name == self.base_name:
+                closed.append(name)
+                continue
+            month = datetime.strptime(name[-7:], "%Y-%m")
+            next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+            if next_month + grace <= now:
+                closed.append(name)
+        return closed
+
+
+def _open_or_create(sh, title, headers, rows=DEFAULT_SHEET_ROWS):
+    """ワークシートを開き、無ければヘッダ付きで作成する（同時作成の競合は開き直す）"""
+    try:
+        return sh.worksheet(title)
+    except gspread.exceptions.WorksheetNotFound:
+        pass
+    try:
+        ws = sh.add_worksheet(title=title, rows=rows, cols=len(headers))
+    except gspread.exceptions.APIError:
+        return sh.worksheet(title)
+    ws.append_row(headers)
+    return ws
+
+
+def current_shard(sh, policy, timestamp):
+    """追記先のシャードを開く（必要なら作成）"""
+    if policy.mode == "monthly":
+        return _open_or_create(sh, policy.monthly_name(timestamp), RESPONSE_HEADERS)
+
+    key = (getattr(sh, "id", None), policy.base_name)
+    cached = _rows_shards.get(key)
+    # 上限の手前までは記録した件数（追記の応答で更新）を信用し、一覧と件数の読み込みを省く
+    if cached is not None and cached[1] + SHARD_RECHECK_ROWS < policy.shard_rows:
+        return cached[0]
+    titles = [ws.title for ws in sh.worksheets()]
+    shards = [s for s in policy.shard_names(titles) if s != policy.base_name]
+    index = int(shards[-1][-5:]) if shards else 1
+    ws = _open_or_create(sh, policy.rows_name(index), RESPONSE_HEADERS)
+    # 1列目（timestamp）の件数だけでシャードの充填を判定する
+    n_rows = len(ws.col_values(1)) - 1
+    if n_rows >= policy.shard_rows:
+        ws = _open_or_create(sh, policy.rows_name(index + 1), RESPONSE_HEADERS)
+        n_rows = len(ws.col_values(1)) - 1
+    _rows_shards[key] = [ws, n_rows]
+    return ws
+
+
+def shard_room(sh, policy):
+    """rows モードで current_shard が開いたシャードに、あと何行追記できるか"""
+    cached = _rows_shards.get((getattr(sh, "id", None), policy.base_name))
+    return policy.shard_rows - cached[1] if cached is not None else policy.shard_rows
+
+
+def _updated_last_row(response):
+    """append_row(s) の応答の updatedRange（'シート!A2:R501'）の最終行"""
+    try:
+        updated = response["updates"]["updatedRange"]
+    except (KeyError, TypeError):
+        return None
+    match = re.search(r"(\d+)$", updated)
+    return int(match.group(1)) if match else None
+
+
+def record_append(sh, policy, ws, n_rows, response=None):
+    """rows モードの現在のシャードに記録した件数を、追記した行の分だけ進める"""
+    if policy is None or policy.mode != "rows":
+        return
+    cached = _rows_shards.get((getattr(sh, "id", None), policy.base_name))
+    if cached is None or cached[0].title != ws.title:
+        return
+    # 応答の最終行は他のプロセスの追記分も含む
+    last_row = _updated_last_row(response)
+    cached[1] = last_row - 1 if last_row else cached[1] + n_rows
+
+
+def append_sharded(sh, policy, user_data):
+    """回答を現在のシャードに追記する"""
+    ws = current_shard(sh, policy, user_data.get("timestamp") or datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    key = (getattr(sh, "id", None), ws.title)
+    if key not in _headers_checked:
+        ensure_response_headers(ws)
+        _headers_checked.add(key)
+    record_append(sh, policy, ws, 1, ws.append_row(response_row(user_data)))
+    return True
+
+
+# --- ロールアップ ---
+class Rollup:
+    """集約済みシャードの一覧と、職位別・指標別件数、マトリクス格子、日別ヒストグラム、職位別統計量、同時分布"""
+
+    def __init__(self):
+        self.shards = {}  # シャード名 -> 集約した行数
+        self.grade_hist = np.zeros((N_GRADES, len(METRICS), SCORE_BINS), dtype=np.int64)
+        self.grade_rows = np.zeros(N_GRADES, dtype=np.int64)
+        self.grids = {name: np.zeros((SCORE_BINS, SCORE_BINS), dtype=np.int64) for name in MATRICES}
+        self.daily = DailyHistogramRing()
+        self.moments = GradeMoments()
+        self.joint = np.zeros(JOINT_SHAPE, dtype=np.int64)
+        self.sheet_rows = 0  # 読み込んだロールアップタブの行数
+
+    @classmethod
+    def parse(cls, values):
+        rollup = cls()
+        rollup.sheet_rows = len(values)
+        for row in values[1:]:
+            row = list(row) + [""] * (len(ROLLUP_HEADERS) - len(row))
+            kind, shard, grade, metric, counts = row[:5]
+            if kind == "shard":
+                rollup.shards[shard] = int(counts or 0)
+            elif kind == "rows":
+                rollup.grade_rows[int(grade)] = int(counts or 0)
+            elif kind == "hist":
+                rollup.grade_hist[int(grade), METRICS.index(metric)] = np.array(counts.split(","), dtype=np.int64)
+            elif kind == "grid":
+                rollup.grids[metric][...] = np.array(counts.split(","), dtype=np.int64).reshape(SCORE_BINS, SCORE_BINS)
+            elif kind == "day":
+                day = epoch_day(date.fromisoformat(shard))
+                slot = day % rollup.daily.days
+                if rollup.daily.day_stamps[slot] < day:
+                    rollup.daily.counts[slot] = 0
+                    rollup.daily.day_stamps[slot] = day
+                if rollup.daily.day_stamps[slot] == day:
+                    rollup.daily.counts[slot, METRICS.index(metric)] = np.array(counts.split(","), dtype=np.int64)
+            elif kind == "moments":
+                # 件数, 平均(4), 偏差積和(4×4)
+                g, k = int(grade), len(METRICS)
+                numbers = np.array(counts.split(","), dtype=float)
+                rollup.moments.n[g] = int(numbers[0])
+                rollup.moments.mean[g] = numbers[1:1 + k]
+                rollup.moments.comoment[g] = numbers[1 + k:].reshape(k, k)
+            elif kind == "joint":
+                cells = np.array([pair.split(":") for pair in counts.split(",")], dtype=np.int64)
+                rollup.joint.reshape(-1)[cells[:, 0]] = cells[:, 1]
+        return rollup
+
+    def to_values(self):
+        values = [ROLLUP_HEADERS]
+        values += [["shard", name, "", "", str(n)] for name, n in self.shards.items()]
+        for g in range(N_GRADES):
+            values.append(["rows", "", str(g), "", str(int(self.grade_rows[g]))])
+            for i, metric in enumerate(METRICS):
+                values.append(["hist", "", str(g), metric, ",".join(map(str, self.grade_hist[g, i]))])
+        for name, grid in self.grids.items():
+            values.append(["grid", "", "", name, ",".join(map(str, grid.ravel()))])
+        # リングバッファに残っている日のみ（古い日は新しい日に上書きされている）
+        for day, slot in self.daily.nonzero_days():
+            for i, metric in enumerate(METRICS):
+                values.append(["day", day_to_date(day).isoformat(), "", metric,
+                               ",".join(map(str, self.daily.counts[slot, i]))])
+        for g in np.nonzero(self.moments.n)[0]:
+            numbers = [int(self.moments.n[g])] + self.moments.mean[g].tolist() + self.moments.comoment[g].ravel().tolist()
+            values.append(["moments", "", str(g), "", ",".join(map(repr, numbers))])
+        flat = self.joint.reshape(-1)
+        cells = np.nonzero(flat)[0]
+        for start in range(0, len(cells), JOINT_CELLS_PER_ROW):
+            part = cells[start:start + JOINT_CELLS_PER_ROW]
+            values.append(["joint", "", "", "", ",".join(f"{c}:{flat[c]}" for c in part)])
+        # 古い日がリングから外れて行数が減った場合は、上書きで残る旧行を空行で消す
+        values += [[""] * len(ROLLUP_HEADERS)] * (self.sheet_rows - len(values))
+        return values
+
+    def fold_chunk(self, header, rows):
+        """シャードのチャンクを職位ごとに畳み込む"""
+        columns, _ = chunk_columns(header, rows)
+        grades = columns.get("grade", [""] * len(rows))
+        chunk = Aggregates().add_columns({k: v for k, v in columns.items() if k != "timestamp"}, len(rows))
+        for name in MATRICES:
+            self.grids[name] += getattr(chunk, name)
+        self.grade_rows += chunk.grades
+        self.moments.merge(chunk.moments)
+        self.joint += chunk.joint
+        indices = {m: score_indices(columns[m]) for m in METRICS if m in columns}
+        if "timestamp" in columns:
+            self.daily.add_indices(day_numbers(columns["timestamp"]), indices)
+        gi = np.fromiter((grade_index(g) for g in grades), dtype=np.int64, count=len(rows))
+        for i, metric in enumerate(METRICS):
+            idx = indices.get(metric)
+            if idx is None:
+                continue
+            ok = idx >= 0
+            np.add.at(self.grade_hist, (gi[ok], i, idx[ok]), 1)
+
+    def aggregates(self):
+        """ロールアップ全体を Aggregates に変換"""
+        return Aggregates(self.grade_hist.sum(axis=0), self.grids["future"].copy(), self.grids["past"].copy(),
+                          self.grade_rows.copy(), int(self.grade_rows.sum()), daily=self.daily.copy(),
+                          moments=self.moments.copy(), joint=self.joint.copy())
+
+
+def read_rollup(sh, policy):
+    try:
+        ws = sh.worksheet(policy.rollup_name)
+    except gspread.exceptions.WorksheetNotFound:
+        return Rollup()
+    return Rollup.parse(ws.get_values())
+
+
+def read_population(sh, policy, chunk_rows=DEFAULT_CHUNK_ROWS, watch_row=None):
+    """ロールアップと未集約のシャードだけを読み、畳み込み結果（ChunkFolder）を返す"""
+    titles = [ws.title for ws in sh.worksheets()]
+    rollup = read_rollup(sh, policy)
+    folder = ChunkFolder(watch_row=watch_row)
+    folder.aggregates = rollup.aggregates()
+    for name in policy.shard_names(titles):
+        if name in rollup.shards:
+            continue
+        for header, rows in iter_row_chunks(sh.worksheet(name), chunk_rows):
+            folder.fold(header, rows)
+    return folder
+
+
+def compact(sh, policy, chunk_rows=DEFAULT_CHUNK_ROWS, grace=timedelta(0), now=None, rebuild=False):
+    """閉じたシャードのうち未集約のものをロールアップに畳み込み、集約したシャード名を返す
+
+    rebuild=True なら集約済みのシャードも読み直してロールアップを作り直す（集約後のシャードに
+    行を追加した場合。backfill.py）。
+    """
+    titles = [ws.title for ws in sh.worksheets()]
+    rollup = read_rollup(sh, policy)
+    if rebuild:
+        sheet_rows = rollup.sheet_rows
+        rollup = Rollup()
+        rollup.sheet_rows = sheet_rows
+    compacted = []
+    for name in policy.closed_shards(titles, now=now, grace=grace):
+        if name in rollup.shards:
+            continue
+        n_rows = 0
+        for header, rows in iter_row_chunks(sh.worksheet(name), chunk_rows):
+            rollup.fold_chunk(header, rows)
+            n_rows += len(rows)
+        rollup.shards[name] = n_rows
+        compacted.append(name)
+    if compacted:
+        # 1回の上書きで置き換える（読み手が空のタブを見ることはない。減った行は to_values が空行で埋める）
+        values = rollup.to_values()
+        ws = _open_or_create(sh, policy.rollup_name, ROLLUP_HEADERS, rows=len(values))
+        # 範囲がタブの行数を超える書き込みは失敗するため、先に広げる
+        if ws.row_count < len(values):
+            ws.resize(rows=len(values))
+        ws.update(values, "A1")
+    return compacted
+
+
+def policy_from_settings(app_settings):
+    """secrets["app"] 相当の設定から ShardPolicy を作る（shard_mode が none/未設定なら None）"""
+    mode = str(app_settings.get("shard_mode", "none")).lower()
+    if mode == "none":
+        return None
+    return ShardPolicy(app_settings["worksheet_name"], mode,
+                       int(app_settings.get("shard_rows", DEFAULT_SHARD_ROWS)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["compact"])
+    parser.add_argument("--secrets", default=None, help="secrets.toml のパス（既定: .streamlit/secrets.toml）")
+    parser.add_argument("--grace-hours", type=float, default=24.0, help="月末から集約までの猶予（monthly）")
+    parser.add_argument("--rebuild", action="store_true", help="集約済みのシャードも読み直してロールアップを作り直す")
+    parser.add_argument("--tenant", default=None, help="集約するテナント（secrets の [tenants.<id>]。既定: [app]）")
+    args = parser.parse_args(argv)
+
+    import sheets_storage
+    from tenants import tenant_secrets
+    secrets = tenant_secrets(sheets_storage.load_secrets(args.secrets), args.tenant)
+    policy = policy_from_settings(secrets["app"])
+    if policy is None:
+        raise SystemExit("shard_mode is not configured in secrets [app]")
+    gc = sheets_storage.client_from_secrets(secrets)
+    sh = gc.open_by_url(secrets["app"]["spreadsheet_url"])
+    chunk_rows = int(secrets["app"].get("sheet_chunk_rows", DEFAULT_CHUNK_ROWS))
+    compacted = compact(sh, policy, chunk_rows, grace=timedelta(hours=args.grace_hours), rebuild=args.rebuild)
+    print(f"compacted {len(compacted)} shard(s): {', '.join(compacted) or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
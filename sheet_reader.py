@@ -0,0 +1,177 @@
+"""大規模な回答ワークシートのチャンク読み込み
+
+ws.get_all_records() でシート全体を dict のリストに展開する代わりに、固定行数の範囲
+（A{start}:{ヘッダ行の最終列}{end}）を順に取得し、チャンクごとに集計値と型付き配列へ畳み込んで破棄する。
+途中の空行のまとまりは読み飛ばし、シートの行数（ws.row_count）まで読み進める。
+ピークメモリはシートの行数ではなくチャンクサイズで決まる。
+"""
+import numpy as np
+
+from aggregate_store import Aggregates
+from item_responses import N_ITEMS, decode_items
+from survey import METRICS, grade_index
+
+DEFAULT_CHUNK_ROWS = 2000
+
+
+def column_letter(n):
+    """1始まりの列番号をA1表記の列名に変換（1 -> A, 27 -> AA）"""
+    letters = ""
+    while n > 0:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(ord("A") + rem) + letters
+    return letters
+
+
+def get_rows(ws, a1_range):
+    """範囲内の行を取得する（末尾の空行は除く。空の範囲に対して gspread は [[]] を返す）"""
+    rows = ws.get_values(a1_range)
+    while rows and not any(rows[-1]):
+        rows.pop()
+    return rows
+
+
+def iter_row_ranges(ws, chunk_rows=DEFAULT_CHUNK_ROWS, header=None, start=2):
+    """ヘッダ行と、start 行目（既定は2行目）以降を chunk_rows 行ずつ取得した行リストを順に返す
+
+    戻り値は (先頭の行番号, header, rows) のジェネレータ。rows は各行のセル値（文字列）のリストで、
+    先頭の行番号から連続する行（末尾の空行は除く。すべて空の範囲は返さない）。
+    途中の空行のまとまりで止まらないよう、シートの行数（ws.row_count）までは空の範囲も読み進め、
+    それ以降は空の範囲が返った時点で終える。
+    """
+    if header is None:
+        header = ws.row_values(1)
+    if not header:
+        return
+    last_col = column_letter(len(header))
+    row_count = getattr(ws, "row_count", None) or 0
+    while True:
+        end = start + chunk_rows - 1
+        rows = get_rows(ws, f"A{start}:{last_col}{end}")
+        if rows:
+            yield start, header, rows
+        elif end >= row_count:
+            return
+        start = end + 1
+
+
+def iter_row_chunks(ws, chunk_rows=DEFAULT_CHUNK_ROWS, header=None, start=2):
+    """iter_row_ranges の (header, rows) だけを返す（行番号を使わない集計用）
+
+    途中の空行は除く（回答として数えない）。空行だけのチャンクは返さない。
+    """
+    for _, header, rows in iter_row_ranges(ws, chunk_rows, header, start):
+        rows = [row for row in rows if any(row)]
+        if rows:
+            yield header, rows
+
+
+def _numeric(values):
+    """セル値の列を float 配列に変換（数値でないものは NaN）"""
+    out = np.full(len(values), np.nan)
+    for i, v in enumerate(values):
+        try:
+            out[i] = float(v)
+        except (TypeError, ValueError):
+            pass
+    return out
+
+
+def _timestamps(values):
+    """'%Y-%m-%d %H:%M:%S' 形式の列を datetime64[s] に変換（解釈できないものは NaT）"""
+    try:
+        return np.array(values, dtype="datetime64[s]")
+    except ValueError:
+        out = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[s]")
+        for i, v in enumerate(values):
+            try:
+                out[i] = np.datetime64(v, "s")
+            except ValueError:
+                pass
+        return out
+
+
+def chunk_columns(header, rows):
+    """行リストを列ごとの配列 {列名: 配列} に変換（短い行は空欄で補う）"""
+    width = len(header)
+    columns = {}
+    for j, name in enumerate(header):
+        cells = [row[j] if j < len(row) else "" for row in rows]
+        if name in METRICS:
+            columns[name] = _numeric(cells)
+        elif name == "timestamp":
+            columns[name] = _timestamps(cells)
+        else:
+            columns[name] = cells
+    return columns, width
+
+
+class ResponseArrays:
+    """回答データの型付き配列（スコアは int8、職位は uint8、日時は datetime64[s]、設問回答は (行, 20) の int8）"""
+
+    def __init__(self):
+        self._parts = {name: [] for name in ["timestamp", "grade"] + METRICS + ["items", "qset"]}
+
+    def append(self, columns, n_rows):
+        for metric in METRICS:
+            values = columns.get(metric, np.full(n_rows, np.nan))
+            ok = np.isfinite(values)
+            scores = np.full(n_rows, -1, dtype=np.int8)
+            scores[ok] = np.clip(values[ok], -1, 127).astype(np.int8)
+            self._parts[metric].append(scores)
+        grades = columns.get("grade", [""] * n_rows)
+        self._parts["grade"].append(np.fromiter((grade_index(g) for g in grades), dtype=np.uint8, count=n_rows))
+        self._parts["timestamp"].append(
+            columns.get("timestamp", np.full(n_rows, np.datetime64("NaT"), dtype="datetime64[s]")))
+        self._parts["items"].append(decode_items(columns.get("items", [""] * n_rows)))
+        self._parts["qset"].append(np.array(columns.get("qset", [""] * n_rows), dtype=str))
+
+    def finalize(self):
+        """{列名: 連結済み配列} を返す"""
+        empty = {"timestamp": np.array([], dtype="datetime64[s]"), "grade": np.array([], dtype=np.uint8),
+                 "items": np.zeros((0, N_ITEMS), dtype=np.int8), "qset": np.array([], dtype=str)}
+        return {
+            name: np.concatenate(parts) if parts else empty.get(name, np.array([], dtype=np.int8))
+            for name, parts in self._parts.items()
+        }
+
+
+class ChunkFolder:
+    """チャンクを集計値（と必要なら型付き配列）に畳み込む"""
+
+    def __init__(self, keep_arrays=False, watch_row=None):
+        self.aggregates = Aggregates()
+        self.arrays = ResponseArrays() if keep_arrays else None
+        self.rows_read = 0
+        # watch_row と同じ行（timestamp と各スコアが一致）がシートにあったか
+        self._watch = watch_row
+        self.watch_found = False
+
+    def fold(self, header, rows):
+        columns, _ = chunk_columns(header, rows)
+        n_rows = len(rows)
+        self.aggregates.add_columns(columns, n_rows)
+        if self.arrays is not None:
+            self.arrays.append(columns, n_rows)
+        if self._watch is not None and not self.watch_found:
+            self.watch_found = self._contains_watch_row(columns)
+        self.rows_read += n_rows
+
+    def _contains_watch_row(self, columns):
+        if "timestamp" not in columns or not all(m in columns for m in METRICS):
+            return False
+        try:
+            match = columns["timestamp"] == np.datetime64(self._watch["timestamp"], "s")
+        except (KeyError, ValueError):
+            return False
+        for metric in METRICS:
+            match &= columns[metric] == self._watch.get(metric)
+        return bool(match.any())
+
+
+def read_aggregates(ws, chunk_rows=DEFAULT_CHUNK_ROWS, keep_arrays=False, watch_row=None):
+    """ワークシートをチャンク単位で読み、畳み込み結果（ChunkFolder）を返す"""
+    folder = ChunkFolder(keep_arrays=keep_arrays, watch_row=watch_row)
+    for header, rows in iter_row_chunks(ws, chunk_rows):
+        folder.fold(header, rows)
+    return folder
@@ -0,0 +1,117 @@
+"""Google Sheets ストレージ（Streamlit 非依存）
+
+app.py と、別プロセスで動く集計・補助ツールの両方から使う。
+gspread / google-auth は初回利用時に読み込む。
+"""
+from datetime import datetime
+import os
+import re
+import tomllib
+
+from lazy_imports import lazy_import
+from scoring import score_answers
+from survey import NO_GRADE, QSET_VERSION
+
+service_account = lazy_import("google.oauth2.service_account")
+gspread = lazy_import("gspread")
+
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive"
+]
+
+# items: 設問ごとの回答（item_responses.encode_items）、qset: 設問セットの版、session: ワークショップのセッションコード
+RESPONSE_HEADERS = ["timestamp", "grade", "s_exp_int", "s_exp_qty", "s_rec_acc", "s_rec_pos", "items", "qset", "session"]
+
+DEFAULT_SECRETS_PATH = os.path.join(".streamlit", "secrets.toml")
+
+SESSION_CODE_MAX = 32
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def load_secrets(path=None):
+    """Streamlit と同じ secrets.toml を読み込む（Streamlit 外のプロセス用）"""
+    with open(path or DEFAULT_SECRETS_PATH, "rb") as f:
+        return tomllib.load(f)
+
+
+def authorize(creds_dict, session=None):
+    """サービスアカウント情報から gspread クライアントを作成
+
+    session を渡すと、その認証済みセッション（接続プール・アクセストークン）を共有する。
+    環境変数 APP_SHEETS_REPLAY（と APP_SHEETS_REPLAY_SCALE）を設定すると認証せずに記録を再生し、
+    APP_SHEETS_RECORD を設定すると通信を記録する（sheets_transport.py）。
+    """
+    replay = os.environ.get("APP_SHEETS_REPLAY")
+    if replay:
+        from sheets_transport import replay_http_client
+        scale = float(os.environ.get("APP_SHEETS_REPLAY_SCALE") or 1.0)
+        return gspread.authorize(None, http_client=replay_http_client(replay, scale))
+    creds = service_account.Credentials.from_service_account_info(dict(creds_dict), scopes=SCOPES)
+    record = os.environ.get("APP_SHEETS_RECORD")
+    if record:
+        from sheets_transport import recording_http_client
+        return gspread.authorize(creds, http_client=recording_http_client(record), session=session)
+    return gspread.authorize(creds, session=session)
+
+
+def client_from_secrets(secrets):
+    """secrets から gspread クライアントを作成"""
+    return authorize(secrets["gcp_service_account"])
+
+
+def open_worksheet(gc, sheet_url, worksheet_name):
+    """指定のワークシートを開く"""
+    sh = gc.open_by_url(sheet_url)
+    return sh.worksheet(worksheet_name)
+
+
+def open_response_worksheet_from_secrets(gc, secrets):
+    """secrets["app"] の設定で回答保存先のワークシートを開く"""
+    return open_worksheet(gc, secrets["app"]["spreadsheet_url"], secrets["app"]["worksheet_name"])
+
+
+def build_response(answers, grade="", session="", timestamp=None):
+    """設問順の回答（1〜5 ×20）から保存する回答データ（dict）を作る（app.py の送信と backfill.py で共用）"""
+    from item_responses import encode_items
+    return {
+        "timestamp": timestamp or datetime.now().strftime(TIMESTAMP_FORMAT),
+        "grade": grade if grade != NO_GRADE else "",
+        **score_answers(answers),
+        "items": encode_items(answers),
+        "qset": QSET_VERSION,
+        "session": normalize_session_code(session),
+    }
+
+
+def response_row(user_data):
+    """回答データ（dict）をシートの1行（RESPONSE_HEADERS順）に変換"""
+    return [
+        user_data.get("timestamp", ""),
+        user_data.get("grade", ""),
+        user_data.get("s_exp_int", 0),
+        user_data.get("s_exp_qty", 0),
+        user_data.get("s_rec_acc", 0),
+        user_data.get("s_rec_pos", 0),
+        user_data.get("items", ""),
+        user_data.get("qset", ""),
+        user_data.get("session", ""),
+    ]
+
+
+def normalize_session_code(code):
+    """セッションコードを正規化（英数字・ハイフン・アンダースコアのみ、大文字、最大32文字。不正なら空文字）"""
+    code = str(code or "").strip().upper()[:SESSION_CODE_MAX]
+    return code if re.fullmatch(r"[A-Z0-9_-]+", code) else ""
+
+
+def ensure_response_headers(ws):
+    """ヘッダ行を確認し、空なら書き込み、旧形式（列の不足）なら不足列を追加する"""
+    header = ws.row_values(1)
+    if not header:
+        ws.append_row(RESPONSE_HEADERS)
+    elif len(header) < len(RESPONSE_HEADERS) and header == RESPONSE_HEADERS[:len(header)]:
+        if ws.col_count < len(RESPONSE_HEADERS):
+            ws.add_cols(len(RESPONSE_HEADERS) - ws.col_count)
+        ws.update([RESPONSE_HEADERS], "A1")
@@ -0,0 +1,244 @@
+"""Sheets 通信の記録・再生（オフラインでの性能テスト・回帰テスト用）
+
+gspread の HTTP 層（HTTPClient.request）を差し替え、アプリが送ったリクエスト（メソッド・URL・
+クエリ・本文）と応答・所要時間を JSON Lines のカセットに記録する。再生時は認証もネットワークも
+使わず、カセットの応答を元の所要時間 × scale だけ待ってから返す。
+
+    APP_SHEETS_RECORD=sheets.jsonl streamlit run app.py            # 実環境の通信を記録
+    APP_SHEETS_REPLAY=sheets.jsonl APP_SHEETS_REPLAY_SCALE=0 ...    # 記録を再生（待ち時間なし）
+
+    python sheets_transport.py summary sheets.jsonl
+    python sheets_transport.py bench sheets.jsonl --scale 1 --repeat 5
+
+再生時は (メソッド, URL, クエリ) が一致する記録を記録順に返し、使い切ったら最後の応答を繰り返す。
+追記する行などの本文はタイムスタンプを含むため照合に使わない。記録に無いリクエストは
+CassetteMiss になる。
+"""
+import argparse
+from collections import defaultdict
+import functools
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+
+# 記録する応答ヘッダ（その他は再生に不要）
+KEPT_HEADERS = ("Content-Type",)
+
+
+class CassetteMiss(LookupError):
+    """カセットに記録されていないリクエスト"""
+
+
+def _params_key(params):
+    if not params:
+        return ()
+    items = params.items() if hasattr(params, "items") else params
+    return tuple(sorted((str(k), str(v)) for k, v in items))
+
+
+def _request_key(method, url, params):
+    return method.upper(), url, _params_key(params)
+
+
+def json_dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def endpoint_name(method, url):
+    """集計用の API 名（例: metadata, values:get, values:append, batchUpdate）"""
+    tail = urlparse(url).path.split("/spreadsheets/", 1)[-1]
+    sheet_id, _, rest = tail.partition("/")
+    if ":" in sheet_id:
+        return sheet_id.split(":", 1)[1]
+    if not rest:
+        return "metadata"
+    if rest.startswith("values"):
+        for verb in ("append", "clear", "batchGet", "batchUpdate", "batchClear"):
+            if rest.endswith(f":{verb}"):
+                return f"values:{verb}"
+        return "values:get" if method == "GET" else "values:update"
+    return rest.split("/", 1)[0]
+
+
+class RecordingHTTPClient(HTTPClient):
+    """通常どおり通信し、やり取りをカセットに追記する"""
+
+    def __init__(self, auth, session=None, cassette=None):
+        super().__init__(auth, session)
+        self.cassette = cassette
+        self._lock = threading.Lock()
+
+    def request(self, method, endpoint, params=None, data=None, json=None, files=None, headers=None):
+        started = time.perf_counter()
+        response = None
+        try:
+            response = super().request(method, endpoint, params=params, data=data, json=json,
+                                       files=files, headers=headers)
+        except APIError as e:
+            response = e.response
+            raise
+        finally:
+            record = {
+                "method": method.upper(),
+                "url": endpoint,
+                "params": [list(p) for p in _params_key(params)],
+                "json": json,
+                "data": data.decode("utf-8", "replace") if isinstance(data, bytes) else data,
+                "elapsed": round(time.perf_counter() - started, 6),
+            }
+            if response is not None:
+                record["status"] = response.status_code
+                record["headers"] = {k: response.headers[k] for k in KEPT_HEADERS if k in response.headers}
+                record["body"] = response.text
+            self._write(record)
+        return response
+
+    def _write(self, record):
+        line = json_dumps(record)
+        with self._lock, open(self.cassette, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def load_cassette(path):
+    """カセットを読み、応答のある記録のリストを返す"""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if "status" in record:
+                    records.append(record)
+    return records
+
+
+class ReplayHTTPClient(HTTPClient):
+    """カセットの応答を返す（認証・ネットワークなし）"""
+
+    def __init__(self, auth=None, session=None, cassette=None, scale=1.0):
+        # HTTPClient.__init__ は認証付きセッションを作るため呼ばない
+        self.auth = auth
+        self.session = session
+        self.timeout = None
+        self.scale = scale
+        self._queues = defaultdict(list)
+        records = cassette if isinstance(cassette, list) else load_cassette(cassette)
+        for record in records:
+            self._queues[_request_key(record["method"], record["url"], record["params"])].append(record)
+        self._cursors = defaultdict(int)
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def login(self):
+        pass
+
+    def request(self, method, endpoint, params=None, data=None, json=None, files=None, headers=None):
+        key = _request_key(method, endpoint, params)
+        with self._lock:
+            queue = self._queues.get(key)
+            if not queue:
+                raise CassetteMiss(f"no recorded response for {method.upper()} {endpoint} {list(key[2])}")
+            cursor = self._cursors[key]
+            record = queue[min(cursor, len(queue) - 1)]
+            self._cursors[key] = cursor + 1
+            self.requests += 1
+        if self.scale > 0:
+            time.sleep(record["elapsed"] * self.scale)
+
+        response = requests.Response()
+        response.status_code = record["status"]
+        response.headers.update(record.get("headers", {}))
+        response._content = record.get("body", "").encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = endpoint
+        if not response.ok:
+            raise APIError(response)
+        return response
+
+
+def recording_http_client(path):
+    """gspread.authorize の http_client に渡す記録用クライアント"""
+    return functools.partial(RecordingHTTPClient, cassette=path)
+
+
+def replay_http_client(path, scale=1.0):
+    """gspread.authorize の http_client に渡す再生用クライアント（カセットは1回だけ読む）"""
+    return functools.partial(ReplayHTTPClient, cassette=load_cassette(path), scale=scale)
+
+
+# --- CLI ---
+def summarize(records):
+    """API ごとの (件数, 合計秒数)"""
+    groups = defaultdict(list)
+    for record in records:
+        groups[(record["method"], endpoint_name(record["method"], record["url"]))].append(record["elapsed"])
+    return {key: (len(times), sum(times)) for key, times in sorted(groups.items())}
+
+
+def bench(path, secrets, scale, repeat, save):
+    """カセットを再生して全体集計の読み込み（と保存）の所要時間を計測する"""
+    import aggregate_store
+    import sheets_storage
+
+    os.environ["APP_SHEETS_REPLAY"] = path
+    os.environ["APP_SHEETS_REPLAY_SCALE"] = str(scale)
+    results = {"load": [], "save": []}
+    population = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        population = aggregate_store.fetch_aggregates(secrets)
+        results["load"].append(time.perf_counter() - started)
+        if save:
+            gc = sheets_storage.client_from_secrets(secrets)
+            started = time.perf_counter()
+            ws = sheets_storage.open_response_worksheet_from_secrets(gc, secrets)
+            sheets_storage.ensure_response_headers(ws)
+            ws.append_row(sheets_storage.response_row({"timestamp": "2000-01-01 00:00:00"}))
+            results["save"].append(time.perf_counter() - started)
+    return results, population
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_summary = sub.add_parser("summary", help="記録の件数と所要時間")
+    p_summary.add_argument("cassette")
+    p_bench = sub.add_parser("bench", help="記録を再生して全体集計の読み込みを計測")
+    p_bench.add_argument("cassette")
+    p_bench.add_argument("--secrets", default=None, help="記録時と同じ secrets.toml（既定: .streamlit/secrets.toml）")
+    p_bench.add_argument("--scale", type=float, default=1.0, help="記録時の所要時間に掛ける係数（0 で待たない）")
+    p_bench.add_argument("--repeat", type=int, default=5)
+    p_bench.add_argument("--save", action="store_true", help="回答の保存（ヘッダ確認＋追記）も再生する")
+    args = parser.parse_args(argv)
+
+    if args.command == "summary":
+        records = load_cassette(args.cassette)
+        for (method, name), (count, seconds) in summarize(records).items():
+            print(f"{method:6} {name:24} {count:6d} req  {seconds:8.3f}s")
+        print(f"total  {len(records)} requests, {sum(r['elapsed'] for r in records):.3f}s")
+        return 0
+
+    import sheets_storage
+    secrets = sheets_storage.load_secrets(args.secrets)
+    secrets.setdefault("gcp_service_account", {})  # 再生時は認証しない
+    try:
+        results, population = bench(args.cassette, secrets, args.scale, args.repeat, args.save)
+    except CassetteMiss as e:
+        raise SystemExit(f"cassette does not cover this data path: {e}")
+    for name, times in results.items():
+        if times:
+            print(f"{name}: median {statistics.median(times) * 1000:.1f} ms, min {min(times) * 1000:.1f} ms "
+                  f"over {len(times)} run(s) (scale {args.scale:g})")
+    print(f"population: {population.total} responses")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
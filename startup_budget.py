@@ -0,0 +1,128 @@
+"""起動時インポート時間のレポートと予算チェック
+
+新しいPythonプロセスで app.py を streamlit.testing の AppTest で実行し、
+スクリプト実行中にインポートされたモジュールとその時間（-X importtime）を集計する。
+
+    python startup_budget.py                  # フォーム画面（初回描画）を計測
+    python startup_budget.py --budget-ms 500  # 予算を変更
+    python startup_budget.py --scenario results
+
+フォーム画面で重量級モジュールが読み込まれた場合、または予算を超過した場合は
+終了コード 1 を返す（CIでの回帰チェック用）。
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BUDGET_MS = 300
+MARKER = "##APP_SCRIPT_RUN##"
+
+# フォーム画面の初回描画で読み込まれてはならないモジュール
+HEAVY_MODULES = ["matplotlib", "pandas", "numpy", "gspread", "google.oauth2", "google.auth"]
+
+# 計測用の子プロセスで実行するコード
+_RUNNER = r'''
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+
+scenario = sys.argv[1]
+at = AppTest.from_file(sys.argv[2], default_timeout=300)
+at.secrets["app"] = {"app_url": "", "spreadsheet_url": "", "worksheet_name": ""}
+if scenario == "results":
+    for k, v in (("ei", "12"), ("eq", "14"), ("ra", "10"), ("rp", "16")):
+        at.query_params[k] = v
+
+before = set(sys.modules)
+sys.stderr.write("%s\n" % MARKER)
+sys.stderr.flush()
+start = time.perf_counter()
+at.run()
+elapsed = time.perf_counter() - start
+
+import lazy_imports
+print(json.dumps({
+    "run_seconds": elapsed,
+    "new_modules": sorted(set(sys.modules) - before),
+    "lazy_imports": lazy_imports.import_report(),
+    "exception": [str(e.message) for e in at.exception],
+}))
+'''.replace("MARKER", repr(MARKER))
+
+
+def parse_importtime(stderr_text):
+    """マーカー以降の -X importtime 出力から、トップレベルのインポートごとの累積時間（μs）を返す"""
+    lines = stderr_text.splitlines()
+    if MARKER in lines:
+        lines = lines[lines.index(MARKER) + 1:]
+    results = []
+    for line in lines:
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        # 入れ子のインポートは名前の前に追加の字下げが付く
+        if name.startswith(" ") and not name.startswith("  "):
+            results.append((name.strip(), int(parts[1])))
+    return results
+
+
+def measure(scenario):
+    """指定シナリオを子プロセスで実行し、計測結果を返す"""
+    env = dict(os.environ, PYTHONPATH=APP_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _RUNNER, scenario, os.path.join(APP_DIR, "app.py")],
+        capture_output=True, text=True, cwd=APP_DIR, env=env,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["imports"] = parse_importtime(proc.stderr)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=["form", "results"], default="form")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="スクリプト実行中のインポート時間の上限（ミリ秒）")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args(argv)
+
+    result = measure(args.scenario)
+    imports = sorted(result["imports"], key=lambda kv: kv[1], reverse=True)
+    total_ms = sum(us for _, us in imports) / 1000
+
+    print(f"[{args.scenario}] script run: {result['run_seconds'] * 1000:.0f} ms, imports: {total_ms:.0f} ms")
+    print(f"{'module':<40} {'cumulative ms':>14}")
+    for name, us in imports[:args.top]:
+        print(f"{name:<40} {us / 1000:>14.1f}")
+    if result["lazy_imports"]:
+        print("\nlazy imports loaded during run:")
+        for name, seconds in result["lazy_imports"]:
+            print(f"  {name:<38} {seconds * 1000:>14.1f}")
+    for message in result["exception"]:
+        print(f"\nscript exception: {message}")
+
+    # スクリプトが例外で止まった場合は、計測が途中までなので予算内でも失敗とする
+    failures = ["script raised an exception (see above)"] if result["exception"] else []
+    if args.scenario == "form":
+        heavy = [m for m in result["new_modules"] if any(m == h or m.startswith(h + ".") for h in HEAVY_MODULES)]
+        if heavy:
+            failures.append(f"heavy modules imported on form render: "
+                            f"{', '.join(sorted({m.split('.')[0] for m in heavy}))}")
+        if total_ms > args.budget_ms:
+            failures.append(f"import time {total_ms:.0f} ms exceeds budget {args.budget_ms:.0f} ms")
+    for failure in failures:
+        print(f"\nFAIL: {failure}")
+    if args.scenario == "form" and not failures:
+        print(f"\nOK: within budget ({total_ms:.0f} / {args.budget_ms:.0f} ms)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
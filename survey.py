@@ -0,0 +1,48 @@
+"""診断の定義（職位・指標・スコア範囲）
+
+app.py と集計・補助ツールで共有する。
+"""
+
+# --- 職位選択肢 ---
+GRADES = [
+    "回答しない",
+    "アナリスト",
+    "コンサルタント",
+    "シニアコンサルタント",
+    "マネージャー",
+    "アーキテクト",
+    "シニアマネージャー",
+    "シニアアーキテクト",
+    "パートナー"
+]
+NO_GRADE = GRADES[0]
+# 集計用の職位区分数（末尾は「その他」）
+N_GRADES = len(GRADES) + 1
+
+# --- 指標（シート上の列名） ---
+METRICS = ["s_exp_int", "s_exp_qty", "s_rec_acc", "s_rec_pos"]
+
+# 各指標は5問×1〜5点の合計（5〜25点、21通り）
+ITEMS_PER_METRIC = 5
+SCORE_MIN = ITEMS_PER_METRIC * 1
+SCORE_MAX = ITEMS_PER_METRIC * 5
+SCORE_BINS = SCORE_MAX - SCORE_MIN + 1
+
+# 設問セットの版（設問の文言・順序を変えたら更新する。回答と一緒に保存）
+QSET_VERSION = "1"
+
+# --- マトリクス（x軸の指標, y軸の指標） ---
+MATRICES = {
+    "future": ("s_exp_qty", "s_exp_int"),
+    "past": ("s_rec_pos", "s_rec_acc"),
+}
+
+
+def grade_index(grade):
+    """職位ラベルを集計用の添字に変換（空欄は「回答しない」、未知の値は末尾の「その他」）"""
+    if not grade:
+        return 0
+    try:
+        return GRADES.index(grade)
+    except ValueError:
+        return len(GRADES)
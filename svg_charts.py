@@ -0,0 +1,292 @@
+"""結果チャートの軽量SVGレンダラ（matplotlib非依存）
+
+app.py の plot_matrix / generate_result_image_with_summary と同じ配置・ラベルを
+テンプレート化したSVG文字列として出力する。
+指標ごとの分布ストリップ（render_strip_svg）は全体集計の21ビンのヒストグラムから描く。
+"""
+from collections import Counter
+from datetime import datetime
+from html import escape
+import functools
+import math
+
+# --- 共通定数（matplotlib既定値に合わせる） ---
+DPI = 100
+PT = DPI / 72.0
+SUBPLOT_LEFT, SUBPLOT_RIGHT = 0.125, 0.9
+SUBPLOT_BOTTOM, SUBPLOT_TOP = 0.11, 0.88
+AXIS_MAX = 25
+FONT_FAMILY = "'Noto Sans JP', 'Helvetica Neue', Arial, sans-serif"
+MONO_FAMILY = "'DejaVu Sans Mono', Menlo, Consolas, monospace"
+
+
+def _fmt(v):
+    return f"{v:.2f}".rstrip('0').rstrip('.')
+
+
+def _text(x, y, s, size_pt, color, anchor="middle", baseline="central", weight=None, rotate=None, family=None):
+    attrs = [
+        f'x="{_fmt(x)}"', f'y="{_fmt(y)}"',
+        f'font-size="{_fmt(size_pt * PT)}"', f'fill="{color}"',
+        f'text-anchor="{anchor}"', f'dominant-baseline="{baseline}"',
+    ]
+    if weight:
+        attrs.append(f'font-weight="{weight}"')
+    if family:
+        attrs.append(f'font-family="{family}"')
+    if rotate is not None:
+        attrs.append(f'transform="rotate({rotate} {_fmt(x)} {_fmt(y)})"')
+    return f'<text {" ".join(attrs)}>{escape(str(s))}</text>'
+
+
+def _svg(width, height, body):
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {_fmt(width)} {_fmt(height)}" '
+        f'width="100%" font-family="{FONT_FAMILY}">'
+        f'<rect width="100%" height="100%" fill="white"/>{body}</svg>'
+    )
+
+
+def _matrix_body(left, top, width, height, x_score, y_score, x_label, y_label, title,
+                 x_min, x_max, y_min, y_max, all_x=None, all_y=None, all_counts=None):
+    """Axes領域（px）にマトリクスを描画するSVG要素列を返す"""
+    def px(v):
+        return left + v / AXIS_MAX * width
+
+    def py(v):
+        return top + height - v / AXIS_MAX * height
+
+    parts = []
+    # 右上象限の塗り（zorder 1）
+    parts.append(
+        f'<rect x="{_fmt(px(12.5))}" y="{_fmt(py(25))}" width="{_fmt(px(25) - px(12.5))}" '
+        f'height="{_fmt(py(12.5) - py(25))}" fill="#F0F2F6" fill-opacity="0.5"/>'
+    )
+    # 中央の破線（zorder 2）
+    dash = f'stroke="#BDC3C7" stroke-opacity="0.7" stroke-width="{_fmt(1.5 * PT)}" stroke-dasharray="{_fmt(5.55 * PT)} {_fmt(2.4 * PT)}"'
+    parts.append(f'<line x1="{_fmt(px(12.5))}" y1="{_fmt(top)}" x2="{_fmt(px(12.5))}" y2="{_fmt(top + height)}" {dash}/>')
+    parts.append(f'<line x1="{_fmt(left)}" y1="{_fmt(py(12.5))}" x2="{_fmt(left + width)}" y2="{_fmt(py(12.5))}" {dash}/>')
+
+    # 全体分布（同一座標は重ね描きと等価な不透明度に集約）
+    has_others = all_x is not None and all_y is not None and len(all_x) > 0
+    if has_others:
+        r_other = math.sqrt(50) / 2 * PT
+        points = Counter(zip(all_x, all_y)).items() if all_counts is None else zip(zip(all_x, all_y), all_counts)
+        for (ox, oy), n in points:
+            opacity = 1 - (1 - 0.3) ** n
+            parts.append(
+                f'<circle cx="{_fmt(px(float(ox)))}" cy="{_fmt(py(float(oy)))}" r="{_fmt(r_other)}" '
+                f'fill="#BDC3C7" fill-opacity="{opacity:.3f}"/>'
+            )
+
+    # 本人のスコア（None なら全体分布のみ）
+    has_you = x_score is not None and y_score is not None
+    if has_you:
+        r_you = math.sqrt(250) / 2 * PT
+        parts.append(
+            f'<circle cx="{_fmt(px(x_score))}" cy="{_fmt(py(y_score))}" r="{_fmt(r_you)}" '
+            f'fill="#E74C3C" stroke="white" stroke-width="{_fmt(2 * PT)}"/>'
+        )
+
+    # 象限ラベル
+    parts.append(_text(px(1) + 5 * PT, py(6), y_min, 10, "#95A5A6", rotate=-90))
+    parts.append(_text(px(1) + 5 * PT, py(19), y_max, 10, "#95A5A6", rotate=-90))
+    parts.append(_text(px(6), py(1), x_min, 10, "#95A5A6", baseline="text-after-edge"))
+    parts.append(_text(px(19), py(1), x_max, 10, "#95A5A6", baseline="text-after-edge"))
+
+    # 枠線・目盛り
+    parts.append(
+        f'<rect x="{_fmt(left)}" y="{_fmt(top)}" width="{_fmt(width)}" height="{_fmt(height)}" '
+        f'fill="none" stroke="black" stroke-width="{_fmt(0.8 * PT)}"/>'
+    )
+    tick = 3.5 * PT
+    for v in range(0, AXIS_MAX + 1, 5):
+        parts.append(f'<line x1="{_fmt(px(v))}" y1="{_fmt(top + height)}" x2="{_fmt(px(v))}" y2="{_fmt(top + height + tick)}" stroke="black"/>')
+        parts.append(_text(px(v), top + height + tick + 3.5 * PT, v, 10, "black", baseline="hanging"))
+        parts.append(f'<line x1="{_fmt(left - tick)}" y1="{_fmt(py(v))}" x2="{_fmt(left)}" y2="{_fmt(py(v))}" stroke="black"/>')
+        parts.append(_text(left - tick - 3.5 * PT, py(v), v, 10, "black", anchor="end"))
+
+    # 軸ラベル・タイトル
+    parts.append(_text(left + width / 2, top + height + 32 * PT, x_label, 11, "#34495E", baseline="hanging"))
+    parts.append(_text(left - 34 * PT, top + height / 2, y_label, 11, "#34495E", rotate=-90))
+    parts.append(_text(left + width / 2, top - 15 * PT, title, 14, "#2C3E50", baseline="text-after-edge", weight="bold"))
+
+    # 凡例（本人と全体分布の両方があるときのみ）
+    if has_others and has_you:
+        lw, lh = 72 * PT, 38 * PT
+        lx, ly = left + width - lw - 5 * PT, top + 5 * PT
+        parts.append(
+            f'<rect x="{_fmt(lx)}" y="{_fmt(ly)}" width="{_fmt(lw)}" height="{_fmt(lh)}" rx="{_fmt(2 * PT)}" '
+            f'fill="white" fill-opacity="0.8" stroke="#CCCCCC"/>'
+        )
+        parts.append(f'<circle cx="{_fmt(lx + 12 * PT)}" cy="{_fmt(ly + 11 * PT)}" r="{_fmt(math.sqrt(50) / 2 * PT)}" fill="#BDC3C7" fill-opacity="0.3"/>')
+        parts.append(_text(lx + 24 * PT, ly + 11 * PT, "Others", 9, "black", anchor="start"))
+        parts.append(f'<circle cx="{_fmt(lx + 12 * PT)}" cy="{_fmt(ly + 27 * PT)}" r="{_fmt(4 * PT)}" fill="#E74C3C" stroke="white"/>')
+        parts.append(_text(lx + 24 * PT, ly + 27 * PT, "You", 9, "black", anchor="start"))
+
+    return "".join(parts)
+
+
+# --- 単体マトリクス（plot_matrix相当：6x6インチ） ---
+def render_matrix_svg(x_score, y_score, x_label, y_label, title, x_min, x_max, y_min, y_max, all_x=None, all_y=None,
+                      all_counts=None):
+    """マトリクスチャートをSVG文字列で返す（all_counts を渡すと all_x/all_y は座標ごとの件数付き。x_score が None なら全体分布のみ）"""
+    size = 6 * DPI
+    left = SUBPLOT_LEFT * size
+    top = (1 - SUBPLOT_TOP) * size
+    width = (SUBPLOT_RIGHT - SUBPLOT_LEFT) * size
+    height = (SUBPLOT_TOP - SUBPLOT_BOTTOM) * size
+    body = _matrix_body(left, top, width, height, x_score, y_score, x_label, y_label, title,
+                        x_min, x_max, y_min, y_max, all_x, all_y, all_counts)
+    return _svg(size, size, body)
+
+
+def _gridspec_cells(fig_w, fig_h, height_ratios, ncols, hspace, wspace):
+    """matplotlib GridSpecと同じ規則でセル位置（px）を計算する"""
+    nrows = len(height_ratios)
+    tot_w = (SUBPLOT_RIGHT - SUBPLOT_LEFT) * fig_w
+    tot_h = (SUBPLOT_TOP - SUBPLOT_BOTTOM) * fig_h
+    cell_h = tot_h / (nrows + hspace * (nrows - 1))
+    sep_h = hspace * cell_h
+    heights = [r * cell_h * nrows / sum(height_ratios) for r in height_ratios]
+    cell_w = tot_w / (ncols + wspace * (ncols - 1))
+    sep_w = wspace * cell_w
+
+    rows = []
+    y = (1 - SUBPLOT_TOP) * fig_h
+    for h in heights:
+        rows.append((y, h))
+        y += h + sep_h
+    cols = [(SUBPLOT_LEFT * fig_w + i * (cell_w + sep_w), cell_w) for i in range(ncols)]
+    return rows, cols
+
+
+def _boxed_lines(cx, cy, lines, size_pt, color, face, edge, linespacing, char_w, family=None):
+    """角丸ボックス付きの複数行テキスト（bbox=round,pad=0.5相当）"""
+    line_h = size_pt * PT * linespacing
+    text_w = max((len(s) for s in lines), default=0) * size_pt * PT * char_w
+    text_h = line_h * len(lines)
+    pad = 0.5 * size_pt * PT
+    parts = [
+        f'<rect x="{_fmt(cx - text_w / 2 - pad)}" y="{_fmt(cy - text_h / 2 - pad)}" '
+        f'width="{_fmt(text_w + 2 * pad)}" height="{_fmt(text_h + 2 * pad)}" rx="{_fmt(pad)}" '
+        f'fill="{face}" stroke="{edge}" stroke-width="{_fmt(2 * PT)}"/>'
+    ]
+    y0 = cy - text_h / 2 + line_h / 2
+    for i, line in enumerate(lines):
+        if line:
+            parts.append(_text(cx, y0 + i * line_h, line, size_pt, color, family=family))
+    return "".join(parts)
+
+
+# --- サマリ付き結果カード（generate_result_image_with_summary相当：10x14インチ） ---
+def render_result_card_svg(s_exp_int, s_exp_qty, s_rec_acc, s_rec_pos, summary_future_en, summary_past_en,
+                           strategies, positives):
+    """サマリ・マトリクス・推奨戦略をまとめた結果カードをSVG文字列で返す"""
+    fig_w, fig_h = 10 * DPI, 14 * DPI
+    rows, cols = _gridspec_cells(fig_w, fig_h, [1, 2, 2], 2, hspace=0.3, wspace=0.3)
+    full_left = cols[0][0]
+    full_width = cols[1][0] + cols[1][1] - full_left
+    parts = []
+
+    # サマリセクション（上段全体）
+    top, height = rows[0]
+    cx = full_left + full_width / 2
+    parts.append(_text(cx, top + 0.15 * height, "Time Perception Test Result", 16, "#2C3E50",
+                       baseline="hanging", weight="bold"))
+    summary_lines = [
+        "",
+        f"Future Perspective: {', '.join(summary_future_en)}",
+        f"Past Perspective: {', '.join(summary_past_en)}",
+        "",
+        "Score Details:",
+        f"  Expectation Intensity: {s_exp_int}/25    Expectation Quantity: {s_exp_qty}/25",
+        f"  Recall Accuracy: {s_rec_acc}/25    Recall Positivity: {s_rec_pos}/25",
+        "",
+    ]
+    parts.append(_boxed_lines(cx, top + 0.55 * height, summary_lines, 10, "#34495E",
+                              "#F8F9FA", "#E74C3C", 1.5, 0.6, family=MONO_FAMILY))
+
+    # Future / Past マトリクス（中段）
+    top, height = rows[1]
+    parts.append(_matrix_body(cols[0][0], top, cols[0][1], height, s_exp_qty, s_exp_int,
+                              "Quantity", "Intensity", "Future Matrix", "Low", "High", "Weak", "Strong"))
+    parts.append(_matrix_body(cols[1][0], top, cols[1][1], height, s_rec_pos, s_rec_acc,
+                              "Positivity", "Accuracy", "Past Matrix", "Negative", "Positive", "Low", "High"))
+
+    # 推奨戦略（下段全体）
+    top, height = rows[2]
+    parts.append(_text(cx, top + 0.1 * height, "Recommended Strategies", 14, "#2C3E50",
+                       baseline="hanging", weight="bold"))
+    strategy_lines = list(strategies) if strategies else ["Excellent Balance - No specific intervention needed."]
+    if positives:
+        strategy_lines += [""] + list(positives)
+    parts.append(_boxed_lines(cx, top + 0.5 * height, strategy_lines, 11, "#2C3E50",
+                              "#E8F6E8", "#27AE60", 1.8, 0.55))
+    parts.append(_text(cx, top + 0.95 * height,
+                       f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')} | Dirbato Co., Ltd.",
+                       8, "#95A5A6", baseline="text-after-edge"))
+
+    return _svg(fig_w, fig_h, "".join(parts))
+
+
+# --- 指標ごとの分布ストリップ（21ビンのヒストグラム） ---
+STRIP_WIDTH, STRIP_HEIGHT = 320, 76
+STRIP_LEFT, STRIP_RIGHT, STRIP_TOP, STRIP_BOTTOM = 8, 312, 18, 56
+STRIP_MIN = 5
+
+
+def _strip_x(score):
+    """スコア（ビンの中心）の x 座標"""
+    bin_w = (STRIP_RIGHT - STRIP_LEFT) / (AXIS_MAX - STRIP_MIN + 1)
+    return STRIP_LEFT + (score - STRIP_MIN + 0.5) * bin_w
+
+
+@functools.lru_cache(maxsize=64)
+def _strip_base(counts):
+    """ヒストグラムの棒と目盛り（counts は21ビンの件数のタプル。同じ分布なら描き直さない）"""
+    bin_w = (STRIP_RIGHT - STRIP_LEFT) / len(counts)
+    peak = max(max(counts), 1)
+    height = STRIP_BOTTOM - STRIP_TOP
+    parts = []
+    for i, n in enumerate(counts):
+        if n <= 0:
+            continue
+        h = max(1.0, n / peak * height)
+        parts.append(f'<rect x="{_fmt(STRIP_LEFT + i * bin_w + 0.5)}" y="{_fmt(STRIP_BOTTOM - h)}" '
+                     f'width="{_fmt(bin_w - 1)}" height="{_fmt(h)}" fill="#BDC3C7"/>')
+    parts.append(f'<line x1="{STRIP_LEFT}" y1="{STRIP_BOTTOM}" x2="{STRIP_RIGHT}" y2="{STRIP_BOTTOM}" stroke="#95A5A6"/>')
+    for v in range(STRIP_MIN, AXIS_MAX + 1, 5):
+        parts.append(_text(_strip_x(v), STRIP_BOTTOM + 4, v, 7, "#95A5A6", baseline="hanging"))
+    return "".join(parts)
+
+
+def render_strip_svg(counts, score, percentile=None, interval=None):
+    """指標の全体分布（counts: スコア5〜25の件数）に本人のスコアとパーセンタイルを重ねたSVG
+
+    本人より低いスコアの範囲（パーセンタイルに当たる部分）を塗り、本人のスコアに線を引く。
+    interval（パーセンタイルの信頼区間 (下限, 上限)）があれば右上の表示に添える。
+    """
+    counts = tuple(int(n) for n in counts)
+    bin_w = (STRIP_RIGHT - STRIP_LEFT) / len(counts)
+    x = _strip_x(score)
+    below = x - bin_w / 2
+    parts = []
+    if below > STRIP_LEFT:
+        parts.append(f'<rect x="{STRIP_LEFT}" y="{STRIP_TOP}" width="{_fmt(below - STRIP_LEFT)}" '
+                     f'height="{STRIP_BOTTOM - STRIP_TOP}" fill="#6464FF" fill-opacity="0.12"/>')
+    parts.append(_strip_base(counts))
+    parts.append(f'<line x1="{_fmt(x)}" y1="{STRIP_TOP - 4}" x2="{_fmt(x)}" y2="{STRIP_BOTTOM}" '
+                 f'stroke="#E74C3C" stroke-width="2"/>')
+    if percentile is not None:
+        label = f"P{percentile:.0f}"
+        if interval is not None:
+            label += f" ({interval[0]:.0f}–{interval[1]:.0f})"
+        # 本人の線と重ならないよう、反対側の端に置く
+        if x > (STRIP_LEFT + STRIP_RIGHT) / 2:
+            parts.append(_text(STRIP_LEFT, 3, label, 8, "#2C3E50", anchor="start", baseline="hanging"))
+        else:
+            parts.append(_text(STRIP_RIGHT, 3, label, 8, "#2C3E50", anchor="end", baseline="hanging"))
+    parts.append(_text(x, 3, "You", 8, "#E74C3C", baseline="hanging"))
+    return _svg(STRIP_WIDTH, STRIP_HEIGHT, "".join(parts))
+
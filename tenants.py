@@ -0,0 +1,187 @@
+"""テナント（事業部ごとの比較母集団）の振り分けと、テナントごとの Sheets クライアント・呼び出し枠
+
+secrets.toml の [tenants.<id>] に事業部ごとの保存先を書くと、?tenant=<id>（または URL パスの先頭 /<id>）で
+そのテナントの保存先・全体比較に振り分ける。指定が無ければ [app] の設定（テナント "default"）を使う。
+
+    [tenants.sales]
+    spreadsheet_url = "https://docs.google.com/spreadsheets/d/..."
+    worksheet_name = "responses"
+    service_account = "gcp_service_account_sales"   # 認証情報のセクション名（既定: gcp_service_account）
+    aggregate_file = "/var/tmp/tpt_sales.bin"        # 任意
+    quota_weight = 2                                  # Sheets 呼び出し枠の配分の重み（既定 1）
+
+保存先・集計ファイル・スナップショット・冪等キーのファイル・管理者トークンなど（TENANT_KEYS）は
+テナント自身の値だけを使い、[app] からは継承しない（他のテナントと集計やファイルが混ざらないように）。
+それ以外の設定（チャートの形式・待ち時間など）は [app] に従う。
+
+Sheets の呼び出し枠（sheets_quota_per_minute、既定 300回/分。プロセスごと）は quota_weight の比で
+各テナントに配分し、テナントごとのトークンバケットで制限する。枠を使い切ったテナントの呼び出しだけが
+待たされ（max_wait 秒を超えるなら QuotaExceeded）、他のテナントの保存・取得は影響を受けない。
+HTTP セッション（接続プールとアクセストークン）は同じ認証情報のテナント間で共有し、gspread クライアントと
+呼び出し枠はテナントごとに持つ。
+
+Streamlit 外のツール（aggregate_store.py / sharding.py）は --tenant <id> で、そのテナントの設定を
+[app] / [gcp_service_account] に置き換えた secrets（tenant_secrets）を使う。
+"""
+import re
+import threading
+import time
+
+import sheets_storage
+from warm_start import app_setting
+
+DEFAULT_TENANT = "default"
+DEFAULT_CREDENTIALS = "gcp_service_account"
+DEFAULT_QUOTA_PER_MINUTE = 300.0
+DEFAULT_MAX_WAIT = 30.0
+
+# テナントごとの値だけを使う設定（[app] から継承しない）
+TENANT_KEYS = (
+    "spreadsheet_url", "worksheet_name", "app_url", "service_account",
+    "aggregate_file", "snapshot_file", "dedup_file", "admin_token",
+    "shard_mode", "shard_rows", "quota_weight", "quota_per_minute",
+)
+
+TENANT_ID_RE = re.compile(r"[a-z0-9][a-z0-9_-]{0,31}")
+
+
+class QuotaExceeded(RuntimeError):
+    """テナントの Sheets 呼び出し枠を max_wait 秒以内に確保できなかった"""
+
+
+class TokenBucket:
+    """1分あたり per_minute 回（最大 burst 回まで連続）の呼び出し枠"""
+
+    def __init__(self, per_minute, burst=None, max_wait=DEFAULT_MAX_WAIT):
+        self.per_minute = float(per_minute)
+        self.rate = self.per_minute / 60.0
+        self.capacity = float(burst) if burst else max(1.0, self.per_minute / 6)  # 既定は10秒分
+        self.max_wait = max_wait
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """1回分の枠を確保する（足りなければ補充されるまで待つ）"""
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                raise QuotaExceeded(f"Sheets quota of {self.per_minute:g}/min is exhausted")
+            time.sleep(wait)
+
+
+def limit_requests(gc, bucket):
+    """gspread クライアントの HTTP 呼び出しごとに bucket の枠を確保する"""
+    http_client = gc.http_client
+    request = http_client.request
+
+    def limited(*args, **kwargs):
+        bucket.acquire()
+        return request(*args, **kwargs)
+    http_client.request = limited
+    return gc
+
+
+class Tenant:
+    """1つのテナントの設定と呼び出し枠"""
+
+    def __init__(self, tenant_id, secrets, settings=None, quota_per_minute=DEFAULT_QUOTA_PER_MINUTE):
+        self.id = tenant_id
+        self._secrets = secrets
+        self._settings = dict(settings or {})  # [tenants.<id>]（default は空）
+        self.quota = TokenBucket(float(self.setting("quota_per_minute") or quota_per_minute))
+
+    @property
+    def is_default(self):
+        return self.id == DEFAULT_TENANT
+
+    def setting(self, key, default=None):
+        """テナントの設定（default テナントは [app] と環境変数 APP_<KEY>）"""
+        if self.is_default:
+            return app_setting(self._secrets, key, default)
+        if key in self._settings:
+            return self._settings[key]
+        if key in TENANT_KEYS:
+            return default
+        return app_setting(self._secrets, key, default)
+
+    @property
+    def spreadsheet_url(self):
+        return self.setting("spreadsheet_url")
+
+    @property
+    def worksheet_name(self):
+        return self.setting("worksheet_name")
+
+    @property
+    def credentials_key(self):
+        return self.setting("service_account", DEFAULT_CREDENTIALS)
+
+    def credentials(self):
+        return self._secrets[self.credentials_key]
+
+    def secrets(self):
+        """このテナントの設定を [app] / [gcp_service_account] に置いた secrets（Streamlit 外のツール用）"""
+        if self.is_default:
+            return self._secrets
+        app = {k: v for k, v in dict(self._secrets.get("app", {})).items() if k not in TENANT_KEYS}
+        app.update(self._settings)
+        return {**self._secrets, "app": app, DEFAULT_CREDENTIALS: self.credentials()}
+
+
+class TenantRegistry:
+    """設定済みのテナントと、認証情報ごとに共有する HTTP セッション"""
+
+    def __init__(self, secrets):
+        configured = {str(k).lower(): dict(v) for k, v in dict(secrets.get("tenants", {})).items()}
+        for tenant_id in configured:
+            if tenant_id == DEFAULT_TENANT or not TENANT_ID_RE.fullmatch(tenant_id):
+                raise ValueError(f"invalid tenant id: {tenant_id!r}")
+        weights = {DEFAULT_TENANT: float(app_setting(secrets, "quota_weight", 1))}
+        weights.update({tenant_id: float(s.get("quota_weight", 1)) for tenant_id, s in configured.items()})
+        total = float(app_setting(secrets, "sheets_quota_per_minute", DEFAULT_QUOTA_PER_MINUTE))
+        share = {tenant_id: total * w / sum(weights.values()) for tenant_id, w in weights.items()}
+        self.tenants = {DEFAULT_TENANT: Tenant(DEFAULT_TENANT, secrets, quota_per_minute=share[DEFAULT_TENANT])}
+        for tenant_id, settings in configured.items():
+            self.tenants[tenant_id] = Tenant(tenant_id, secrets, settings, share[tenant_id])
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, tenant_id):
+        return self.tenants.get(str(tenant_id or DEFAULT_TENANT).lower())
+
+    def resolve(self, tenant_param=None, url_path=""):
+        """?tenant=<id> またはパスの先頭のテナント（未設定の id が明示されたら None）"""
+        if tenant_param:
+            return self.get(tenant_param)
+        segment = str(url_path or "").strip("/").split("/", 1)[0].lower()
+        return self.tenants.get(segment) or self.tenants[DEFAULT_TENANT]
+
+    def authorize(self, tenant, client=None):
+        """テナントの gspread クライアント（同じ認証情報のテナントと HTTP セッションを共有し、呼び出し枠で制限）"""
+        key = tenant.credentials_key
+        with self._lock:
+            session = self._sessions.get(key)
+        if client is None:
+            client = sheets_storage.authorize(tenant.credentials(), session=session)
+        with self._lock:
+            self._sessions.setdefault(key, getattr(client.http_client, "session", None))
+        return limit_requests(client, tenant.quota)
+
+
+def tenant_secrets(secrets, tenant_id):
+    """--tenant 指定の CLI 用: テナントの設定に置き換えた secrets（未設定の id なら SystemExit）"""
+    if not tenant_id:
+        return secrets
+    tenant = TenantRegistry(secrets).get(tenant_id)
+    if tenant is None:
+        raise SystemExit(f"tenant {tenant_id!r} is not configured in secrets [tenants]")
+    return tenant.secrets()
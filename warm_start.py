@@ -0,0 +1,273 @@
+"""起動時のウォームアップとレディネス
+
+新しいインスタンスの最初の利用者が、フォントの読み込み・Sheets の認証・全回答の初回集計・
+matplotlib の初回描画を待たされないように、トラフィックを受ける前にそれらを済ませてから
+Streamlit を起動する。
+
+    python warm_start.py app.py -- --server.port 8501    # ウォームアップ後に streamlit run app.py
+    python warm_start.py --check /var/tmp/tpt_ready.json  # レディネスプローブ（準備完了なら 0）
+
+全体集計はローカルのスナップショット（snapshot_file。aggregate_store と同じ形式）から読み込み、
+Sheets からは裏で取得し直す。スナップショットが無い場合のみ初回集計の完了を待つ。
+アプリは Sheets から集計し直すたびに、snapshot_interval 秒ごとにスナップショットを書き出す。
+ウォームアップが済み、Streamlit のヘルスチェック（/_stcore/health）が応答した時点で、ready_file に
+各段階の所要時間を JSON で書く（起動時に前回のファイルは削除する）。
+
+状態はプロセス内で1つ（STATE）。Streamlit の再実行でもモジュールは sys.modules で共有される。
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+import warnings
+
+FONT_FILENAME = "NotoSansJP-Regular.ttf"
+FONT_URL = "https://raw.githubusercontent.com/google/fonts/main/ofl/notosansjp/NotoSansJP-Regular.ttf"
+
+DEFAULT_SNAPSHOT_INTERVAL = 300.0
+
+
+def ensure_font_file():
+    """日本語フォントを用意してパスを返す（取得できなければ None）"""
+    if not os.path.exists(FONT_FILENAME):
+        try:
+            urllib.request.urlretrieve(FONT_URL, FONT_FILENAME)
+        except Exception:
+            pass
+    return FONT_FILENAME if os.path.exists(FONT_FILENAME) else None
+
+
+def app_setting(secrets, key, default=None):
+    """app.py の get_app_setting と同じ優先順位（環境変数 APP_<KEY> > secrets["app"][key] > 既定値）"""
+    env_value = os.environ.get(f"APP_{key.upper()}")
+    if env_value:
+        return env_value
+    try:
+        return secrets["app"][key]
+    except Exception:
+        return default
+
+
+class WarmState:
+    """ウォームアップ済みの資源（Sheets クライアント・直近の全体集計）と準備状況"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = False
+        self.ready = threading.Event()
+        self.steps = {}  # 段階名 -> 所要秒数、または "error: ..."
+        self.client = None
+        self.population = None
+        self.saved_at = 0.0
+        self._snapshot_tried = False
+
+    def run_step(self, name, fn):
+        """1段階を実行して所要時間を記録する（失敗しても準備は続ける）"""
+        started = time.perf_counter()
+        try:
+            result = fn()
+            self.steps[name] = round(time.perf_counter() - started, 3)
+            return result
+        except Exception as e:
+            self.steps[name] = f"error: {e}"
+            return None
+
+    def load_snapshot(self, path):
+        """スナップショットを読み込む（プロセス内で1回だけ。既に集計があれば何もしない）"""
+        with self.lock:
+            if self.population is not None or self._snapshot_tried or not path:
+                return self.population
+            self._snapshot_tried = True
+        from aggregate_store import load_snapshot
+        population = load_snapshot(path)
+        with self.lock:
+            if self.population is None:
+                self.population = population
+            return self.population
+
+    def update_population(self, population, snapshot_path=None, interval=DEFAULT_SNAPSHOT_INTERVAL):
+        """直近の全体集計を差し替え、前回の書き出しから interval 秒以上経っていればスナップショットを書く"""
+        now = time.time()
+        if not population.updated_at:
+            population.updated_at = now
+        with self.lock:
+            self.population = population
+            due = bool(snapshot_path) and now - self.saved_at >= interval
+            if due:
+                self.saved_at = now
+        if due:
+            from aggregate_store import save_snapshot
+            from results_pipeline import run_in_background
+            run_in_background(save_snapshot, snapshot_path, population)
+        return due
+
+
+STATE = WarmState()
+
+
+def write_ready_file(path, steps):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"ready": True, "pid": os.getpid(), "at": time.time(), "steps": steps}, f)
+    os.replace(tmp_path, path)
+
+
+def check_ready(path):
+    """ready_file が存在し、書いたプロセスが生きていれば True"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            status = json.load(f)
+        os.kill(int(status["pid"]), 0)
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+    return bool(status.get("ready"))
+
+
+def prerender_charts():
+    """matplotlib の初回描画（フォント読み込み・グリフキャッシュ・PNG 出力）を済ませる"""
+    import matplotlib.pyplot as plt
+    from matplotlib import font_manager
+
+    font_path = ensure_font_file()
+    if font_path:
+        font_manager.fontManager.addfont(font_path)
+        plt.rcParams["font.family"] = "Noto Sans JP"
+
+    # 画面のマトリクスと同じ要素（散布図・補助線・凡例・タイトル）を1回描く
+    fig, ax = plt.subplots(figsize=(6, 6))
+    ax.set_xlim(0, 25)
+    ax.set_ylim(0, 25)
+    ax.axvline(x=12.5, color="#BDC3C7", linestyle="--", alpha=0.7)
+    ax.scatter([10, 15], [12, 20], color="#BDC3C7", s=50, alpha=0.3, label="Others")
+    ax.scatter(15, 15, color="#E74C3C", s=250, edgecolors="white", linewidth=2, label="You")
+    ax.set_title("Future Matrix", fontsize=14, fontweight="bold")
+    ax.legend(loc="upper right", fontsize=9)
+    fig.canvas.draw()
+    plt.close(fig)
+
+    # ダウンロード用の結果画像
+    from result_report import generate_result_image_with_summary
+    from scoring import summary_en
+    scores = (15, 15, 15, 15)
+    generate_result_image_with_summary(*scores, *summary_en(*scores))
+
+
+def warm_up(secrets, snapshot_path=None, snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL,
+            render=True, population=True, log=sys.stderr):
+    """ウォームアップを実行する（完了すると STATE.ready がセットされる）
+
+    スナップショットがあれば全体集計の取得は裏で行い、無ければ取得の完了を待つ。
+    """
+    STATE.started = True
+
+    def step(name, fn):
+        result = STATE.run_step(name, fn)
+        if log is not None:
+            print(f"warm-up {name}: {STATE.steps[name]}", file=log, flush=True)
+        return result
+
+    if population:
+        step("snapshot", lambda: STATE.load_snapshot(snapshot_path))
+
+    def authorize():
+        import sheets_storage
+        gc = sheets_storage.client_from_secrets(secrets)
+        sheets_storage.open_response_worksheet_from_secrets(gc, secrets)  # アクセストークンの取得
+        STATE.client = gc
+    step("auth", authorize)
+
+    if render:
+        step("render", prerender_charts)
+
+    if population:
+        def fetch():
+            from aggregate_store import fetch_aggregates
+            STATE.update_population(fetch_aggregates(secrets), snapshot_path, snapshot_interval)
+        if STATE.population is None:
+            step("population", fetch)
+        else:
+            from results_pipeline import run_in_background
+            run_in_background(STATE.run_step, "population", fetch)
+
+    STATE.ready.set()
+    return STATE
+
+
+def _server_port(streamlit_args):
+    """streamlit run に渡すポート（--server.port / STREAMLIT_SERVER_PORT、既定 8501）"""
+    for i, arg in enumerate(streamlit_args):
+        if arg.startswith("--server.port="):
+            return int(arg.split("=", 1)[1])
+        if arg == "--server.port" and i + 1 < len(streamlit_args):
+            return int(streamlit_args[i + 1])
+    return int(os.environ.get("STREAMLIT_SERVER_PORT") or 8501)
+
+
+def announce_when_serving(port, ready_file, timeout=120.0):
+    """Streamlit のヘルスチェックが応答したら ready_file を書く（別スレッドで実行）"""
+    def wait():
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=2) as response:
+                    if response.status == 200:
+                        write_ready_file(ready_file, STATE.steps)
+                        return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        print(f"streamlit did not become healthy on port {port}", file=sys.stderr, flush=True)
+    threading.Thread(target=wait, name="ready-announcer", daemon=True).start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("script", nargs="?", default="app.py", help="起動する Streamlit アプリ")
+    parser.add_argument("streamlit_args", nargs=argparse.REMAINDER, help="-- 以降は streamlit run にそのまま渡す")
+    parser.add_argument("--secrets", default=None, help="secrets.toml のパス（既定: .streamlit/secrets.toml）")
+    parser.add_argument("--check", metavar="READY_FILE", default=None, help="準備完了かを終了コードで返す")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        return 0 if check_ready(args.check) else 1
+
+    import sheets_storage
+    try:
+        secrets = sheets_storage.load_secrets(args.secrets)
+    except FileNotFoundError:
+        secrets = {}
+    ready_file = app_setting(secrets, "ready_file")
+    if ready_file and os.path.exists(ready_file):
+        os.remove(ready_file)
+
+    import matplotlib
+    matplotlib.use("Agg")
+    # 結果画像のレイアウトでは常に出る警告（bulk_reports.py と同じ）
+    warnings.filterwarnings("ignore", message="This figure includes Axes that are not compatible with tight_layout")
+    started = time.perf_counter()
+    warm_up(
+        secrets,
+        snapshot_path=app_setting(secrets, "snapshot_file"),
+        snapshot_interval=float(app_setting(secrets, "snapshot_interval", DEFAULT_SNAPSHOT_INTERVAL)),
+        render=not (str(app_setting(secrets, "chart_backend", "matplotlib")).lower() == "svg"
+                    and str(app_setting(secrets, "download_format", "svg")).lower() == "svg"),
+        # 共有集計ファイルを使う構成ではアプリが Sheets から集計しない
+        population=not app_setting(secrets, "aggregate_file"),
+    )
+    print(f"warm-up finished in {time.perf_counter() - started:.2f}s", file=sys.stderr, flush=True)
+
+    from streamlit.web import cli as stcli
+    extra = args.streamlit_args[1:] if args.streamlit_args[:1] == ["--"] else args.streamlit_args
+    if ready_file:
+        announce_when_serving(_server_port(extra), ready_file)
+    sys.argv = ["streamlit", "run", args.script, *extra]
+    return stcli.main()
+
+
+if __name__ == "__main__":
+    # app.py から import される warm_start と同じモジュール（STATE）を使う
+    import warm_start
+    sys.exit(warm_start.main())